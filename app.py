@@ -12,7 +12,7 @@ from functools import wraps
 from typing import Optional, Tuple
 from difflib import get_close_matches
 import os
-from flask import Flask, render_template, request, redirect, url_for, session, flash, jsonify, send_from_directory, make_response
+from flask import Flask, render_template, request, redirect, url_for, session, flash, jsonify, send_from_directory, make_response, Response
 from toast_utils import ToastManager, toast_success, toast_error, toast_warning, toast_info
 from token_store import save_token
 from flask_sqlalchemy import SQLAlchemy
@@ -46,6 +46,12 @@ from mentor import mentor_bp, init_mentor_db
 from subscription_admin import subscription_admin_bp
 from subscription_models import init_subscription_plans, get_user_active_subscription, create_user_subscription
 from broker_bp import broker_bp
+from instrument_index import get_instrument_index, reload_instrument_index
+from quote_cache import QuoteCache
+from upstream_http import upstream, pooled
+from broker_clients import broker_clients, token_fingerprint
+from price_stream import (PriceHub, PriceHubFull, sse_event, PRICE_STREAM_INTERVAL, PRICE_STREAM_CLOSED_INTERVAL,
+                          PRICE_STREAM_MAX_SYMBOLS, PRICE_STREAM_MAX_SECONDS, PRICE_STREAM_HEARTBEAT)
 
 
 
@@ -269,26 +275,21 @@ migrate = Migrate(app, db)
 # ------------------------------------------------------------------------------
 # Dhan API configuration
 # ------------------------------------------------------------------------------
-from token_store import get_token, save_token
+from token_store import get_token, save_token, get_dhan_headers as _token_headers
 DHAN_CLIENT_ID = os.environ.get("DHAN_CLIENT_ID")
 DHAN_BASE_URL = "https://api.dhan.co"
 
 # Environment sanity check - removed verbose output
 
 def get_dhan_headers():
-    """Get headers for Dhan API requests"""
-    access_token = get_token()  # Always get fresh token
-    if not access_token:
+    """Get headers for Dhan API requests (cached per token; follows token rotation)"""
+    headers = _token_headers(DHAN_CLIENT_ID)
+    if not headers:
         raise RuntimeError("Token missing/expired. Update via /update-token.")
-    return {
-        "Accept": "application/json",
-        "Content-Type": "application/json",
-        "access-token": access_token,  # raw JWT, no 'Bearer'
-        "client-id": DHAN_CLIENT_ID,
-    }
+    return headers
 
 def make_dhan_client():
-    """Create Dhan client instance"""
+    """Dhan client for the app's own token (cached until the token changes)"""
     if not dhanhq:
         raise RuntimeError("dhanhq SDK not available")
     
@@ -296,15 +297,19 @@ def make_dhan_client():
     if not access_token or not DHAN_CLIENT_ID:
         raise RuntimeError("Dhan credentials not configured")
     
-    # Try different initialization patterns
-    try:
-        return dhanhq(DHAN_CLIENT_ID, access_token)
-    except Exception as e1:
+    def build():
+        # Try different initialization patterns
         try:
-            return dhanhq(client_id=DHAN_CLIENT_ID, access_token=access_token)
-        except Exception as e2:
-            print(f"[API] Both initialization methods failed: {e1}, {e2}")
-            raise RuntimeError(f"Failed to create Dhan client: {e1}")
+            return pooled(dhanhq(DHAN_CLIENT_ID, access_token), "dhan")
+        except Exception as e1:
+            try:
+                return pooled(dhanhq(client_id=DHAN_CLIENT_ID, access_token=access_token), "dhan")
+            except Exception as e2:
+                print(f"[API] Both initialization methods failed: {e1}, {e2}")
+                raise RuntimeError(f"Failed to create Dhan client: {e1}")
+
+    # One client per token; a rotated token builds a new one
+    return broker_clients.get("dhan", f"app:{DHAN_CLIENT_ID}", token_fingerprint(DHAN_CLIENT_ID, access_token), build)
 
 # Timezone setup with error handling
 try:
@@ -607,59 +612,11 @@ class TradeSplit(db.Model):
 
 
 def fetch_all_symbols():
-    """Fetch all available symbols from PostgreSQL instruments table"""
+    """Fetch all available symbols from the in-process instrument index"""
     try:
-        from sqlalchemy import text
-        
-        # Check if instruments table exists in PostgreSQL
-        result = db.session.execute(
-            text("""
-                SELECT EXISTS (
-                    SELECT FROM information_schema.tables 
-                    WHERE table_name = 'instruments'
-                )
-            """)
-        ).fetchone()
-        
-        if not result[0]:
-            print(f"[SYMBOLS] Instruments table not found in PostgreSQL")
-            return {}
-        
-        rows = db.session.execute(
-            text("""
-                SELECT symbol_name, display_name, security_id
-                FROM instruments
-                WHERE exch_id = 'NSE' AND segment = 'E'
-            """)
-        ).fetchall()
-
-        symbol_map = {}
-        for sym, disp, sec_id in rows:
-            if sec_id and sym:  # Only process if we have both symbol and security ID
-                clean_sym = sym.strip().upper()
-                symbol_map[clean_sym] = (sym, disp, str(sec_id))
-                
-                # Add display name mapping if different
-                if disp and disp.strip().upper() != clean_sym:
-                    clean_disp = disp.strip().upper()
-                    symbol_map[clean_disp] = (sym, disp, str(sec_id))
-                
-                # Add common variations
-                variations = []
-                if ' LTD' in clean_sym:
-                    variations.append(clean_sym.replace(' LTD', ''))
-                if ' LIMITED' in clean_sym:
-                    variations.append(clean_sym.replace(' LIMITED', ''))
-                if ' ' in clean_sym:
-                    variations.append(clean_sym.replace(' ', ''))
-                
-                for variation in variations:
-                    if variation and variation not in symbol_map:
-                        symbol_map[variation] = (sym, disp, str(sec_id))
-        
-        print(f"[SYMBOLS] Loaded {len(symbol_map)} symbol mappings from PostgreSQL")
+        symbol_map = get_instrument_index().symbol_map(db)
+        print(f"[SYMBOLS] Loaded {len(symbol_map)} symbol mappings from instrument index")
         return symbol_map
-    
     except Exception as e:
         print(f"[SYMBOLS] Error fetching symbols: {e}")
         return {}
@@ -706,68 +663,12 @@ def search_equity_symbols():
         return jsonify([])
 
     try:
-        from sqlalchemy import text
-        
-        # Check if instruments table exists
-        result = db.session.execute(
-            text("""
-                SELECT EXISTS (
-                    SELECT FROM information_schema.tables 
-                    WHERE table_name = 'instruments'
-                )
-            """)
-        ).fetchone()
-        
-        if not result[0]:
+        index = get_instrument_index()
+        if not index.snapshot(db).instruments:
             return jsonify({"error": "Symbol database not found"}), 500
-        
-        q_upper = search_query.upper()
-        search_pattern = f"%{q_upper}%"
-        
-        # Get symbol matches with scoring
-        rows = db.session.execute(
-            text("""
-            SELECT
-                symbol_name,
-                display_name,
-                CASE
-                    WHEN UPPER(symbol_name) = :q_upper THEN 300
-                    WHEN UPPER(symbol_name) LIKE :q_prefix THEN 200
-                    WHEN UPPER(display_name) LIKE :q_prefix THEN 100
-                    WHEN UPPER(symbol_name) LIKE :search_pattern THEN 80
-                    WHEN UPPER(display_name) LIKE :search_pattern THEN 50
-                    ELSE 0
-                END AS score
-            FROM instruments
-            WHERE segment = 'E' AND exch_id = 'NSE'
-              AND (
-                UPPER(symbol_name) LIKE :search_pattern
-                OR UPPER(display_name) LIKE :search_pattern
-              )
-            ORDER BY score DESC, LENGTH(symbol_name) ASC, symbol_name ASC
-            LIMIT 10
-            """),
-            {
-                'q_upper': q_upper,
-                'q_prefix': f"{q_upper}%",
-                'search_pattern': search_pattern
-            }
-        ).fetchall()
 
-        # Filter results to show only NSE equity stocks (no ETFs, derivatives, etc.)
-        result = []
-        for r in rows:
-            if r[0]:  # symbol_name
-                symbol = str(r[0]).strip().upper()
-                display_name = str(r[1]).strip()
-                
-                # Filter out non-equity instruments
-                if is_equity_stock_symbol(symbol):
-                    result.append({
-                        "symbol": symbol,
-                        "name": display_name
-                    })
-        
+        # Ranked in memory; only NSE equity stocks (no ETFs, derivatives, etc.) are indexed
+        result = index.autocomplete(db, search_query, limit=10, include=is_equity_stock_symbol)
         return jsonify(result)
 
     except Exception as e:
@@ -778,92 +679,18 @@ def search_equity_symbols():
 def resolve_input(symbol_input):
     """Resolve to NSE cash-equity symbol and security_id robustly."""
     try:
-        from sqlalchemy import text
-        
-        # Check if instruments table exists
-        result = db.session.execute(
-            text("""
-                SELECT EXISTS (
-                    SELECT FROM information_schema.tables 
-                    WHERE table_name = 'instruments'
-                )
-            """)
-        ).fetchone()
-        
-        if not result[0]:
-            print(f"[RESOLVE] Instruments table not found in PostgreSQL")
-            return None
-        
         key = (symbol_input or "").strip().upper()
-        print(f"[RESOLVE] Looking for: '{key}'")
-
-        # Handle common variations for STATE BANK OF INDIA
-        variations = []
-        
-        # Original input
-        variations.append(key)
-        
-        # Common abbreviations
-        if "STATE BANK OF INDIA" in key:
-            variations.extend(["SBIN", "SBI", "STATEBANK", "STATE BANK"])
-        elif "SBIN" in key:
-            variations.extend(["STATE BANK OF INDIA", "SBI"])
-        
-        # Remove spaces
-        variations.append(key.replace(" ", ""))
-        
-        # Remove common suffixes
-        if " LTD" in key:
-            variations.append(key.replace(" LTD", ""))
-        if " LIMITED" in key:
-            variations.append(key.replace(" LIMITED", ""))
-        if " BANK" in key and "LTD" not in key:
-            variations.append(key.replace(" BANK", " BANK LTD"))
-
-        # Try all variations
-        row = None
-        for variation in variations:
-            result = db.session.execute(
-                text("""
-                    SELECT symbol_name, display_name, security_id, exch_id, segment
-                    FROM instruments
-                    WHERE exch_id='NSE' AND segment='E' AND UPPER(symbol_name)=:variation
-                    LIMIT 1
-                """),
-                {'variation': variation}
-            ).fetchone()
-            if result:
-                row = result
-                break
-
-        # If still not found, try display name match
-        if not row:
-            like_key = f"{key.split()[0]}%"  # prefix match helps (STATE%)
-            result = db.session.execute(
-                text("""
-                    SELECT symbol_name, display_name, security_id, exch_id, segment
-                    FROM instruments
-                    WHERE exch_id='NSE' AND segment='E'
-                      AND (UPPER(display_name) LIKE :like_key OR UPPER(display_name)=:key)
-                    ORDER BY LENGTH(display_name) ASC
-                    LIMIT 1
-                """),
-                {'like_key': like_key, 'key': key}
-            ).fetchone()
-            if result:
-                row = result
-        
-        if not row:
+        inst = get_instrument_index().resolve(db, key)
+        if not inst:
             print(f"[RESOLVE] No match found for: {key}")
             return None
 
-        sym, disp, sec_id, exch, segment = row
         result = {
-            "security_id": int(sec_id),
+            "security_id": int(inst.security_id),
             "segment": "NSE_EQ",  # map segment='E' to Dhan segment key
-            "symbol": sym,
-            "display_name": disp,
-            "exchange": exch
+            "symbol": inst.symbol,
+            "display_name": inst.display_name,
+            "exchange": inst.exch_id
         }
         print(f"[RESOLVE] {key} -> {result}")
         return result
@@ -871,6 +698,64 @@ def resolve_input(symbol_input):
         print(f"[RESOLVE] Error: {e}")
         return None
 
+# Dhan accepts up to 1000 instruments per marketfeed request
+DHAN_LTP_BATCH_SIZE = int(os.getenv("DHAN_LTP_BATCH_SIZE", "1000"))
+
+def _extract_ltp(data, security_id, single=True):
+    """
+    Pull last_price for one security id out of any marketfeed/ltp schema we have seen.
+    `single` allows the bare top-level last_price form, which only makes sense
+    when exactly one id was requested.
+    """
+    sid = str(security_id)
+
+    # If response is a list, look for our security_id
+    if isinstance(data, list):
+        for item in data:
+            if isinstance(item, dict) and str(item.get('securityId')) == sid:
+                ltp = item.get('last_price')
+                if ltp is not None:
+                    return ltp
+        return None
+
+    if not isinstance(data, dict):
+        return None
+
+    # Check nested data structure on success status
+    if data.get('status') == 'success':
+        nested = data.get("data", {})
+        nse_eq_data = nested.get("NSE_EQ", {}) if isinstance(nested, dict) else {}
+        security_data = nse_eq_data.get(sid) if nse_eq_data else None
+        if security_data:
+            ltp = security_data.get("last_price")
+            if ltp is not None:
+                return ltp
+
+    # Alternative structure: direct data field
+    nse_eq_data = data.get("NSE_EQ", {})
+    if nse_eq_data:
+        security_data = nse_eq_data.get(sid)
+        if security_data:
+            ltp = security_data.get("last_price")
+            if ltp is not None:
+                return ltp
+
+    # Try direct access to common fields
+    if single:
+        ltp = data.get('last_price')
+        if ltp is not None:
+            return ltp
+
+    # Check if there's a list in the response
+    data_list = data.get('data', [])
+    if isinstance(data_list, list):
+        for item in data_list:
+            if isinstance(item, dict) and str(item.get('securityId')) == sid:
+                ltp = item.get('last_price')
+                if ltp is not None:
+                    return ltp
+    return None
+
 def get_ltp_nse_eq(security_id):
     """Fetch LTP for NSE equity using correct Dhan API endpoint with robust error handling"""
     url = f"{DHAN_BASE_URL}/v2/marketfeed/ltp"
@@ -878,7 +763,7 @@ def get_ltp_nse_eq(security_id):
         body = {"NSE_EQ": [int(security_id)]}
         print(f"[API] Request body: {body}")
         
-        r = requests.post(url, headers=get_dhan_headers(), json=body, timeout=10)
+        r = upstream.post(url, endpoint="dhan.ltp", retries=1, headers=get_dhan_headers(), json=body)
         print(f"[API] Response status: {r.status_code}")
         print(f"[API] Response text: {r.text}")
         
@@ -889,48 +774,9 @@ def get_ltp_nse_eq(security_id):
         print(f"[API] Full LTP response: {json.dumps(data, indent=2)}")
         
         # Handle different response formats
-        if isinstance(data, list):
-            # If response is a list, look for our security_id
-            for item in data:
-                if str(item.get('securityId')) == str(security_id):
-                    ltp = item.get('last_price')
-                    if ltp is not None:
-                        return {"last_price": ltp, "raw": data}
-        
-        elif isinstance(data, dict):
-            # Check for success status
-            if data.get('status') == 'success':
-                # Check nested data structure
-                nse_eq_data = data.get("data", {}).get("NSE_EQ", {})
-                if nse_eq_data:
-                    security_data = nse_eq_data.get(str(security_id))
-                    if security_data:
-                        ltp = security_data.get("last_price")
-                        if ltp is not None:
-                            return {"last_price": ltp, "raw": data}
-            
-            # Alternative structure: direct data field
-            nse_eq_data = data.get("NSE_EQ", {})
-            if nse_eq_data:
-                security_data = nse_eq_data.get(str(security_id))
-                if security_data:
-                    ltp = security_data.get("last_price")
-                    if ltp is not None:
-                        return {"last_price": ltp, "raw": data}
-            
-            # Try direct access to common fields
-            ltp = data.get('last_price')
-            if ltp is not None:
-                return {"last_price": ltp, "raw": data}
-                
-            # Check if there's a list in the response
-            data_list = data.get('data', [])
-            if isinstance(data_list, list):
-                for item in data_list:
-                    if str(item.get('securityId')) == str(security_id):
-                        ltp = item.get('last_price')
-                        if ltp is not None:
-                            return {"last_price": ltp, "raw": data}
+        ltp = _extract_ltp(data, security_id)
+        if ltp is not None:
+            return {"last_price": ltp, "raw": data}
         
         print(f"[API ERROR] Unexpected JSON schema for security ID {security_id}")
         print(f"[API ERROR] Full response: {json.dumps(data, indent=2)}")
@@ -942,29 +788,104 @@ def get_ltp_nse_eq(security_id):
         print(f"[API ERROR] Response text: {r.text if 'r' in locals() else 'No response'}")
         return {"error": error_msg, "resp": r.text if 'r' in locals() else None}
 
+def get_ltp_many(security_ids):
+    """
+    Fetch LTPs for many NSE equity security ids with as few Dhan calls as possible.
+    Ids still fresh in the quote cache are not requested again.
+    Returns {security_id(str): {"last_price": x} | {"error": msg}}.
+    """
+    url = f"{DHAN_BASE_URL}/v2/marketfeed/ltp"
+    ids = list(dict.fromkeys(str(sid) for sid in security_ids))
+
+    results = {}
+    misses = []
+    for sid in ids:
+        cached = quote_cache.peek(_quote_key(sid))
+        if cached is not None and 'last_price' in cached:
+            results[sid] = {"last_price": cached['last_price']}
+        else:
+            misses.append(sid)
+
+    for i in range(0, len(misses), DHAN_LTP_BATCH_SIZE):
+        chunk = misses[i:i + DHAN_LTP_BATCH_SIZE]
+        try:
+            body = {"NSE_EQ": [int(sid) for sid in chunk]}
+            r = upstream.post(url, endpoint="dhan.ltp", retries=1, headers=get_dhan_headers(), json=body)
+            if r.status_code != 200:
+                print(f"[API ERROR] Batch LTP HTTP {r.status_code}: {r.text}")
+                for sid in chunk:
+                    results[sid] = {"error": f"LTP HTTP {r.status_code}"}
+                continue
+
+            data = r.json()
+            for sid in chunk:
+                ltp = _extract_ltp(data, sid, single=len(chunk) == 1)
+                if ltp is not None:
+                    results[sid] = {"last_price": ltp}
+                    quote_cache.set(_quote_key(sid), results[sid])
+                else:
+                    results[sid] = {"error": f"No LTP in response for security ID {sid}"}
+        except Exception as e:
+            print(f"[API ERROR] Batch LTP exception: {e}")
+            for sid in chunk:
+                results[sid] = {"error": f"Exception: {e}"}
+    return results
+
 def is_market_open():
     """Check if market is currently open"""
     now = datetime.now(IST)
     
-    # Check if weekend
-    if now.weekday() >= 5:
-        return False
-    
-    # Check if holiday (you should define MARKET_HOLIDAYS)
-    MARKET_HOLIDAYS = set()  # Define your holidays here
-    if now.strftime("%Y-%m-%d") in MARKET_HOLIDAYS:
+    # Weekends and NSE holidays (same calendar as _seconds_until_next_open)
+    if not _is_trading_day(now.date()):
         return False
     
     # Market hours (9:15 AM to 3:30 PM IST)
-    market_open = now.replace(hour=9, minute=15, second=0, microsecond=0)
-    market_close = now.replace(hour=15, minute=30, second=0, microsecond=0)
+    market_open = now.replace(hour=_NSE_OPEN[0], minute=_NSE_OPEN[1], second=0, microsecond=0)
+    market_close = now.replace(hour=_NSE_CLOSE[0], minute=_NSE_CLOSE[1], second=0, microsecond=0)
     
     return market_open <= now <= market_close
 
+# Quote cache: 1s while the market is open, otherwise until the next open
+QUOTE_CACHE_TTL_OPEN = float(os.getenv("QUOTE_CACHE_TTL_OPEN", "1"))
+QUOTE_CACHE_TTL_CLOSED_MAX = float(os.getenv("QUOTE_CACHE_TTL_CLOSED_MAX", "0"))  # 0 = no cap
+
+def _seconds_until_next_open(now=None):
+    """Seconds from now until the next NSE session opens"""
+    now = now or datetime.now(IST)
+    o_h, o_m = _NSE_OPEN
+    day = now.date()
+    while True:
+        if _is_trading_day(day):
+            open_dt = IST.localize(datetime.combine(day, datetime.min.time()).replace(hour=o_h, minute=o_m))
+            if open_dt > now:
+                return (open_dt - now).total_seconds()
+        day += timedelta(days=1)
+
+def _quote_ttl():
+    if is_market_open():
+        return QUOTE_CACHE_TTL_OPEN
+    ttl = _seconds_until_next_open()
+    if QUOTE_CACHE_TTL_CLOSED_MAX > 0:
+        ttl = min(ttl, QUOTE_CACHE_TTL_CLOSED_MAX)
+    return ttl
+
+quote_cache = QuoteCache(_quote_ttl)
+
+def _quote_key(security_id):
+    return f"NSE_EQ:{int(security_id)}"
+
+def get_ltp_cached(security_id):
+    """get_ltp_nse_eq behind the shared quote cache; concurrent misses share one upstream call"""
+    return quote_cache.get_or_fetch(
+        _quote_key(security_id),
+        lambda: get_ltp_nse_eq(security_id),
+        cacheable=lambda data: 'error' not in data,
+    )
+
 def get_market_depth(sec_id):
     """Get market depth for a security ID"""
     try:
-        ltp_data = get_ltp_nse_eq(sec_id)
+        ltp_data = get_ltp_cached(sec_id)
         if 'error' in ltp_data:
             return None
         return ltp_data
@@ -988,7 +909,7 @@ def get_live_price(symbol):
         if segment != "NSE_EQ":
             return {"error": f"Only NSE_EQ supported, got {segment}"}
         
-        ltp_data = get_ltp_nse_eq(sec_id)
+        ltp_data = get_ltp_cached(sec_id)
         
         if 'error' not in ltp_data:
             return {
@@ -1070,7 +991,7 @@ def get_price_route(symbol):
         print(f"Request headers: {headers}")
         print(f"Request body: {body}")
         
-        r = requests.post(url, headers=headers, json=body, timeout=10)
+        r = upstream.post(url, endpoint="dhan.ltp", retries=1, headers=headers, json=body)
         
         response_data = {
             "status_code": r.status_code,
@@ -1089,6 +1010,117 @@ def get_price_route(symbol):
         print(f"[DEBUG ERROR] {error_msg}")
         return jsonify({"error": error_msg}), 500
 
+@app.route('/get-prices', methods=['POST'])
+def get_prices_route():
+    """API endpoint to get live prices for many symbols in one upstream round trip"""
+    try:
+        data = request.get_json(silent=True) or {}
+        symbols = data.get('symbols') or request.form.getlist('symbols')
+        if isinstance(symbols, str):
+            symbols = symbols.split(',')
+        symbols = [s.strip() for s in symbols if s and s.strip()]
+        if not symbols:
+            return jsonify({"error": "symbols is required"}), 400
+
+        access_token = get_token()
+        if not access_token or not DHAN_CLIENT_ID:
+            return jsonify({"error": "Dhan API credentials not configured"}), 500
+
+        prices, errors, sec_ids = {}, {}, {}
+        for symbol in symbols:
+            resolved = resolve_input(symbol)
+            if not resolved:
+                errors[symbol] = f"Symbol {symbol} not found"
+                continue
+            sec_ids[symbol] = str(resolved['security_id'])
+
+        ltp_map = get_ltp_many(sec_ids.values()) if sec_ids else {}
+        _fill_price_payload(sec_ids, ltp_map, prices, errors)
+
+        return jsonify({"prices": prices, "errors": errors})
+    except Exception as e:
+        error_msg = f"Route exception: {str(e)}"
+        print(f"[ERROR] {error_msg}")
+        return jsonify({"error": error_msg}), 500
+
+def _fill_price_payload(sec_ids, ltp_map, prices, errors):
+    """Shape {symbol: security_id} + get_ltp_many results like /get-prices"""
+    last_updated = datetime.now().strftime("%H:%M:%S")
+    for symbol, sid in sec_ids.items():
+        if sid not in ltp_map:
+            continue
+        ltp_data = ltp_map[sid]
+        if 'last_price' in ltp_data:
+            prices[symbol] = {
+                "price": ltp_data['last_price'],
+                "security_id": sid,
+                "segment": "NSE_EQ",
+                "last_updated": last_updated
+            }
+        else:
+            errors[symbol] = ltp_data.get('error', 'No price data available')
+
+# One poller per worker serves every open price stream
+price_hub = PriceHub(
+    get_ltp_many,
+    interval_fn=lambda: PRICE_STREAM_INTERVAL if is_market_open() else PRICE_STREAM_CLOSED_INTERVAL,
+)
+
+@app.route('/stream-prices', methods=['GET'])
+def stream_prices_route():
+    """
+    Server-Sent Events stream of live prices for ?symbols=A,B,C.
+    Emits `prices` events shaped like /get-prices, only for symbols whose price
+    changed. Returns 503 when this worker is at its stream limit so the client
+    falls back to polling /get-prices.
+    """
+    symbols = [s.strip() for s in request.args.get('symbols', '').split(',') if s.strip()]
+    symbols = list(dict.fromkeys(symbols))[:PRICE_STREAM_MAX_SYMBOLS]
+    if not symbols:
+        return jsonify({"error": "symbols is required"}), 400
+
+    access_token = get_token()
+    if not access_token or not DHAN_CLIENT_ID:
+        return jsonify({"error": "Dhan API credentials not configured"}), 500
+
+    sec_ids, errors = {}, {}
+    for symbol in symbols:
+        resolved = resolve_input(symbol)
+        if not resolved:
+            errors[symbol] = f"Symbol {symbol} not found"
+            continue
+        sec_ids[symbol] = str(resolved['security_id'])
+
+    try:
+        sub = price_hub.subscribe(sec_ids.values())
+    except PriceHubFull as e:
+        print(f"[PRICE_STREAM] {e}")
+        response = jsonify({"error": "Price stream busy, poll /get-prices instead"})
+        response.headers['Retry-After'] = '30'
+        return response, 503
+
+    def generate():
+        try:
+            yield "retry: 3000\n\n"
+            if errors:
+                yield sse_event("prices", json.dumps({"prices": {}, "errors": errors}))
+            deadline = time.time() + PRICE_STREAM_MAX_SECONDS
+            while time.time() < deadline:
+                ticks = sub.next(PRICE_STREAM_HEARTBEAT)
+                if not ticks:
+                    yield ": keepalive\n\n"
+                    continue
+                prices, tick_errors = {}, {}
+                _fill_price_payload(sec_ids, ticks, prices, tick_errors)
+                yield sse_event("prices", json.dumps({"prices": prices, "errors": tick_errors}))
+        finally:
+            price_hub.unsubscribe(sub)
+
+    response = Response(generate(), mimetype='text/event-stream')
+    response.headers['Cache-Control'] = 'no-cache'
+    response.headers['X-Accel-Buffering'] = 'no'
+    return response
+
 @app.route('/update-token', methods=['POST'])
 def update_token():
     """Update Dhan API access token"""
@@ -1135,7 +1167,7 @@ def get_market_depth_route(symbol):
         if segment != "NSE_EQ":
             return jsonify({"error": f"Only NSE_EQ supported, got {segment}"}), 400
         
-        ltp_data = get_ltp_nse_eq(sec_id)
+        ltp_data = get_ltp_cached(sec_id)
         
         if 'error' in ltp_data:
             return jsonify(ltp_data), 400
@@ -2573,10 +2605,10 @@ def oauth_callback():
         
         # Get user info from Google
         credentials = flow.credentials
-        user_info_response = requests.get(
+        user_info_response = upstream.get(
             'https://www.googleapis.com/oauth2/v2/userinfo',
-            headers={'Authorization': f'Bearer {credentials.token}'},
-            timeout=10
+            endpoint='google.userinfo',
+            headers={'Authorization': f'Bearer {credentials.token}'}
         )
         
         if user_info_response.status_code != 200:
@@ -3314,7 +3346,9 @@ def fetch_pivot_data(symbol, avg_price, trade_type):
         if not resolved:
             return {"error": "Symbol resolution failed."}
             
-        if isinstance(resolved, tuple):
+        if isinstance(resolved, dict):
+            sec_id = resolved['security_id']
+        elif isinstance(resolved, tuple):
             _, _, sec_id = resolved
         elif isinstance(resolved, list) and len(resolved) > 0:
             sec_id = resolved[0]['sec_id']
@@ -3338,24 +3372,28 @@ def fetch_pivot_data(symbol, avg_price, trade_type):
         print(f"Error in fetch_pivot_data: {e}")
         return {"error": str(e)}
     
+def pivot_base_day(now_ist=None) -> _date:
+    """Day whose H/L/C feeds today's pivots: the trading day before the last completed one"""
+    return _previous_trading_day(last_completed_trading_day(now_ist))
+
 def api_pivots_last_internal(sec_id):
     """
     Base day = previous trading day of the last completed trading day.
     Pivots = Fibonacci set.
+    Served from pivot_levels (filled nightly by precompute_pivots.py); a miss
+    is computed once and stored.
     """
-    base = last_completed_trading_day()
-    prev_day = _previous_trading_day(base)
+    prev_day = pivot_base_day()
     try:
-        data_result = fetch_intraday_ohlc(sec_id, prev_day)
-        H = data_result["high"]
-        L = data_result["low"]
-        C = data_result["close"]
-        levels = fibonacci_pivots(H, L, C)
+        row = get_pivot_levels(sec_id, prev_day)
+        if row is None:
+            data_result = get_day_ohlc(sec_id, prev_day)
+            row = store_pivot_levels(sec_id, prev_day, data_result)
         return {
             "ok": True,
             "date": prev_day.strftime("%Y-%m-%d"),
-            "ohlc": {"high": H, "low": L, "close": C},
-            "levels": levels,
+            "ohlc": {"high": row.high, "low": row.low, "close": row.close},
+            "levels": row.fibonacci,
             "securityId": sec_id
         }
     except Exception as e:
@@ -3497,14 +3535,16 @@ def api_single_day():
         resolved = resolve_input(symbol)
         if not resolved:
             return jsonify({"ok": False, "error": "Symbol not found"}), 404
-        if isinstance(resolved, tuple):
+        if isinstance(resolved, dict):
+            sec_id = resolved['security_id']
+        elif isinstance(resolved, tuple):
             _, _, sec_id = resolved
         elif isinstance(resolved, list) and len(resolved) > 0:
             sec_id = resolved[0]['sec_id']
 
     day = last_completed_trading_day()
     try:
-        data_result = fetch_intraday_ohlc(sec_id, day)
+        data_result = get_day_ohlc(sec_id, day)
         data = data_result["data"]
         return jsonify({
             "ok": True,
@@ -3526,7 +3566,9 @@ def api_pivots_fibo():
         resolved = resolve_input(symbol)
         if not resolved:
             return jsonify({"ok": False, "error": "Symbol not found"}), 404
-        if isinstance(resolved, tuple):
+        if isinstance(resolved, dict):
+            sec_id = resolved['security_id']
+        elif isinstance(resolved, tuple):
             _, _, sec_id = resolved
         elif isinstance(resolved, list) and len(resolved) > 0:
             sec_id = resolved[0]['sec_id']
@@ -3547,7 +3589,9 @@ def api_pivots_last():
         resolved = resolve_input(symbol)
         if not resolved:
             return jsonify({"ok": False, "error": "Symbol not found"}), 404
-        if isinstance(resolved, tuple):
+        if isinstance(resolved, dict):
+            sec_id = resolved['security_id']
+        elif isinstance(resolved, tuple):
             _, _, sec_id = resolved
         elif isinstance(resolved, list) and len(resolved) > 0:
             sec_id = resolved[0]['sec_id']
@@ -3567,23 +3611,23 @@ def search_stocks():
     if not symbol_input:
         return jsonify({"error": "Please enter a symbol"})
     
-    result = resolve_input(symbol_input)
-    
-    if isinstance(result, tuple):
-        symbol, display, sec_id = result
+    index = get_instrument_index()
+    inst = index.resolve(db, symbol_input)
+    if inst:
         return jsonify({
             "exact_match": True,
-            "symbol": symbol,
-            "display": display,
-            "sec_id": sec_id
+            "symbol": inst.symbol,
+            "display": inst.display_name,
+            "sec_id": inst.security_id
         })
     
-    if isinstance(result, list) and len(result) > 0:
+    matches = index.prefix_matches(db, symbol_input)
+    if matches:
         return jsonify({
             "exact_match": False,
             "matches": [
-                {"symbol": m["symbol"], "display": m["display"], "sec_id": m["sec_id"]}
-                for m in result
+                {"symbol": m.symbol, "display": m.display_name, "sec_id": m.security_id}
+                for m in matches
             ]
         })
 
@@ -3591,6 +3635,21 @@ def search_stocks():
     return jsonify({"error": "Symbol not found"})
 
 
+@app.route('/reload-instruments', methods=['POST'])
+def reload_instruments():
+    """Rebuild the in-process instrument index after the instruments table changes"""
+    admin_key = request.headers.get('X-ADMIN-KEY')
+    expected_key = os.getenv('ADMIN_KEY', 'stable-oauth-secret-key-2024-persistent-sessions')
+    if admin_key != expected_key:
+        return jsonify({"error": "Unauthorized"}), 401
+
+    snapshot = reload_instrument_index(db)
+    return jsonify({
+        "success": True,
+        "version": snapshot.version,
+        "instruments": len(snapshot.instruments)
+    })
+
 
 
 
@@ -3609,7 +3668,11 @@ def stock_analysis():
     if not resolved:
         return render_template("stock_analysis.html", error="Symbol not found")
     
-    if isinstance(resolved, tuple):
+    if isinstance(resolved, dict):
+        symbol = resolved['symbol']
+        display = resolved['display_name']
+        sec_id = resolved['security_id']
+    elif isinstance(resolved, tuple):
         symbol, display, sec_id = resolved
     elif isinstance(resolved, list) and len(resolved) > 0:
         symbol = resolved[0]['symbol']
@@ -3689,11 +3752,17 @@ def _day_window_ist(day: _date):
     end   = IST.localize(base.replace(hour=c_h, minute=c_m))
     return start, end
 
+# One budget for the intraday call and its daily fallback, inside gunicorn's 30s timeout
+OHLC_FETCH_DEADLINE = float(os.getenv("OHLC_FETCH_DEADLINE", "20"))
+
 def fetch_intraday_ohlc(sec_id: str, day: _date):
     """
     Fetch exactly one day's intraday candles (5m). If empty, fallback to daily OHLC.
     Uses naive 'YYYY-MM-DD HH:MM:SS' timestamps to avoid DH-905 parsing issues.
+    Both calls together finish within OHLC_FETCH_DEADLINE seconds.
     """
+    deadline = time.monotonic() + OHLC_FETCH_DEADLINE
+
     # 1) Compute single-day IST window and clamp to market hours
     start_ist, end_ist = _day_window_ist(day)
 
@@ -3712,12 +3781,7 @@ def fetch_intraday_ohlc(sec_id: str, day: _date):
     end_str  = end_ist.strftime("%Y-%m-%d %H:%M:%S")
 
     url_i = f"{DHAN_BASE_URL}/v2/charts/intraday"
-    access_token = get_token()
-    if not access_token:
-        raise RuntimeError("Token missing/expired. Update via /update-token.")
-    headers = {"Content-Type": "application/json", "access-token": access_token}
-    if DHAN_CLIENT_ID:
-        headers["client-id"] = DHAN_CLIENT_ID
+    headers = get_dhan_headers()
 
     payload = {
         "securityId": str(sec_id),
@@ -3731,7 +3795,8 @@ def fetch_intraday_ohlc(sec_id: str, day: _date):
 
     last_err = None
     try:
-        r = requests.post(url_i, headers=headers, json=payload, timeout=15)
+        r = upstream.post(url_i, endpoint="dhan.charts", retries=1, deadline=deadline,
+                          headers=headers, json=payload)
         if r.status_code != 200:
             # ???? error ?? warning ?? ??? ??? ???? ???? log noisy ? ??
             last_err = f"HTTP {r.status_code}: {r.text}"
@@ -3785,7 +3850,8 @@ def fetch_intraday_ohlc(sec_id: str, day: _date):
             "fromDate": day.strftime("%Y-%m-%d"),
             "toDate":   day.strftime("%Y-%m-%d"),
         }
-        r = requests.post(url_d, headers=headers, json=payload_d, timeout=15)
+        r = upstream.post(url_d, endpoint="dhan.charts", retries=1, deadline=deadline,
+                          headers=headers, json=payload_d)
         if r.status_code != 200:
             raise RuntimeError(f"HTTP {r.status_code}: {r.text}")
         js = r.json()
@@ -3819,6 +3885,152 @@ def fetch_intraday_ohlc(sec_id: str, day: _date):
         raise RuntimeError(f"Fetch failed: {last_err or e}")
 
 
+# ------------------------------------------------------------------------------
+# Completed-day OHLC cache (a finished session's candles never change)
+# ------------------------------------------------------------------------------
+class OhlcDayCache(db.Model):
+    __tablename__ = "ohlc_day_cache"
+    id = db.Column(db.Integer, primary_key=True)
+    security_id = db.Column(db.String(20), nullable=False)
+    trade_date = db.Column(db.Date, nullable=False)
+    high = db.Column(db.Float, nullable=False)
+    low = db.Column(db.Float, nullable=False)
+    close = db.Column(db.Float, nullable=False)
+    candles = db.Column(db.JSON, nullable=True)
+    created_at = db.Column(db.DateTime, nullable=False, default=lambda: datetime.now(timezone.utc))
+    __table_args__ = (db.UniqueConstraint('security_id', 'trade_date', name='uq_ohlc_day_cache_sec_date'),)
+
+    def to_result(self):
+        return {"data": self.candles or [], "high": self.high, "low": self.low, "close": self.close}
+
+# Small per-worker memo in front of the table
+_OHLC_MEMO_MAX = 2048
+_ohlc_memo = {}
+
+def _day_is_complete(day: _date, now_ist=None) -> bool:
+    """True once the session for `day` has closed"""
+    now = now_ist or _dt.now(IST)
+    if day < now.date():
+        return True
+    return day == now.date() and _market_closed_for_today(now)
+
+def is_zero_range(ohlc: dict) -> bool:
+    """H == L == C: usually a data glitch, so neither the bar nor pivots built from it are stored"""
+    return ohlc["high"] == ohlc["low"] == ohlc["close"]
+
+def get_day_ohlc(sec_id, day: _date):
+    """
+    fetch_intraday_ohlc with a durable cache for completed trading days.
+    Each (security_id, day) goes upstream at most once; open days are never cached.
+    """
+    sec_id = str(sec_id)
+    if not _day_is_complete(day):
+        return fetch_intraday_ohlc(sec_id, day)
+
+    key = (sec_id, day)
+    hit = _ohlc_memo.get(key)
+    if hit is not None:
+        return hit
+
+    try:
+        row = OhlcDayCache.query.filter_by(security_id=sec_id, trade_date=day).first()
+    except Exception as e:
+        app.logger.warning(f"[OHLC_CACHE] Lookup failed sec_id={sec_id} on {day}: {e}")
+        db.session.rollback()
+        row = None
+
+    if row is not None and is_zero_range(row.to_result()):
+        # Stored before zero-range bars were rejected; drop it so the refetch can be stored
+        try:
+            db.session.delete(row)
+            db.session.commit()
+        except Exception as e:
+            db.session.rollback()
+            app.logger.debug(f"[OHLC_CACHE] Could not drop zero-range row sec_id={sec_id} on {day}: {e}")
+        row = None
+
+    if row is not None:
+        result = row.to_result()
+    else:
+        result = fetch_intraday_ohlc(sec_id, day)
+        # Zero-range bars are usually a data glitch; let them be refetched
+        if not is_zero_range(result):
+            try:
+                db.session.add(OhlcDayCache(
+                    security_id=sec_id,
+                    trade_date=day,
+                    high=result["high"],
+                    low=result["low"],
+                    close=result["close"],
+                    candles=result["data"],
+                ))
+                db.session.commit()
+            except Exception as e:
+                # Another worker stored the same day first
+                db.session.rollback()
+                app.logger.debug(f"[OHLC_CACHE] Store skipped sec_id={sec_id} on {day}: {e}")
+
+    if not is_zero_range(result):
+        if len(_ohlc_memo) >= _OHLC_MEMO_MAX:
+            _ohlc_memo.pop(next(iter(_ohlc_memo)))
+        _ohlc_memo[key] = result
+    return result
+
+
+# ------------------------------------------------------------------------------
+# Precomputed pivot levels (see precompute_pivots.py)
+# ------------------------------------------------------------------------------
+class PivotLevels(db.Model):
+    __tablename__ = "pivot_levels"
+    id = db.Column(db.Integer, primary_key=True)
+    security_id = db.Column(db.String(20), nullable=False)
+    base_date = db.Column(db.Date, nullable=False)
+    high = db.Column(db.Float, nullable=False)
+    low = db.Column(db.Float, nullable=False)
+    close = db.Column(db.Float, nullable=False)
+    fibonacci = db.Column(db.JSON, nullable=False)
+    classic = db.Column(db.JSON, nullable=False)
+    computed_at = db.Column(db.DateTime, nullable=False, default=lambda: datetime.now(timezone.utc))
+    __table_args__ = (db.UniqueConstraint('security_id', 'base_date', name='uq_pivot_levels_sec_date'),)
+
+def get_pivot_levels(sec_id, day: _date):
+    """Precomputed PivotLevels row for (security_id, base day) or None"""
+    try:
+        return PivotLevels.query.filter_by(security_id=str(sec_id), base_date=day).first()
+    except Exception as e:
+        app.logger.warning(f"[PIVOTS] Lookup failed sec_id={sec_id} on {day}: {e}")
+        db.session.rollback()
+        return None
+
+def build_pivot_levels(sec_id, day: _date, ohlc: dict):
+    """PivotLevels row (not yet added to the session) from an OHLC result"""
+    H, L, C = ohlc["high"], ohlc["low"], ohlc["close"]
+    return PivotLevels(
+        security_id=str(sec_id),
+        base_date=day,
+        high=H,
+        low=L,
+        close=C,
+        fibonacci=fibonacci_pivots(H, L, C),
+        classic=classic_pivots(H, L, C),
+    )
+
+def store_pivot_levels(sec_id, day: _date, ohlc: dict):
+    """Compute and persist pivots for one security/day; returns the row"""
+    row = build_pivot_levels(sec_id, day, ohlc)
+    if is_zero_range(ohlc):
+        # Served but not stored, so the bar is refetched next time (see get_day_ohlc)
+        return row
+    try:
+        db.session.add(row)
+        db.session.commit()
+    except Exception as e:
+        # Stored concurrently (or the table is unavailable); the computed row is still valid
+        db.session.rollback()
+        app.logger.debug(f"[PIVOTS] Store skipped sec_id={sec_id} on {day}: {e}")
+    return row
+
+
 def classic_pivots(H: float, L: float, C: float):
     """Classic floor pivots (rounded to 2 decimals)."""
     PP = (H + L + C) / 3
@@ -5972,6 +6184,12 @@ with app.app_context():
         init_broker_session_model(db)
     except Exception:
         pass
+    try:
+        # Broker sessions shared by all gunicorn workers
+        from broker_session_store import session_store
+        session_store.bind(db)
+    except Exception as e:
+        print(f"[SESSIONS] Shared session store not initialised: {e}")
     cleanup_expired_sessions()
 
 # ------------------------------------------------------------------------------
@@ -0,0 +1,452 @@
+"""
+Vectorised strategy backtester
+Replays OHLC bars from the Dhan charts API against a journal strategy's stop
+loss, take profit, position size and signal parameters. Indicators, signals,
+exit searches and the equity curve are NumPy operations over whole bar arrays;
+Python only loops once per simulated trade, never once per bar.
+"""
+
+import math
+from datetime import datetime, timedelta
+
+import numpy as np
+
+import trade_analytics
+from upstream_http import upstream
+
+# Dhan serves at most 90 days of intraday candles per request
+DHAN_INTRADAY_MAX_DAYS = 90
+INTRADAY_INTERVALS = ('1', '5', '15', '25', '60')
+DAILY_INTERVAL = 'D'
+
+IST_OFFSET_SECONDS = 5 * 3600 + 30 * 60
+TRADING_DAYS_PER_YEAR = 252
+
+# Per-trade log kept in the stored summary (most recent trades)
+BACKTEST_MAX_TRADE_LOG = 500
+
+SIGNALS = ('sma_cross', 'rsi', 'breakout')
+
+
+class BacktestError(Exception):
+    """Bad backtest input (unknown signal, empty range, no bars...)"""
+
+
+class Bars:
+    """OHLCV column arrays in time order; timestamps are epoch seconds"""
+
+    def __init__(self, timestamps, open_, high, low, close, volume):
+        self.timestamps = timestamps
+        self.open = open_
+        self.high = high
+        self.low = low
+        self.close = close
+        self.volume = volume
+
+    def __len__(self):
+        return len(self.close)
+
+    @property
+    def ist_days(self):
+        """IST calendar day number of every bar (sessions never straddle it)"""
+        return (self.timestamps + IST_OFFSET_SECONDS) // 86400
+
+
+# ----------------- data ----------------- #
+def _candle_columns(js):
+    """
+    {field: list} from a Dhan charts response. v2 answers with parallel arrays
+    (open/high/low/close/volume/timestamp); older payloads were a list of rows.
+    """
+    data = js.get("data", js) if isinstance(js, dict) else js
+    if isinstance(data, dict):
+        return data
+    columns = {f: [] for f in ("open", "high", "low", "close", "volume", "timestamp")}
+    for row in data or []:
+        if not isinstance(row, dict):
+            continue
+        for field in columns:
+            columns[field].append(row.get(field, row.get("start_Time") if field == "timestamp" else None))
+    return columns
+
+
+def _to_bars(chunks):
+    """Concatenate parsed chunks, drop incomplete candles and duplicate timestamps"""
+    fields = ("timestamp", "open", "high", "low", "close", "volume")
+    cols = {f: [] for f in fields}
+    for chunk in chunks:
+        n = len(chunk.get("close") or [])
+        for f in fields:
+            values = chunk.get(f) or []
+            cols[f].extend(values if len(values) == n else [None] * n)
+
+    arr = {f: np.array([np.nan if v is None else v for v in cols[f]], dtype=float) for f in fields}
+    ok = np.isfinite(arr["timestamp"])
+    for f in ("open", "high", "low", "close"):
+        ok &= np.isfinite(arr[f])
+    ts = arr["timestamp"][ok].astype(np.int64)
+    order = np.argsort(ts, kind="stable")
+    ts = ts[order]
+    keep = np.r_[True, np.diff(ts) > 0] if len(ts) else np.array([], dtype=bool)
+    pick = lambda f: arr[f][ok][order][keep]
+    return Bars(ts[keep], pick("open"), pick("high"), pick("low"), pick("close"),
+                np.nan_to_num(pick("volume")))
+
+
+def fetch_bars(base_url, headers, security_id, start, end, interval='5',
+               segment='NSE_EQ', instrument='EQUITY', progress=None):
+    """
+    OHLC bars for start..end (dates) from the Dhan charts endpoints that
+    fetch_intraday_ohlc uses, in 90-day requests for intraday intervals.
+    progress(done, total) is called after each request.
+    """
+    interval = str(interval)
+    if interval not in INTRADAY_INTERVALS and interval != DAILY_INTERVAL:
+        raise BacktestError(f"Unsupported interval: {interval}")
+    if end < start:
+        raise BacktestError("end_date is before start_date")
+
+    base = {"securityId": str(security_id), "exchangeSegment": segment, "instrument": instrument, "oi": False}
+    chunks = []
+    if interval == DAILY_INTERVAL:
+        payload = dict(base, expiryCode=0, fromDate=start.strftime("%Y-%m-%d"),
+                       toDate=(end + timedelta(days=1)).strftime("%Y-%m-%d"))
+        chunks.append(_post_charts(f"{base_url}/v2/charts/historical", headers, payload))
+        if progress:
+            progress(1, 1)
+    else:
+        total = (end - start).days // DHAN_INTRADAY_MAX_DAYS + 1
+        chunk_start = start
+        while chunk_start <= end:
+            chunk_end = min(chunk_start + timedelta(days=DHAN_INTRADAY_MAX_DAYS - 1), end)
+            payload = dict(base, interval=interval,
+                           fromDate=f"{chunk_start:%Y-%m-%d} 09:15:00",
+                           toDate=f"{chunk_end:%Y-%m-%d} 15:30:00")
+            chunks.append(_post_charts(f"{base_url}/v2/charts/intraday", headers, payload))
+            if progress:
+                progress(len(chunks), total)
+            chunk_start = chunk_end + timedelta(days=1)
+
+    bars = _to_bars(chunks)
+    if len(bars) == 0:
+        raise BacktestError("No bars returned for the requested range")
+    return bars
+
+
+def _post_charts(url, headers, payload):
+    r = upstream.post(url, endpoint="dhan.charts", retries=1, headers=headers, json=payload)
+    if r.status_code != 200:
+        raise RuntimeError(f"Dhan charts HTTP {r.status_code}: {r.text[:200]}")
+    return _candle_columns(r.json())
+
+
+# ----------------- configuration ----------------- #
+def parameter_map(parameters):
+    """Strategy.parameters is a list of {name, value}; accept a plain dict too"""
+    if isinstance(parameters, dict):
+        return {str(k).strip().lower(): v for k, v in parameters.items()}
+    out = {}
+    for p in parameters or []:
+        if isinstance(p, dict) and p.get("name"):
+            out[str(p["name"]).strip().lower()] = p.get("value")
+    return out
+
+
+def _signal_from_indicator(indicator):
+    name = (indicator or "").lower()
+    if "rsi" in name:
+        return "rsi"
+    if "breakout" in name or "donchian" in name or "channel" in name:
+        return "breakout"
+    return "sma_cross"
+
+
+class BacktestConfig:
+    """Everything a run needs besides bars; percentages are in percent"""
+
+    def __init__(self, signal='sma_cross', fast=20, slow=50, rsi_period=14, rsi_low=30, rsi_high=70,
+                 breakout=20, side='long', stop_loss=None, take_profit=None, position_size=100.0,
+                 initial_capital=10000.0, commission=0.0, square_off=True):
+        if signal not in SIGNALS:
+            raise BacktestError(f"Unknown signal '{signal}' (expected one of {', '.join(SIGNALS)})")
+        if side not in ('long', 'short', 'both'):
+            raise BacktestError("side must be long, short or both")
+        if signal == 'sma_cross' and not (1 <= fast < slow):
+            raise BacktestError("sma_cross needs 1 <= fast < slow")
+        if min(rsi_period, breakout) < 2:
+            raise BacktestError("Indicator periods must be at least 2")
+        if initial_capital <= 0 or not (0 < position_size <= 100):
+            raise BacktestError("initial_capital must be positive and position_size in (0, 100]")
+        self.signal = signal
+        self.fast, self.slow = int(fast), int(slow)
+        self.rsi_period, self.rsi_low, self.rsi_high = int(rsi_period), float(rsi_low), float(rsi_high)
+        self.breakout = int(breakout)
+        self.side = side
+        self.stop_loss = float(stop_loss) if stop_loss else None
+        self.take_profit = float(take_profit) if take_profit else None
+        self.position_size = float(position_size)
+        self.initial_capital = float(initial_capital)
+        self.commission = float(commission)
+        self.square_off = bool(square_off)
+
+    @classmethod
+    def from_strategy(cls, strategy, overrides=None, interval='5'):
+        """
+        Strategy columns, then Strategy.parameters, then request overrides.
+        position_size is the percent of current equity deployed per trade.
+        """
+        overrides = overrides or {}
+        params = parameter_map(strategy.parameters)
+        params.update(parameter_map(overrides.get("parameters")))
+
+        def pick(key, default, cast=float):
+            for source in (overrides, params):
+                value = source.get(key)
+                if value not in (None, ""):
+                    try:
+                        return cast(value)
+                    except (TypeError, ValueError):
+                        raise BacktestError(f"Invalid {key}: {value!r}")
+            return default
+
+        return cls(
+            signal=pick("signal", _signal_from_indicator(strategy.primary_indicator), str).lower(),
+            fast=pick("fast_period", 20, int),
+            slow=pick("slow_period", 50, int),
+            rsi_period=pick("rsi_period", 14, int),
+            rsi_low=pick("rsi_low", 30),
+            rsi_high=pick("rsi_high", 70),
+            breakout=pick("breakout_period", 20, int),
+            side=pick("side", "long", str).lower(),
+            stop_loss=pick("stop_loss", strategy.stop_loss),
+            take_profit=pick("take_profit", strategy.take_profit),
+            position_size=pick("position_size", strategy.position_size or 100.0),
+            initial_capital=pick("initial_capital", 10000.0),
+            commission=pick("commission_per_trade", 0.0),
+            square_off=pick("square_off", str(interval) != DAILY_INTERVAL,
+                            lambda v: str(v).lower() in ("1", "true", "yes", "on")),
+        )
+
+    def to_dict(self):
+        return dict(vars(self))
+
+
+# ----------------- indicators ----------------- #
+def sma(values, period):
+    """Simple moving average; NaN until `period` values are available"""
+    out = np.full(len(values), np.nan)
+    if len(values) >= period:
+        c = np.cumsum(np.r_[0.0, values])
+        out[period - 1:] = (c[period:] - c[:-period]) / period
+    return out
+
+
+def rsi(close, period=14):
+    """RSI from simple averages of gains and losses (Cutler's variant)"""
+    delta = np.diff(close, prepend=close[:1])
+    gains, losses = sma(np.maximum(delta, 0), period), sma(np.maximum(-delta, 0), period)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        out = 100 - 100 / (1 + gains / losses)
+    out[(losses == 0) & (gains > 0)] = 100
+    out[(losses == 0) & (gains == 0)] = 50
+    out[:period] = np.nan
+    return out
+
+
+def _rolling_extreme(values, period, fn):
+    """fn (max/min) over the `period` bars before each bar; NaN until available"""
+    out = np.full(len(values), np.nan)
+    if len(values) > period:
+        out[period:] = fn(np.lib.stride_tricks.sliding_window_view(values, period)[:-1], axis=1)
+    return out
+
+
+def _crosses_above(a, b):
+    prev_a, prev_b = np.r_[np.nan, a[:-1]], np.r_[np.nan, b[:-1]]
+    with np.errstate(invalid='ignore'):
+        return (a > b) & (prev_a <= prev_b)
+
+
+def signals(bars, cfg):
+    """
+    (long_entry, long_exit, short_entry, short_exit) boolean arrays, evaluated
+    on each bar's close; orders fill at the next bar's open
+    """
+    close = bars.close
+    if cfg.signal == 'sma_cross':
+        fast, slow = sma(close, cfg.fast), sma(close, cfg.slow)
+        up, down = _crosses_above(fast, slow), _crosses_above(slow, fast)
+        return up, down, down, up
+    if cfg.signal == 'rsi':
+        r = rsi(close, cfg.rsi_period)
+        low, high = np.full_like(r, cfg.rsi_low), np.full_like(r, cfg.rsi_high)
+        return _crosses_above(r, low), _crosses_above(r, high), _crosses_above(high, r), _crosses_above(low, r)
+    upper = _rolling_extreme(bars.high, cfg.breakout, np.max)
+    lower = _rolling_extreme(bars.low, cfg.breakout, np.min)
+    with np.errstate(invalid='ignore'):
+        return close > upper, close < lower, close < lower, close > upper
+
+
+def _next_true(mask):
+    """For each bar, the index of the next True at or after it (len(mask) if none)"""
+    n = len(mask)
+    idx = np.where(mask, np.arange(n), n)
+    return np.minimum.accumulate(idx[::-1])[::-1]
+
+
+# ----------------- simulation ----------------- #
+def run_backtest(bars, cfg):
+    """Simulate cfg over bars; returns (trades, equity) with equity marked to market per bar"""
+    n = len(bars)
+    o, h, l, c = bars.open, bars.high, bars.low, bars.close
+    long_entry, long_exit, short_entry, short_exit = signals(bars, cfg)
+    if cfg.side == 'long':
+        short_entry = np.zeros(n, dtype=bool)
+    elif cfg.side == 'short':
+        long_entry = np.zeros(n, dtype=bool)
+
+    days = bars.ist_days
+    session_end = np.r_[days[1:] != days[:-1], True] if cfg.square_off else np.zeros(n, dtype=bool)
+    next_session_end = _next_true(session_end)
+    next_long_exit, next_short_exit = _next_true(long_exit), _next_true(short_exit)
+
+    candidates = np.flatnonzero((long_entry | short_entry) & ~session_end)
+    stop_pct = (cfg.stop_loss or 0) / 100
+    target_pct = (cfg.take_profit or 0) / 100
+
+    trades = []
+    equity = cfg.initial_capital
+    earliest_signal = 0
+    while True:
+        k = np.searchsorted(candidates, earliest_signal)
+        if k >= len(candidates) or candidates[k] + 1 >= n:
+            break
+        s = candidates[k]
+        e = s + 1
+        direction = 1 if long_entry[s] else -1
+        entry = o[e]
+        qty = math.floor(equity * cfg.position_size / 100 / entry) if entry > 0 else 0
+        if qty <= 0:
+            earliest_signal = s + 1
+            continue
+
+        exit_signal = (next_long_exit if direction > 0 else next_short_exit)[e]
+        square_off = next_session_end[e]
+        last = min(exit_signal, square_off, n - 1)
+
+        # first bar in e..last whose range reaches the stop or the target
+        window = slice(e, last + 1)
+        if direction > 0:
+            stop = entry * (1 - stop_pct) if stop_pct else None
+            target = entry * (1 + target_pct) if target_pct else None
+            stop_hit = l[window] <= stop if stop else np.zeros(last + 1 - e, dtype=bool)
+            target_hit = h[window] >= target if target else np.zeros(last + 1 - e, dtype=bool)
+        else:
+            stop = entry * (1 + stop_pct) if stop_pct else None
+            target = entry * (1 - target_pct) if target_pct else None
+            stop_hit = h[window] >= stop if stop else np.zeros(last + 1 - e, dtype=bool)
+            target_hit = l[window] <= target if target else np.zeros(last + 1 - e, dtype=bool)
+        hits = np.flatnonzero(stop_hit | target_hit)
+
+        if len(hits):
+            j = e + hits[0]
+            # both in one bar: assume the stop came first. A later bar that
+            # gaps through the level fills at its open instead.
+            if stop_hit[hits[0]]:
+                level, reason, worse = stop, 'stop_loss', (min if direction > 0 else max)
+            else:
+                level, reason, worse = target, 'take_profit', (max if direction > 0 else min)
+            price = worse(o[j], level) if j > e else level
+            next_signal = j
+        elif exit_signal < square_off and exit_signal + 1 < n:
+            j, price, reason = exit_signal + 1, o[exit_signal + 1], 'signal'
+            next_signal = j - 1  # a reversal signal on the exit bar fills at the same open
+        elif square_off < n:
+            j, price, reason = square_off, c[square_off], 'square_off'
+            next_signal = j
+        else:
+            j, price, reason = n - 1, c[n - 1], 'end_of_data'
+            next_signal = n
+
+        pnl = direction * qty * (price - entry) - 2 * cfg.commission
+        equity += pnl
+        trades.append((e, j, direction, qty, entry, price, pnl, reason))
+        earliest_signal = max(next_signal, s + 1)
+
+    return trades, _equity_curve(bars, cfg, trades)
+
+
+def _equity_curve(bars, cfg, trades):
+    """Realised equity plus the open position marked at each bar's close"""
+    n = len(bars)
+    realised = np.zeros(n)
+    unrealised = np.zeros(n)
+    for e, j, direction, qty, entry, _price, pnl, _reason in trades:
+        realised[j] += pnl
+        if j > e:
+            unrealised[e:j] = direction * qty * (bars.close[e:j] - entry) - cfg.commission
+    return cfg.initial_capital + np.cumsum(realised) + unrealised
+
+
+# ----------------- summary ----------------- #
+def summarize(bars, cfg, trades, equity, max_points=trade_analytics.EQUITY_CURVE_MAX_POINTS):
+    """Metrics in the shape the strategy pages already read, plus the equity curve"""
+    pnl = np.array([t[6] for t in trades], dtype=float)
+    wins, losses = pnl[pnl > 0], pnl[pnl < 0]
+
+    # daily equity (last bar of each IST day) for returns, Sharpe and the chart
+    days = bars.ist_days
+    day_last = np.flatnonzero(np.r_[days[1:] != days[:-1], True])
+    daily_equity = equity[day_last]
+    daily_returns = np.diff(np.r_[cfg.initial_capital, daily_equity]) / np.r_[cfg.initial_capital, daily_equity[:-1]]
+    std = daily_returns.std()
+    sharpe = float(daily_returns.mean() / std * math.sqrt(TRADING_DAYS_PER_YEAR)) if std > 0 else 0.0
+
+    peak = np.maximum.accumulate(np.maximum(equity, cfg.initial_capital))
+    max_drawdown = float(((peak - equity) / peak).max() * 100) if len(equity) else 0.0
+
+    idx = trade_analytics.downsample_indices(daily_equity, max_points)
+    day_strings = np.datetime_as_string(
+        (bars.timestamps[day_last] + IST_OFFSET_SECONDS).astype('datetime64[s]'), unit='D')
+    bar_days = lambda i: np.datetime_as_string(
+        np.datetime64(int(bars.timestamps[i]) + IST_OFFSET_SECONDS, 's'), unit='D')
+
+    final_equity = float(equity[-1]) if len(equity) else cfg.initial_capital
+    return {
+        "total_return": round((final_equity / cfg.initial_capital - 1) * 100, 4),
+        "final_equity": round(final_equity, 2),
+        "sharpe_ratio": round(sharpe, 4),
+        "max_drawdown": round(max_drawdown, 4),
+        "win_rate": round(len(wins) / len(pnl) * 100, 2) if len(pnl) else 0.0,
+        "total_trades": int(len(pnl)),
+        "winning_trades": int(len(wins)),
+        "losing_trades": int(len(losses)),
+        "profit_factor": round(float(wins.sum() / abs(losses.sum())), 4) if len(losses) else 0.0,
+        "avg_trade_pnl": round(float(pnl.mean()), 2) if len(pnl) else 0.0,
+        "bars": int(len(bars)),
+        "equity_curve": [
+            {"date": day, "equity": round(eq, 2)}
+            for day, eq in zip(day_strings[idx].tolist(), daily_equity[idx].tolist())
+        ],
+        "trades": [
+            {"entry_date": bar_days(e), "exit_date": bar_days(j), "side": "long" if d > 0 else "short",
+             "quantity": int(q), "entry_price": round(float(ep), 2), "exit_price": round(float(xp), 2),
+             "pnl": round(float(p), 2), "exit_reason": reason}
+            for e, j, d, q, ep, xp, p, reason in trades[-BACKTEST_MAX_TRADE_LOG:]
+        ],
+    }
+
+
+def backtest(bars, cfg):
+    """run_backtest + summarize"""
+    trades, equity = run_backtest(bars, cfg)
+    return summarize(bars, cfg, trades, equity)
+
+
+def parse_date(value, default):
+    if not value:
+        return default
+    try:
+        return datetime.strptime(value, '%Y-%m-%d').date()
+    except ValueError:
+        raise BacktestError(f"Invalid date: {value} (expected YYYY-MM-DD)")
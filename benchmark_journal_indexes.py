@@ -0,0 +1,254 @@
+#!/usr/bin/env python3
+"""
+Before/after query plans for the journal indexes (migration add_journal_query_indexes)
+Seeds a scratch PostgreSQL schema with synthetic trades, mistakes and challenge
+trades, runs EXPLAIN ANALYZE for the query shapes journal.py issues, creates
+the migration's indexes and runs them again. The live tables are never touched.
+
+    python benchmark_journal_indexes.py --database-url postgresql://... --trades 1000000
+"""
+
+import os
+import sys
+import json
+import argparse
+import importlib.util
+
+from sqlalchemy import create_engine, text
+
+# Add the current directory to Python path
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+BENCH_SCHEMA = "journal_index_bench"
+MIGRATION_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)),
+                              "migrations", "versions", "add_journal_query_indexes.py")
+
+SCHEMA_SQL = """
+CREATE TABLE trade (
+    id SERIAL PRIMARY KEY,
+    symbol VARCHAR(20) NOT NULL,
+    entry_price FLOAT NOT NULL,
+    exit_price FLOAT NOT NULL,
+    quantity FLOAT NOT NULL,
+    date TIMESTAMP NOT NULL,
+    result VARCHAR(10) NOT NULL,
+    pnl FLOAT NOT NULL,
+    notes TEXT,
+    trade_type VARCHAR(10),
+    risk FLOAT,
+    reward FLOAT,
+    strategy_id INTEGER,
+    created_at TIMESTAMP
+);
+CREATE TABLE mistakes (
+    id SERIAL PRIMARY KEY,
+    related_trade_id INTEGER,
+    title VARCHAR(200) NOT NULL,
+    category VARCHAR(40) NOT NULL,
+    severity VARCHAR(20) NOT NULL,
+    created_at TIMESTAMP NOT NULL,
+    is_deleted BOOLEAN NOT NULL
+);
+CREATE TABLE challenge_trades (
+    id SERIAL PRIMARY KEY,
+    challenge_id INTEGER NOT NULL,
+    trade_date DATE NOT NULL,
+    pnl FLOAT NOT NULL
+);
+"""
+
+SEED_SQL = """
+INSERT INTO trade (symbol, entry_price, exit_price, quantity, date, result, pnl,
+                   trade_type, risk, reward, strategy_id, created_at)
+SELECT 'SYM' || (random() * 500)::int, 100, 100 + p, 1 + (random() * 50)::int,
+       TIMESTAMP '2016-01-01' + random() * INTERVAL '10 years',
+       CASE WHEN p > 0 THEN 'win' WHEN p < 0 THEN 'loss' ELSE 'breakeven' END, p,
+       CASE WHEN random() < 0.5 THEN 'long' ELSE 'short' END, 10, 20,
+       CASE WHEN random() < 0.2 THEN NULL ELSE 1 + (random() * 19)::int END, now()
+FROM (SELECT round((random() * 200 - 95)::numeric, 2)::float AS p
+      FROM generate_series(1, :trades)) s;
+
+INSERT INTO mistakes (related_trade_id, title, category, severity, created_at, is_deleted)
+SELECT (random() * :trades)::int, 'Mistake ' || g,
+       (ARRAY['execution','analysis','risk','psychology','process','other'])[1 + (random() * 5)::int],
+       (ARRAY['low','medium','high','critical'])[1 + (random() * 3)::int],
+       TIMESTAMP '2016-01-01' + random() * INTERVAL '10 years', random() < 0.1
+FROM generate_series(1, :mistakes) g;
+
+INSERT INTO challenge_trades (challenge_id, trade_date, pnl)
+SELECT 1 + (random() * 999)::int, DATE '2024-01-01' + (random() * 700)::int,
+       round((random() * 200 - 95)::numeric, 2)
+FROM generate_series(1, :challenge_trades);
+"""
+
+# name -> SQL, mirroring the statements journal.py builds
+QUERIES = {
+    "recent_trades": "SELECT * FROM trade ORDER BY date DESC LIMIT 10",
+    "trades_page_keyset": """
+        SELECT t.id, t.date, t.symbol, t.pnl FROM trade t
+        WHERE (t.date, t.id) < (TIMESTAMP '2021-01-01', 500000)
+        ORDER BY t.date DESC, t.id DESC LIMIT 101""",
+    "trades_page_wins": """
+        SELECT t.id, t.date, t.symbol, t.pnl FROM trade t
+        WHERE t.result = 'win' AND (t.date, t.id) < (TIMESTAMP '2021-01-01', 500000)
+        ORDER BY t.date DESC, t.id DESC LIMIT 101""",
+    "trades_page_by_pnl": "SELECT id, date, pnl FROM trade ORDER BY pnl DESC, id DESC LIMIT 101",
+    "report_30_days": """
+        SELECT date, pnl, risk, reward, quantity FROM trade
+        WHERE date >= TIMESTAMP '2024-03-01' AND date <= TIMESTAMP '2024-03-31'
+        ORDER BY date, id""",
+    "report_strategy_30_days": """
+        SELECT date, pnl, risk, reward, quantity FROM trade
+        WHERE date >= TIMESTAMP '2024-03-01' AND date <= TIMESTAMP '2024-03-31' AND strategy_id = 3
+        ORDER BY date, id""",
+    "report_trade_type_30_days": """
+        SELECT date, pnl, risk, reward, quantity FROM trade
+        WHERE date >= TIMESTAMP '2024-03-01' AND date <= TIMESTAMP '2024-03-31' AND trade_type = 'short'
+        ORDER BY date, id""",
+    "report_trade_type_1_year": """
+        SELECT date, pnl, risk, reward, quantity FROM trade
+        WHERE date >= TIMESTAMP '2024-01-01' AND date <= TIMESTAMP '2024-12-31' AND trade_type = 'short'
+        ORDER BY date, id""",
+    "strategy_total_pnl": "SELECT coalesce(sum(pnl), 0) FROM trade WHERE strategy_id = 3",
+    "open_trade_by_symbol": """
+        SELECT * FROM trade WHERE symbol = 'SYM42' AND (exit_price = 0 OR pnl = 0) LIMIT 1""",
+    "mistakes_live": """
+        SELECT * FROM mistakes WHERE is_deleted = false ORDER BY created_at DESC LIMIT 200""",
+    "mistakes_live_category": """
+        SELECT * FROM mistakes WHERE is_deleted = false AND category = 'risk'
+        ORDER BY created_at DESC LIMIT 200""",
+    "mistakes_live_severity": """
+        SELECT * FROM mistakes WHERE is_deleted = false AND severity = 'critical'
+        ORDER BY created_at DESC LIMIT 200""",
+    "mistakes_for_trade": "SELECT * FROM mistakes WHERE related_trade_id = 4242",
+    "challenge_calendar": """
+        SELECT trade_date, sum(pnl) FROM challenge_trades WHERE challenge_id = 7 GROUP BY trade_date""",
+}
+
+
+# Indexes considered but not shipped; measured in a third pass so the decision
+# stays reproducible (see the migration docstring)
+CANDIDATE_INDEXES = [
+    ('ix_bench_trade_trade_type_date_id', 'trade', 'trade_type, date, id', None),
+]
+
+
+def load_migration_indexes():
+    spec = importlib.util.spec_from_file_location("add_journal_query_indexes", MIGRATION_PATH)
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+    return module.INDEXES
+
+
+def plan_nodes(node):
+    yield node
+    for child in node.get("Plans", []):
+        yield from plan_nodes(child)
+
+
+def explain(conn, sql):
+    """(top node, indexes used, execution ms, shared buffers touched)"""
+    row = conn.execute(text("EXPLAIN (ANALYZE, BUFFERS, FORMAT JSON) " + sql)).scalar()
+    result = (json.loads(row) if isinstance(row, str) else row)[0]
+    plan = result["Plan"]
+    indexes = sorted({n["Index Name"] for n in plan_nodes(plan) if "Index Name" in n})
+    buffers = plan.get("Shared Hit Blocks", 0) + plan.get("Shared Read Blocks", 0)
+    return plan["Node Type"], indexes, result["Execution Time"], buffers
+
+
+def text_plan(conn, sql):
+    return "\n".join(r[0] for r in conn.execute(text("EXPLAIN (ANALYZE, BUFFERS) " + sql)))
+
+
+def run_queries(conn, label, plans=None):
+    """Summary line per query; with plans (a list), also append (label, name, text plan)"""
+    print(f"\n== {label} ==")
+    results = {}
+    for name, sql in QUERIES.items():
+        explain(conn, sql)  # warm the cache so both passes compare like with like
+        results[name] = explain(conn, sql)
+        node, indexes, ms, buffers = results[name]
+        print(f"  {name:<26} {ms:>10.2f} ms  {buffers:>8} buffers  {node}"
+              + (f" via {', '.join(indexes)}" if indexes else ""))
+        if plans is not None:
+            plans.append((label, name, text_plan(conn, sql)))
+    return results
+
+
+def write_plans(path, plans):
+    with open(path, "w") as f:
+        for label, name, plan in plans:
+            f.write(f"-- {name} ({label})\n{plan}\n\n")
+    print(f"\nWrote EXPLAIN (ANALYZE, BUFFERS) plans to {path}")
+
+
+def benchmark(database_url, trades, mistakes, challenge_trades, keep=False, plans_path=None):
+    engine = create_engine(database_url)
+    if engine.dialect.name != "postgresql":
+        print("❌ The benchmark needs PostgreSQL (partial indexes, EXPLAIN ANALYZE JSON)")
+        return False
+
+    with engine.connect().execution_options(isolation_level="AUTOCOMMIT") as conn:
+        conn.execute(text(f"DROP SCHEMA IF EXISTS {BENCH_SCHEMA} CASCADE"))
+        conn.execute(text(f"CREATE SCHEMA {BENCH_SCHEMA}"))
+        conn.execute(text(f"SET search_path TO {BENCH_SCHEMA}"))
+        try:
+            conn.execute(text(SCHEMA_SQL))
+            print(f"Seeding {trades} trades, {mistakes} mistakes, {challenge_trades} challenge trades...")
+            for statement in SEED_SQL.split(";\n"):
+                if statement.strip():
+                    conn.execute(text(statement), {"trades": trades, "mistakes": mistakes,
+                                                   "challenge_trades": challenge_trades})
+            conn.execute(text("ANALYZE"))
+
+            plans = [] if plans_path else None
+            before = run_queries(conn, "before (primary keys only)", plans)
+
+            for name, table, columns, where in load_migration_indexes():
+                predicate = f" WHERE {where}" if where else ""
+                conn.execute(text(f"CREATE INDEX {name} ON {table} ({columns}){predicate}"))
+            conn.execute(text("ANALYZE"))
+
+            after = run_queries(conn, "after add_journal_query_indexes", plans)
+
+            for name, table, columns, where in CANDIDATE_INDEXES:
+                predicate = f" WHERE {where}" if where else ""
+                conn.execute(text(f"CREATE INDEX {name} ON {table} ({columns}){predicate}"))
+            conn.execute(text("ANALYZE"))
+            candidates = run_queries(conn, "after + candidate indexes (not shipped)", plans)
+
+            print("\n== speedup ==")
+            for name in QUERIES:
+                b, a, c = before[name][2], after[name][2], candidates[name][2]
+                print(f"  {name:<26} {b:>10.2f} ms -> {a:>8.2f} ms  ({b / a if a else float('inf'):>6.1f}x)"
+                      f"   candidates {c:>8.2f} ms")
+            if plans_path:
+                write_plans(plans_path, plans)
+        finally:
+            if keep:
+                print(f"\nKept schema {BENCH_SCHEMA}")
+            else:
+                conn.execute(text(f"DROP SCHEMA IF EXISTS {BENCH_SCHEMA} CASCADE"))
+    return True
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Before/after plans for the journal query indexes")
+    parser.add_argument("--database-url", default=os.getenv("DATABASE_URL"))
+    parser.add_argument("--trades", type=int, default=1_000_000)
+    parser.add_argument("--mistakes", type=int, default=200_000)
+    parser.add_argument("--challenge-trades", type=int, default=100_000)
+    parser.add_argument("--keep", action="store_true", help="keep the scratch schema for manual EXPLAINs")
+    parser.add_argument("--plans", metavar="FILE", help="also write every query's text EXPLAIN (ANALYZE, BUFFERS) plan")
+    args = parser.parse_args()
+
+    if not args.database_url:
+        print("❌ Set DATABASE_URL or pass --database-url")
+        sys.exit(1)
+    try:
+        success = benchmark(args.database_url, args.trades, args.mistakes, args.challenge_trades, args.keep,
+                            args.plans)
+    except Exception as e:
+        print(f"❌ Benchmark failed: {e}")
+        success = False
+    sys.exit(0 if success else 1)
@@ -0,0 +1,86 @@
+"""
+Per-user cache of live broker SDK clients (KiteConnect, dhanhq)
+Building a client per request costs an SDK object and, before pooled(), a fresh
+HTTP session. Clients are kept in a bounded LRU keyed by (broker, user_id) and
+tagged with a fingerprint of the credentials they were built with, so a rotated
+token rebuilds the client and a disconnect evicts it.
+"""
+
+import os
+import hashlib
+import threading
+from collections import OrderedDict
+
+BROKER_CLIENT_CACHE_SIZE = int(os.getenv("BROKER_CLIENT_CACHE_SIZE", "256"))
+
+
+def token_fingerprint(*secrets):
+    """Short, non-reversible tag for a set of credentials (never store the token itself as a key)"""
+    raw = "\0".join("" if s is None else str(s) for s in secrets)
+    return hashlib.sha256(raw.encode("utf-8")).hexdigest()[:16]
+
+
+class BrokerClientCache:
+    """Thread-safe LRU of broker clients; entries are (fingerprint, client)"""
+
+    def __init__(self, maxsize=BROKER_CLIENT_CACHE_SIZE):
+        self.maxsize = maxsize
+        self._clients = OrderedDict()
+        self._pid = None
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def _reset_after_fork(self):
+        # Clients hold pooled sessions; upstream_http recreates those after fork
+        pid = os.getpid()
+        if self._pid != pid:
+            self._clients = OrderedDict()
+            self._pid = pid
+
+    def get(self, broker, user_id, fingerprint, factory):
+        """
+        Cached client for (broker, user_id) if it was built with the same
+        credentials, else factory() (which may raise; failures are not cached).
+        """
+        key = (broker, str(user_id))
+        with self._lock:
+            self._reset_after_fork()
+            entry = self._clients.get(key)
+            if entry is not None and entry[0] == fingerprint:
+                self._clients.move_to_end(key)
+                self.hits += 1
+                return entry[1]
+
+        # Build outside the lock; two racing builds just keep the later client
+        client = factory()
+        with self._lock:
+            self._reset_after_fork()
+            self.misses += 1
+            self._clients[key] = (fingerprint, client)
+            self._clients.move_to_end(key)
+            while len(self._clients) > self.maxsize:
+                self._clients.popitem(last=False)
+        return client
+
+    def evict(self, broker, user_id=None):
+        """Drop the client for (broker, user_id), or every client of broker"""
+        with self._lock:
+            self._reset_after_fork()
+            if user_id is not None:
+                self._clients.pop((broker, str(user_id)), None)
+            else:
+                for key in [k for k in self._clients if k[0] == broker]:
+                    del self._clients[key]
+
+    def clear(self):
+        with self._lock:
+            self._clients = OrderedDict()
+
+    def stats(self):
+        with self._lock:
+            return {"size": len(self._clients), "maxsize": self.maxsize,
+                    "hits": self.hits, "misses": self.misses}
+
+
+broker_clients = BrokerClientCache()
@@ -0,0 +1,87 @@
+"""
+Concurrent broker API calls
+Orders, trades, positions and holdings are independent upstream round trips;
+fan_out runs them on a bounded per-process thread pool so a request waits for
+the slowest call instead of the sum of all of them. A call that raises or
+misses the deadline is reported on its own; the others still return.
+"""
+
+import os
+import threading
+from concurrent.futures import ThreadPoolExecutor, wait
+
+BROKER_FANOUT_WORKERS = int(os.getenv("BROKER_FANOUT_WORKERS", "16"))
+# Deadline for a whole fan-out, in seconds (the calls run side by side). Keep it
+# at or above the sdk read timeout in upstream_http, which is what actually
+# stops a hung call and frees its thread.
+BROKER_CALL_TIMEOUT = float(os.getenv("BROKER_CALL_TIMEOUT", "10"))
+
+_executor = None
+_executor_pid = None
+_executor_lock = threading.Lock()
+
+
+class BrokerCallTimeout(TimeoutError):
+    """A fanned-out call did not finish before the deadline"""
+
+
+def _pool():
+    """The process's fan-out pool (threads do not survive a fork, so one per pid)"""
+    global _executor, _executor_pid
+    with _executor_lock:
+        if _executor is None or _executor_pid != os.getpid():
+            _executor = ThreadPoolExecutor(max_workers=BROKER_FANOUT_WORKERS, thread_name_prefix="broker-fanout")
+            _executor_pid = os.getpid()
+        return _executor
+
+
+class FanOutResults:
+    """Per-call outcomes of fan_out"""
+
+    def __init__(self):
+        self.values = {}
+        self.exceptions = {}
+
+    def result(self, name):
+        """The call's return value, or re-raise what it raised (BrokerCallTimeout if it ran late)"""
+        if name in self.exceptions:
+            raise self.exceptions[name]
+        return self.values[name]
+
+    def get(self, name, default=None):
+        return self.values.get(name, default)
+
+    @property
+    def errors(self):
+        return {name: str(e) for name, e in self.exceptions.items()}
+
+    @property
+    def ok(self):
+        """At least one call succeeded"""
+        return bool(self.values)
+
+
+def fan_out(calls, timeout=BROKER_CALL_TIMEOUT):
+    """
+    Run {name: zero-argument callable} concurrently and wait at most `timeout`
+    seconds. Calls still running at the deadline are abandoned; their threads
+    are freed when the HTTP timeout pooled() sessions enforce expires
+    (UPSTREAM_TIMEOUTS["sdk"], or the SDK's own), so a hung broker cannot hold
+    the pool indefinitely.
+    """
+    results = FanOutResults()
+    if not calls:
+        return results
+    pool = _pool()
+    futures = {pool.submit(fn): name for name, fn in calls.items()}
+    done, pending = wait(futures, timeout=timeout)
+    for future in done:
+        name = futures[future]
+        try:
+            results.values[name] = future.result()
+        except Exception as e:
+            results.exceptions[name] = e
+    for future in pending:
+        future.cancel()
+        results.exceptions[futures[future]] = BrokerCallTimeout(f"{futures[future]} timed out after {timeout:g}s")
+    return results
@@ -77,6 +77,10 @@ def save_session(user_email, broker, user_id, session_data, remember_session=Fal
     
     db.session.add(session)
     db.session.commit()
+
+    # Make the session live in every worker, not just this one
+    from broker_session_store import session_store
+    session_store.set(broker, user_id, session_data, expires_at=expires_at)
     return session
 
 def get_active_session(user_email, broker, user_id):
@@ -107,4 +111,6 @@ def cleanup_expired():
     for session in expired:
         db.session.delete(session)
     db.session.commit()
-    return len(expired)
+
+    from broker_session_store import session_store
+    return len(expired) + session_store.cleanup_expired()
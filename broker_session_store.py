@@ -0,0 +1,253 @@
+"""
+Broker session store shared by all gunicorn workers
+USER_SESSIONS used to be a module-level dict per worker (and a second one in
+multi_broker_system), so a login handled by one worker was invisible to the
+others. Sessions now live in the shared_broker_sessions table with a version
+per (broker, user_id); each worker keeps a near-cache that it revalidates
+with a one-column primary-key read at most every BROKER_SESSION_NEAR_TTL
+seconds.
+
+JSON-serialisable session fields are shared. SDK objects (SmartConnect, a
+KiteConnect handle) cannot be, so they stay in the worker that created them;
+other workers rebuild them through a per-broker reviver.
+"""
+
+import os
+import json
+import time
+import threading
+from collections.abc import MutableMapping
+from datetime import datetime, timedelta
+
+from sqlalchemy import (MetaData, Table, Column, String, Text, Integer, DateTime,
+                        select, insert, update, delete)
+from sqlalchemy.exc import IntegrityError
+
+BROKERS = ("kite", "dhan", "angel")
+BROKER_SESSION_NEAR_TTL = float(os.getenv("BROKER_SESSION_NEAR_TTL", "2"))
+# Broker tokens are daily; a session row outlives its token by no more than this
+BROKER_SESSION_TTL = int(os.getenv("BROKER_SESSION_TTL", str(24 * 3600)))
+
+metadata = MetaData()
+
+shared_broker_sessions = Table(
+    "shared_broker_sessions", metadata,
+    Column("broker", String(20), primary_key=True),
+    Column("user_id", String(255), primary_key=True),
+    Column("data", Text, nullable=False),
+    Column("version", Integer, nullable=False, default=1),
+    Column("updated_at", DateTime, nullable=False),
+    Column("expires_at", DateTime, nullable=False),
+)
+
+
+def _split(session):
+    """(shared JSON fields, process-local objects)"""
+    shared, local = {}, {}
+    for key, value in (session or {}).items():
+        try:
+            json.dumps(value)
+        except (TypeError, ValueError):
+            local[key] = value
+        else:
+            shared[key] = value
+    return shared, local
+
+
+class BrokerSessionMap(MutableMapping):
+    """USER_SESSIONS[broker]: a dict-like view of one broker's sessions in the store"""
+
+    def __init__(self, store, broker):
+        self.store = store
+        self.broker = broker
+
+    def __getitem__(self, user_id):
+        session = self.store.get(self.broker, user_id)
+        if session is None:
+            raise KeyError(user_id)
+        return session
+
+    def __setitem__(self, user_id, session):
+        self.store.set(self.broker, user_id, session)
+
+    def __delitem__(self, user_id):
+        if not self.store.delete(self.broker, user_id):
+            raise KeyError(user_id)
+
+    def __iter__(self):
+        return iter(self.store.user_ids(self.broker))
+
+    def __len__(self):
+        return len(self.store.user_ids(self.broker))
+
+    def __repr__(self):
+        return f"<BrokerSessionMap {self.broker}: {len(self)} sessions>"
+
+
+class SessionStore:
+    """Table-backed broker sessions with a per-process near-cache"""
+
+    def __init__(self, near_ttl=BROKER_SESSION_NEAR_TTL, ttl=BROKER_SESSION_TTL):
+        self.near_ttl = near_ttl
+        self.ttl = ttl
+        self._db = None
+        self._near = {}      # (broker, user_id) -> [version or None, shared dict, checked_at]
+        self._local = {}     # (broker, user_id) -> SDK objects owned by this process
+        self._revivers = {}  # broker -> fn(user_id, shared dict) -> dict of SDK objects
+        self._pid = None
+        self._lock = threading.Lock()
+        self._warned = False
+        # Drop-in replacements for the old module-level dicts
+        self.sessions = {broker: BrokerSessionMap(self, broker) for broker in BROKERS}
+        self.apps = {broker: {} for broker in BROKERS}
+
+    # ----------------- setup ----------------- #
+    def bind(self, db):
+        """Use db (Flask-SQLAlchemy) for the shared table; call inside an app context"""
+        self._db = db
+        metadata.create_all(db.engine, tables=[shared_broker_sessions], checkfirst=True)
+
+    def register_reviver(self, broker, fn):
+        """fn(user_id, session) rebuilds the SDK objects for a session created in another worker"""
+        self._revivers[broker] = fn
+
+    def _engine(self):
+        if self._db is None:
+            from flask import current_app
+            self._db = current_app.extensions["sqlalchemy"]
+        return self._db.engine
+
+    def _reset_after_fork(self):
+        # SDK objects hold the parent's pooled sessions; rebuild them per worker
+        pid = os.getpid()
+        if self._pid != pid:
+            self._near = {}
+            self._local = {}
+            self._pid = pid
+
+    def _unavailable(self, e):
+        if not self._warned:
+            print(f"[SESSIONS] Shared session store unavailable, using this worker's memory: {e}")
+            self._warned = True
+
+    # ----------------- reads ----------------- #
+    def _with_local(self, key, shared):
+        with self._lock:
+            local = self._local.get(key)
+        if local is None:
+            local = {}
+            reviver = self._revivers.get(key[0])
+            if reviver:
+                try:
+                    local = reviver(key[1], shared) or {}
+                except Exception as e:
+                    print(f"[SESSIONS] Could not rebuild {key[0]} client for {key[1]}: {e}")
+            with self._lock:
+                local = self._local.setdefault(key, local)
+        return dict(shared, **local)
+
+    def get(self, broker, user_id):
+        """The session dict for (broker, user_id), or None"""
+        key = (broker, str(user_id))
+        now = time.monotonic()
+        with self._lock:
+            self._reset_after_fork()
+            entry = self._near.get(key)
+        # Fresh, or written while the table was unreachable
+        if entry is not None and (entry[0] is None or now - entry[2] < self.near_ttl):
+            return self._with_local(key, entry[1])
+
+        t = shared_broker_sessions
+        pk = (t.c.broker == key[0]) & (t.c.user_id == key[1])
+        try:
+            with self._engine().connect() as conn:
+                row = conn.execute(select(t.c.version, t.c.expires_at).where(pk)).first()
+                if row is None or row.expires_at <= datetime.utcnow():
+                    self._forget(key)
+                    return None
+                if entry is not None and row.version == entry[0]:
+                    entry[2] = now
+                    return self._with_local(key, entry[1])
+                version, data = conn.execute(select(t.c.version, t.c.data).where(pk)).first()
+        except Exception as e:
+            self._unavailable(e)
+            return self._with_local(key, entry[1]) if entry is not None else None
+
+        # Changed in another worker: its SDK objects belong to the old token
+        with self._lock:
+            self._near[key] = [version, json.loads(data), now]
+            self._local.pop(key, None)
+        return self._with_local(key, self._near[key][1])
+
+    def user_ids(self, broker):
+        """User ids with a live session for broker"""
+        with self._lock:
+            self._reset_after_fork()
+            ids = {k[1] for k, entry in self._near.items() if k[0] == broker and entry[0] is None}
+        t = shared_broker_sessions
+        try:
+            with self._engine().connect() as conn:
+                ids.update(r[0] for r in conn.execute(
+                    select(t.c.user_id).where(t.c.broker == broker, t.c.expires_at > datetime.utcnow())))
+        except Exception as e:
+            self._unavailable(e)
+            with self._lock:
+                ids.update(k[1] for k in self._near if k[0] == broker)
+        return sorted(ids)
+
+    # ----------------- writes ----------------- #
+    def set(self, broker, user_id, session, expires_at=None):
+        key = (broker, str(user_id))
+        shared, local = _split(session)
+        now = datetime.utcnow()
+        values = {"data": json.dumps(shared), "updated_at": now,
+                  "expires_at": expires_at or now + timedelta(seconds=self.ttl)}
+        t = shared_broker_sessions
+        pk = (t.c.broker == key[0]) & (t.c.user_id == key[1])
+        version = None
+        try:
+            with self._engine().begin() as conn:
+                if not conn.execute(update(t).where(pk).values(version=t.c.version + 1, **values)).rowcount:
+                    try:
+                        with conn.begin_nested():
+                            conn.execute(insert(t).values(broker=key[0], user_id=key[1], version=1, **values))
+                    except IntegrityError:
+                        # Another worker inserted it first
+                        conn.execute(update(t).where(pk).values(version=t.c.version + 1, **values))
+                version = conn.execute(select(t.c.version).where(pk)).scalar()
+        except Exception as e:
+            self._unavailable(e)
+
+        with self._lock:
+            self._reset_after_fork()
+            self._near[key] = [version, shared, time.monotonic()]
+            self._local[key] = local
+
+    def delete(self, broker, user_id):
+        """Remove a session everywhere; True if one existed"""
+        key = (broker, str(user_id))
+        t = shared_broker_sessions
+        with self._lock:
+            self._reset_after_fork()
+            existed = key in self._near
+        try:
+            with self._engine().begin() as conn:
+                existed = bool(conn.execute(delete(t).where((t.c.broker == key[0]) & (t.c.user_id == key[1]))).rowcount) or existed
+        except Exception as e:
+            self._unavailable(e)
+        self._forget(key)
+        return existed
+
+    def _forget(self, key):
+        with self._lock:
+            self._near.pop(key, None)
+            self._local.pop(key, None)
+
+    def cleanup_expired(self):
+        """Delete expired session rows; returns how many"""
+        t = shared_broker_sessions
+        with self._engine().begin() as conn:
+            return conn.execute(delete(t).where(t.c.expires_at <= datetime.utcnow())).rowcount
+
+
+session_store = SessionStore()
@@ -36,11 +36,16 @@ chmod 755 uploads/mistakes
 # Stop existing Gunicorn processes
 echo "🛑 Stopping existing processes..."
 pkill -f gunicorn || true
+pkill -f job_worker.py || true
 
 # Start Gunicorn with production config
 echo "🔥 Starting Gunicorn server..."
 gunicorn -c gunicorn_config.py app:app &
 
+# Background jobs (backtests, broker imports, long-range reports)
+echo "⚙️ Starting background job workers..."
+python job_worker.py >> logs/jobs.log 2>&1 &
+
 # Wait for server to start
 sleep 5
 
@@ -8,7 +8,12 @@ backlog = 2048
 
 # Worker processes
 workers = multiprocessing.cpu_count() * 2 + 1
-worker_class = "sync"
+# Threaded workers: a slow Dhan/broker call blocks one request thread, not the
+# whole worker, so price/depth/pivot routes keep serving while upstream stalls.
+# The worker heartbeat runs on its own thread, so `timeout` no longer kills a
+# worker that is merely waiting on upstream I/O.
+worker_class = os.getenv("GUNICORN_WORKER_CLASS", "gthread")
+threads = int(os.getenv("GUNICORN_THREADS", "8"))
 worker_connections = 1000
 timeout = 30
 keepalive = 2
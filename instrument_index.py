@@ -0,0 +1,372 @@
+"""
+In-process index of NSE cash-equity instruments
+Loads the NSE/E rows of the instruments table once per worker and answers
+symbol lookups from dictionaries instead of per-request SQL
+"""
+
+import os
+import time
+import heapq
+import threading
+from bisect import bisect_left
+from collections import namedtuple
+
+from sqlalchemy import text
+
+# How often (seconds) a worker checks whether the instruments table changed
+INSTRUMENT_INDEX_CHECK_INTERVAL = int(os.getenv("INSTRUMENT_INDEX_CHECK_INTERVAL", "900"))
+
+Instrument = namedtuple("Instrument", ["symbol", "display_name", "security_id", "exch_id", "segment"])
+
+_SUFFIXES = (" LIMITED", " LTD")
+
+
+def _strip_suffixes(key):
+    """Remove trailing ' LTD' / ' LIMITED' style suffixes"""
+    for suffix in _SUFFIXES:
+        key = key.replace(suffix, "")
+    return key
+
+
+def _ngrams(s, max_n=3):
+    """All substrings of length 1..max_n (used as posting keys)"""
+    grams = set()
+    for n in range(1, max_n + 1):
+        for i in range(len(s) - n + 1):
+            grams.add(s[i:i + n])
+    return grams
+
+
+class SymbolAutocomplete:
+    """
+    Ranked typeahead over instrument symbols and display names.
+
+    Keeps the scoring of the old LIKE query:
+      300 exact symbol, 200 symbol prefix, 100 display prefix,
+      80 symbol contains, 50 display contains
+    then orders by LENGTH(symbol), symbol. Prefix tiers use sorted arrays,
+    substring tiers use an n-gram (up to trigram) inverted index.
+    """
+
+    def __init__(self, instruments, include=None):
+        # entry = (symbol, display, sort_key)
+        self.entries = []
+        seen = set()
+        for inst in instruments:
+            sym = inst.symbol.strip().upper()
+            if include is not None and not include(sym):
+                continue
+            disp = (inst.display_name or "").strip()
+            if (sym, disp) in seen:
+                continue
+            seen.add((sym, disp))
+            self.entries.append((sym, disp, (len(sym), sym)))
+
+        self.exact = {}
+        sym_sorted, disp_sorted = [], []
+        self.sym_grams, self.disp_grams = {}, {}
+        for i, (sym, disp, _) in enumerate(self.entries):
+            self.exact.setdefault(sym, []).append(i)
+            sym_sorted.append((sym, i))
+            for g in _ngrams(sym):
+                self.sym_grams.setdefault(g, set()).add(i)
+            disp_u = disp.upper()
+            if disp_u:
+                disp_sorted.append((disp_u, i))
+                for g in _ngrams(disp_u):
+                    self.disp_grams.setdefault(g, set()).add(i)
+
+        sym_sorted.sort()
+        disp_sorted.sort()
+        self.sym_keys = [k for k, _ in sym_sorted]
+        self.sym_ids = [i for _, i in sym_sorted]
+        self.disp_keys = [k for k, _ in disp_sorted]
+        self.disp_ids = [i for _, i in disp_sorted]
+        self.disp_upper = [disp.upper() for _, disp, _ in self.entries]
+
+    def __len__(self):
+        return len(self.entries)
+
+    @staticmethod
+    def _prefix_ids(keys, ids, q):
+        lo = bisect_left(keys, q)
+        hi = bisect_left(keys, q + "\uffff", lo)
+        return ids[lo:hi]
+
+    def _contains_ids(self, grams, texts, q):
+        if len(q) <= 3:
+            return grams.get(q, ())
+        postings = []
+        for i in range(len(q) - 2):
+            p = grams.get(q[i:i + 3])
+            if not p:
+                return ()
+            postings.append(p)
+        postings.sort(key=len)
+        candidates = set(postings[0]).intersection(*postings[1:])
+        return [i for i in candidates if q in texts(i)]
+
+    def search(self, query, limit=10):
+        q = (query or "").strip().upper()
+        if not q:
+            return []
+
+        tiers = (
+            lambda: self.exact.get(q, ()),
+            lambda: self._prefix_ids(self.sym_keys, self.sym_ids, q),
+            lambda: self._prefix_ids(self.disp_keys, self.disp_ids, q),
+            lambda: self._contains_ids(self.sym_grams, lambda i: self.entries[i][0], q),
+            lambda: self._contains_ids(self.disp_grams, lambda i: self.disp_upper[i], q),
+        )
+
+        # Score tiers are strictly ordered, so fill from the top and stop early
+        picked, seen = [], set()
+        for tier in tiers:
+            fresh = [i for i in tier() if i not in seen]
+            need = limit - len(picked)
+            best = heapq.nsmallest(need, fresh, key=lambda i: self.entries[i][2])
+            picked.extend(best)
+            seen.update(fresh)
+            if len(picked) >= limit:
+                break
+
+        return [{"symbol": self.entries[i][0], "name": self.entries[i][1]} for i in picked]
+
+
+class _Snapshot:
+    """Immutable set of lookup tables built from one load of the instruments table"""
+
+    def __init__(self, rows, stamp=None, version=0):
+        self.stamp = stamp
+        self.version = version
+        self.instruments = []
+        self.by_symbol = {}
+        self.by_nospace = {}
+        self.by_stripped = {}
+        self.by_display = {}
+
+        for sym, disp, sec_id, exch, segment in rows:
+            if not sym or not sec_id:
+                continue
+            inst = Instrument(sym, disp, str(sec_id), exch, segment)
+            self.instruments.append(inst)
+
+            clean_sym = sym.strip().upper()
+            self.by_symbol.setdefault(clean_sym, inst)
+            self.by_nospace.setdefault(clean_sym.replace(" ", ""), inst)
+            stripped = _strip_suffixes(clean_sym)
+            if stripped:
+                self.by_stripped.setdefault(stripped, inst)
+            if disp and disp.strip():
+                self.by_display.setdefault(disp.strip().upper(), inst)
+
+        # Sorted display names for 'STATE%' style prefix fallback
+        self.display_sorted = sorted(self.by_display.items())
+        self.display_keys = [k for k, _ in self.display_sorted]
+
+        # Autocomplete structures are built lazily, one per include filter
+        self.autocompleters = {}
+
+    def display_prefix(self, prefix):
+        """Shortest display name starting with prefix (LIKE 'prefix%' ORDER BY LENGTH)"""
+        lo = bisect_left(self.display_keys, prefix)
+        best = None
+        for key, inst in self.display_sorted[lo:]:
+            if not key.startswith(prefix):
+                break
+            if best is None or len(key) < len(best[0]):
+                best = (key, inst)
+        return best[1] if best else None
+
+
+class InstrumentIndex:
+    """Per-worker instrument lookup with versioned hot reload"""
+
+    def __init__(self, check_interval=INSTRUMENT_INDEX_CHECK_INTERVAL):
+        self.check_interval = check_interval
+        self._snapshot = None
+        self._checked_at = 0.0
+        self._lock = threading.Lock()
+
+    @property
+    def version(self):
+        snap = self._snapshot
+        return snap.version if snap else 0
+
+    @property
+    def loaded(self):
+        return self._snapshot is not None
+
+    # ----------------- loading ----------------- #
+    def _table_exists(self, db):
+        result = db.session.execute(
+            text("""
+                SELECT EXISTS (
+                    SELECT FROM information_schema.tables
+                    WHERE table_name = 'instruments'
+                )
+            """)
+        ).fetchone()
+        return bool(result and result[0])
+
+    def _read_stamp(self, db):
+        """Cheap change marker for the NSE/E slice of the instruments table"""
+        row = db.session.execute(
+            text("""
+                SELECT COUNT(*), MAX(id)
+                FROM instruments
+                WHERE exch_id = 'NSE' AND segment = 'E'
+            """)
+        ).fetchone()
+        return tuple(row) if row else None
+
+    def load(self, db):
+        """(Re)build the index from the database and swap it in atomically"""
+        with self._lock:
+            return self._load_locked(db)
+
+    def _load_locked(self, db):
+        version = self.version + 1
+        try:
+            if not self._table_exists(db):
+                print("[INSTRUMENTS] Instruments table not found in PostgreSQL")
+                self._snapshot = _Snapshot([], None, version)
+            else:
+                stamp = self._read_stamp(db)
+                rows = db.session.execute(
+                    text("""
+                        SELECT symbol_name, display_name, security_id, exch_id, segment
+                        FROM instruments
+                        WHERE exch_id = 'NSE' AND segment = 'E'
+                        ORDER BY id
+                    """)
+                ).fetchall()
+                self._snapshot = _Snapshot(rows, stamp, version)
+                print(f"[INSTRUMENTS] Loaded {len(self._snapshot.instruments)} instruments (v{version})")
+        except Exception as e:
+            print(f"[INSTRUMENTS] Error loading instruments: {e}")
+            try:
+                db.session.rollback()
+            except Exception:
+                pass
+            if self._snapshot is None:
+                self._snapshot = _Snapshot([], None, version)
+        self._checked_at = time.time()
+        return self._snapshot
+
+    def invalidate(self):
+        """Force a stamp check on next access"""
+        self._checked_at = 0.0
+
+    def snapshot(self, db):
+        """Current snapshot, loading on first use and reloading when the table changed"""
+        snap = self._snapshot
+        if snap is not None and time.time() - self._checked_at < self.check_interval:
+            return snap
+
+        with self._lock:
+            snap = self._snapshot
+            if snap is None:
+                return self._load_locked(db)
+            if time.time() - self._checked_at < self.check_interval:
+                return snap
+            try:
+                stamp = self._read_stamp(db) if self._table_exists(db) else None
+            except Exception as e:
+                print(f"[INSTRUMENTS] Version check failed: {e}")
+                self._checked_at = time.time()
+                return snap
+            if stamp != snap.stamp:
+                return self._load_locked(db)
+            self._checked_at = time.time()
+            return snap
+
+    # ----------------- lookups ----------------- #
+    def resolve(self, db, symbol_input):
+        """
+        Resolve free text to an Instrument using the same precedence as the
+        old SQL: exact symbol variations first, then display name match/prefix.
+        """
+        snap = self.snapshot(db)
+        key = (symbol_input or "").strip().upper()
+        if not key:
+            return None
+
+        variations = [key]
+        if "STATE BANK OF INDIA" in key:
+            variations.extend(["SBIN", "SBI", "STATEBANK", "STATE BANK"])
+        elif "SBIN" in key:
+            variations.extend(["STATE BANK OF INDIA", "SBI"])
+        variations.append(key.replace(" ", ""))
+        if " LTD" in key:
+            variations.append(key.replace(" LTD", ""))
+        if " LIMITED" in key:
+            variations.append(key.replace(" LIMITED", ""))
+        if " BANK" in key and "LTD" not in key:
+            variations.append(key.replace(" BANK", " BANK LTD"))
+
+        for variation in variations:
+            inst = snap.by_symbol.get(variation)
+            if inst:
+                return inst
+
+        inst = (snap.by_nospace.get(key.replace(" ", ""))
+                or snap.by_stripped.get(_strip_suffixes(key))
+                or snap.by_display.get(key))
+        if inst:
+            return inst
+
+        return snap.display_prefix(key.split()[0])
+
+    def autocomplete(self, db, query, limit=10, include=None):
+        """Ranked typeahead results as [{"symbol", "name"}] without touching the database"""
+        snap = self.snapshot(db)
+        engine = snap.autocompleters.get(include)
+        if engine is None:
+            with self._lock:
+                engine = snap.autocompleters.get(include)
+                if engine is None:
+                    engine = SymbolAutocomplete(snap.instruments, include)
+                    snap.autocompleters[include] = engine
+        return engine.search(query, limit)
+
+    def symbol_map(self, db):
+        """Legacy {KEY: (symbol, display, security_id)} mapping used by fetch_all_symbols"""
+        snap = self.snapshot(db)
+        symbol_map = {}
+        for table in (snap.by_symbol, snap.by_display, snap.by_stripped, snap.by_nospace):
+            for key, inst in table.items():
+                if key and key not in symbol_map:
+                    symbol_map[key] = (inst.symbol, inst.display_name, inst.security_id)
+        return symbol_map
+
+    def prefix_matches(self, db, prefix, limit=10):
+        """Instruments whose symbol or display name starts with prefix"""
+        snap = self.snapshot(db)
+        prefix = (prefix or "").strip().upper()
+        if not prefix:
+            return []
+        seen, out = set(), []
+        for inst in snap.instruments:
+            if inst.security_id in seen:
+                continue
+            sym = inst.symbol.strip().upper()
+            disp = (inst.display_name or "").strip().upper()
+            if sym.startswith(prefix) or disp.startswith(prefix):
+                seen.add(inst.security_id)
+                out.append(inst)
+        out.sort(key=lambda i: (len(i.symbol), i.symbol))
+        return out[:limit]
+
+
+_index = InstrumentIndex()
+
+
+def get_instrument_index():
+    """Process-wide instrument index"""
+    return _index
+
+
+def reload_instrument_index(db):
+    """Rebuild the index now (used after the instruments table is refreshed)"""
+    return _index.load(db)
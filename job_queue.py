@@ -0,0 +1,212 @@
+"""
+Database-backed background job queue
+Request handlers enqueue a row in background_jobs and return its id at once;
+worker processes (job_worker.py) claim queued rows with SELECT .. FOR UPDATE
+SKIP LOCKED, run the registered handler and record progress, result or error.
+Cancellation is cooperative: a handler sees it at its next progress() call.
+"""
+
+import os
+import time
+import socket
+import threading
+import traceback
+from datetime import datetime, timedelta
+
+from sqlalchemy import update, select
+
+JOB_POLL_INTERVAL = float(os.getenv("JOB_POLL_INTERVAL", "1.0"))
+JOB_HEARTBEAT_INTERVAL = float(os.getenv("JOB_HEARTBEAT_INTERVAL", "10"))
+# A running job whose heartbeat is older than this lost its worker
+JOB_STALE_SECONDS = int(os.getenv("JOB_STALE_SECONDS", "300"))
+JOB_MAX_ATTEMPTS = int(os.getenv("JOB_MAX_ATTEMPTS", "3"))
+
+QUEUED, RUNNING, SUCCEEDED, FAILED, CANCELLED = 'queued', 'running', 'succeeded', 'failed', 'cancelled'
+FINISHED = (SUCCEEDED, FAILED, CANCELLED)
+
+_handlers = {}
+
+
+class JobCancelled(Exception):
+    """Raised inside a handler once cancellation of its job was requested"""
+
+
+def job_handler(kind):
+    """Register fn(ctx, payload) -> JSON-serialisable result for jobs of `kind`"""
+    def register(fn):
+        _handlers[kind] = fn
+        return fn
+    return register
+
+
+class JobContext:
+    """Handed to handlers: progress reporting and cancellation checks"""
+
+    def __init__(self, db, Job, job_id, worker=None):
+        self.db = db
+        self.table = Job.__table__
+        self.job_id = job_id
+        self.worker = worker
+
+    def _owned(self):
+        """This run's row: not one that was reclaimed and handed to another worker"""
+        mine = self.table.c.id == self.job_id
+        if self.worker is not None:
+            mine &= self.table.c.worker == self.worker
+        return mine
+
+    def progress(self, percent=None, message=None):
+        """
+        Record progress in its own transaction (the handler's unit of work is
+        untouched) and raise JobCancelled if cancellation was requested.
+        """
+        values = {'heartbeat_at': datetime.utcnow()}
+        if percent is not None:
+            values['progress'] = max(0.0, min(float(percent), 100.0))
+        if message is not None:
+            values['progress_message'] = str(message)[:255]
+        with self.db.engine.begin() as conn:
+            conn.execute(update(self.table).where(self._owned()).values(**values))
+            cancel = conn.execute(
+                select(self.table.c.cancel_requested).where(self.table.c.id == self.job_id)
+            ).scalar()
+        if cancel:
+            raise JobCancelled()
+
+
+# ----------------- web side ----------------- #
+def enqueue(db, Job, kind, payload=None):
+    if kind not in _handlers:
+        raise ValueError(f"No handler registered for job kind '{kind}'")
+    job = Job(kind=kind, payload=payload or {}, status=QUEUED)
+    db.session.add(job)
+    db.session.commit()
+    return job
+
+
+def cancel(db, Job, job_id):
+    """
+    Cancel a job: a queued one never starts, a running one stops at its next
+    progress() call. Returns the job, or None if it does not exist.
+    """
+    job = Job.query.filter_by(id=job_id).with_for_update().first()
+    if job is None:
+        db.session.rollback()
+        return None
+    if job.status == QUEUED:
+        job.status = CANCELLED
+        job.finished_at = datetime.utcnow()
+    elif job.status == RUNNING:
+        job.cancel_requested = True
+    db.session.commit()
+    return job
+
+
+# ----------------- worker side ----------------- #
+def claim_next(db, Job, worker_id):
+    """Mark the oldest queued job this process can run as running and return it"""
+    if not _handlers:
+        return None
+    query = Job.query.filter(Job.status == QUEUED, Job.kind.in_(list(_handlers))) \
+        .order_by(Job.created_at, Job.id)
+    if db.engine.dialect.name == 'postgresql':
+        query = query.with_for_update(skip_locked=True)
+    job = query.first()
+    if job is None:
+        db.session.rollback()
+        return None
+    now = datetime.utcnow()
+    job.status = RUNNING
+    job.worker = worker_id
+    job.started_at = now
+    job.heartbeat_at = now
+    job.attempts = (job.attempts or 0) + 1
+    db.session.commit()
+    return job
+
+
+def reclaim_stale(db, Job):
+    """Requeue running jobs whose worker stopped heartbeating (or fail them after JOB_MAX_ATTEMPTS)"""
+    table = Job.__table__
+    cutoff = datetime.utcnow() - timedelta(seconds=JOB_STALE_SECONDS)
+    stale = (table.c.status == RUNNING) & (table.c.heartbeat_at < cutoff)
+    with db.engine.begin() as conn:
+        conn.execute(update(table).where(stale & (table.c.attempts >= JOB_MAX_ATTEMPTS)).values(
+            status=FAILED, error='Worker lost (no heartbeat)', finished_at=datetime.utcnow()))
+        requeued = conn.execute(update(table).where(stale).values(status=QUEUED, worker=None)).rowcount
+    if requeued:
+        print(f"[JOBS] Requeued {requeued} stale job(s)")
+
+
+def _heartbeat(engine, table, owned, job_id, stop):
+    # Runs on its own thread, outside the app context: use the engine, not db
+    while not stop.wait(JOB_HEARTBEAT_INTERVAL):
+        try:
+            with engine.begin() as conn:
+                conn.execute(update(table).where(owned).values(heartbeat_at=datetime.utcnow()))
+        except Exception as e:
+            print(f"[JOBS] Heartbeat failed for job {job_id}: {e}")
+
+
+def run_job(db, Job, job):
+    """Run a claimed job's handler and record how it ended (if the job is still this run's)"""
+    job_id, kind, payload = job.id, job.kind, job.payload or {}
+    table = Job.__table__
+    ctx = JobContext(db, Job, job_id, worker=job.worker)
+    stop = threading.Event()
+    beat = threading.Thread(target=_heartbeat, args=(db.engine, table, ctx._owned(), job_id, stop),
+                            daemon=True)
+    beat.start()
+
+    result, error = None, None
+    try:
+        result = _handlers[kind](ctx, payload)
+        status = SUCCEEDED
+    except JobCancelled:
+        db.session.rollback()
+        status = CANCELLED
+    except Exception as e:
+        db.session.rollback()
+        status = FAILED
+        error = f"{e}\n{traceback.format_exc()}"[-4000:]
+        print(f"[JOBS] Job {job_id} ({kind}) failed: {e}")
+    finally:
+        stop.set()
+        beat.join()
+
+    values = {'status': status, 'finished_at': datetime.utcnow(), 'result': result, 'error': error}
+    if status == SUCCEEDED:
+        values['progress'] = 100.0
+    with db.engine.begin() as conn:
+        recorded = conn.execute(update(table).where(ctx._owned() & (table.c.status == RUNNING))
+                                .values(**values)).rowcount
+    if not recorded:
+        print(f"[JOBS] Job {job_id} was reclaimed by another worker; its {status} result is discarded")
+    return status
+
+
+def worker_loop(app, db, Job, stop=None, worker_id=None, poll_interval=JOB_POLL_INTERVAL):
+    """Claim and run jobs until `stop` (a threading.Event) is set"""
+    stop = stop or threading.Event()
+    worker_id = worker_id or f"{socket.gethostname()}:{os.getpid()}"
+    last_reclaim = 0.0
+    with app.app_context():
+        while not stop.is_set():
+            job = None
+            try:
+                if time.monotonic() - last_reclaim > JOB_STALE_SECONDS / 4:
+                    reclaim_stale(db, Job)
+                    last_reclaim = time.monotonic()
+                job = claim_next(db, Job, worker_id)
+            except Exception as e:
+                print(f"[JOBS] Claim failed: {e}")
+                db.session.rollback()
+
+            if job is None:
+                stop.wait(poll_interval)
+                continue
+
+            print(f"[JOBS] {worker_id} running job {job.id} ({job.kind})")
+            status = run_job(db, Job, job)
+            print(f"[JOBS] Job {job.id} {status}")
+            db.session.remove()
@@ -0,0 +1,75 @@
+#!/usr/bin/env python3
+"""
+Background job worker for CalculatenTrade
+Runs the jobs the web app queues in background_jobs (backtests, broker trade
+imports, long-range reports; see job_queue). Start it next to gunicorn:
+
+    python job_worker.py --processes 2
+
+Each process claims one job at a time, so several processes (or several
+hosts) can share the queue. SIGTERM/SIGINT finish the running job and exit.
+"""
+
+import os
+import sys
+import signal
+import argparse
+import threading
+import multiprocessing
+
+# Add the current directory to Python path
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+JOB_WORKER_PROCESSES = int(os.getenv("JOB_WORKER_PROCESSES", "2"))
+
+
+def _stop_on_signals(stop):
+    def handle(signum, _frame):
+        print(f"[JOBS] Signal {signum} received, stopping after the current job")
+        stop.set()
+    signal.signal(signal.SIGTERM, handle)
+    signal.signal(signal.SIGINT, handle)
+
+
+def work():
+    """One worker process: import the app (which registers the job handlers) and poll"""
+    import job_queue
+    from app import app
+    from journal import db, BackgroundJob
+
+    stop = threading.Event()
+    _stop_on_signals(stop)
+    with app.app_context():
+        BackgroundJob.__table__.create(db.engine, checkfirst=True)
+    print(f"[JOBS] Worker {os.getpid()} ready for: {', '.join(sorted(job_queue._handlers))}")
+    job_queue.worker_loop(app, db, BackgroundJob, stop=stop)
+
+
+def main(processes=JOB_WORKER_PROCESSES):
+    if processes <= 1:
+        work()
+        return
+
+    children = [multiprocessing.Process(target=work, name=f"job-worker-{i}") for i in range(processes)]
+    for child in children:
+        child.start()
+
+    # Forward SIGTERM/SIGINT to the children and wait for them to drain
+    def forward(signum, _frame):
+        for child in children:
+            if child.is_alive():
+                os.kill(child.pid, signum)
+    signal.signal(signal.SIGTERM, forward)
+    signal.signal(signal.SIGINT, forward)
+
+    for child in children:
+        child.join()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Run queued background jobs")
+    parser.add_argument("--processes", type=int, default=JOB_WORKER_PROCESSES,
+                        help="worker processes (each runs one job at a time)")
+    args = parser.parse_args()
+
+    main(args.processes)
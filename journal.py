@@ -2,9 +2,11 @@ from flask import Flask, render_template, request, redirect, url_for, jsonify, f
 from toast_utils import ToastManager, toast_success, toast_error, toast_warning, toast_info
 import random
 import os
+import time
 from datetime import datetime, timedelta
 from flask_sqlalchemy import SQLAlchemy
 import json
+import base64
 import requests
 import pyotp
 from dotenv import load_dotenv
@@ -81,6 +83,16 @@ except ImportError:
 
 
 
+from upstream_http import upstream, pooled
+from broker_clients import broker_clients, token_fingerprint
+from broker_session_store import session_store
+import journal_metrics
+import trade_analytics
+import backtest_engine
+import job_queue
+import broker_fanout
+import portfolio_aggregate
+
 # KiteConnect SDK
 try:
     from kiteconnect import KiteConnect
@@ -91,12 +103,12 @@ except ImportError:
 try:
     from dhanhq import DhanHQ
     def make_dhan_client(client_id: str, access_token: str):
-        return DhanHQ(client_id=client_id, access_token=access_token)
+        return pooled(DhanHQ(client_id=client_id, access_token=access_token), "dhan")
 except ImportError:
     try:
         from dhanhq import dhanhq as _dhan_factory
         def make_dhan_client(client_id: str, access_token: str):
-            return _dhan_factory(client_id, access_token)
+            return pooled(_dhan_factory(client_id, access_token), "dhan")
     except ImportError:
         make_dhan_client = None
 
@@ -171,17 +183,10 @@ def init_broker_accounts():
         pass
 
 
-# In-memory stores for broker connections (replace with DB in production)
-USER_APPS = {
-    "kite": {},
-    "dhan": {},
-    "angel": {}
-}
-USER_SESSIONS = {
-    "kite": {},
-    "dhan": {},
-    "angel": {}
-}
+# Broker connections: credentials per process, sessions shared by all workers
+# (the same objects as multi_broker_system's; see broker_session_store)
+USER_APPS = session_store.apps
+USER_SESSIONS = session_store.sessions
 
 # DhanHQ constants
 DHAN_AUTH_BASE = "https://auth.dhan.co"
@@ -206,6 +211,17 @@ class Trade(db.Model):
     
     created_at = db.Column(db.DateTime, default=datetime.utcnow)
 
+    # Match the journal's WHERE/ORDER BY shapes: date ranges and (date, id)
+    # keyset pages, optionally narrowed by result, strategy or symbol.
+    # Existing databases get these from migration add_journal_query_indexes.
+    __table_args__ = (
+        db.Index('ix_trade_date_id', 'date', 'id'),
+        db.Index('ix_trade_result_date_id', 'result', 'date', 'id'),
+        db.Index('ix_trade_strategy_id_date', 'strategy_id', 'date'),
+        db.Index('ix_trade_symbol_date', 'symbol', 'date'),
+        db.Index('ix_trade_pnl_id', 'pnl', 'id'),
+    )
+
     @property
     def is_win(self):
         return self.result == 'win'
@@ -217,7 +233,135 @@ class Trade(db.Model):
         return 0
 
 
-    
+class TradeStats(db.Model):
+    """
+    Running totals over the trade table, maintained on every Trade write
+    (see journal_metrics.register_trade_stats). Trades have no owner column,
+    so there is one row per scope; 'all' covers the whole journal.
+    """
+    __tablename__ = 'trade_stats'
+    id = db.Column(db.Integer, primary_key=True)
+    scope = db.Column(db.String(32), nullable=False, unique=True, default='all')
+
+    trade_count = db.Column(db.Integer, default=0)
+    win_count = db.Column(db.Integer, default=0)       # result == 'win'
+    loss_count = db.Column(db.Integer, default=0)      # result == 'loss'
+    positive_count = db.Column(db.Integer, default=0)  # pnl > 0
+    negative_count = db.Column(db.Integer, default=0)  # pnl < 0
+    total_pnl = db.Column(db.Float, default=0.0)
+    sum_pnl_sq = db.Column(db.Float, default=0.0)
+    win_pnl = db.Column(db.Float, default=0.0)         # sum of pnl where result == 'win'
+    loss_pnl = db.Column(db.Float, default=0.0)        # sum of pnl where result == 'loss'
+    gross_profit = db.Column(db.Float, default=0.0)    # sum of pnl > 0
+    gross_loss = db.Column(db.Float, default=0.0)      # abs(sum of pnl < 0)
+    rr_sum = db.Column(db.Float, default=0.0)          # sum of reward / risk where both > 0
+    rr_count = db.Column(db.Integer, default=0)
+    total_volume = db.Column(db.Float, default=0.0)
+
+    # Best win / worst loss, and order-dependent state replayed in (date, id) order
+    best_pnl = db.Column(db.Float)                     # highest pnl where result == 'win'
+    best_symbol = db.Column(db.String(20))
+    worst_pnl = db.Column(db.Float)                    # lowest pnl where result == 'loss'
+    worst_symbol = db.Column(db.String(20))
+    equity = db.Column(db.Float, default=0.0)
+    peak = db.Column(db.Float, default=0.0)
+    max_drawdown = db.Column(db.Float, default=0.0)
+    current_streak = db.Column(db.Integer, default=0)  # > 0 wins, < 0 losses
+    longest_win_streak = db.Column(db.Integer, default=0)
+    longest_loss_streak = db.Column(db.Integer, default=0)
+    last_trade_date = db.Column(db.DateTime)
+
+    # Set when an edit, delete or back-dated insert invalidates the ordered state;
+    # counts and sums stay exact, the rest is refreshed by a 'trade_stats' job
+    stale = db.Column(db.Boolean, default=False, nullable=False)
+    rebuilt_at = db.Column(db.DateTime)
+    updated_at = db.Column(db.DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
+
+    def to_dict(self):
+        """
+        Same keys as journal_metrics.trade_totals (dashboard definitions: win/loss
+        by result; best trade = highest-PnL win, worst = lowest-PnL loss)
+        """
+        return {
+            'total_trades': self.trade_count or 0,
+            'winning_trades': self.win_count or 0,
+            'losing_trades': self.loss_count or 0,
+            'total_pnl': self.total_pnl or 0,
+            'gross_profit': self.win_pnl or 0,
+            'gross_loss': abs(self.loss_pnl or 0),
+            'highest_pnl': self.best_pnl or 0,
+            'risk_reward': round(self.rr_sum / self.rr_count, 2) if self.rr_count else 0,
+            'best_trade_symbol': self.best_symbol,
+            'worst_trade_symbol': self.worst_symbol,
+            'max_drawdown': self.max_drawdown or 0,
+            'current_streak': self.current_streak or 0,
+            'longest_win_streak': self.longest_win_streak or 0,
+            'longest_loss_streak': self.longest_loss_streak or 0,
+        }
+
+
+class TradeDailyPnl(db.Model):
+    """
+    Per-day rollup of the trade table, maintained with TradeStats on every
+    Trade write. Calendar and heatmap views read at most 366 rows per year.
+    """
+    __tablename__ = 'trade_daily_pnl'
+    id = db.Column(db.Integer, primary_key=True)
+    scope = db.Column(db.String(32), nullable=False, default='all')
+    day = db.Column(db.Date, nullable=False)
+    pnl = db.Column(db.Float, nullable=False, default=0.0)
+    trade_count = db.Column(db.Integer, nullable=False, default=0)
+    wins = db.Column(db.Integer, nullable=False, default=0)        # pnl > 0
+    losses = db.Column(db.Integer, nullable=False, default=0)      # pnl < 0
+    gross_profit = db.Column(db.Float, nullable=False, default=0.0)
+    gross_loss = db.Column(db.Float, nullable=False, default=0.0)  # positive number
+
+    __table_args__ = (db.UniqueConstraint('scope', 'day', name='_trade_daily_pnl_scope_day_uc'),)
+
+    def to_dict(self):
+        return {
+            'date': self.day.isoformat(),
+            'pnl': round(self.pnl or 0, 2),
+            'trades': self.trade_count or 0,
+            'wins': self.wins or 0,
+            'losses': self.losses or 0,
+            'gross_profit': round(self.gross_profit or 0, 2),
+            'gross_loss': round(self.gross_loss or 0, 2),
+        }
+
+
+journal_metrics.register_trade_stats(Trade, TradeStats, TradeDailyPnl)
+
+
+def current_trade_stats():
+    """All-time TradeStats (O(1) read; built on first use, refreshed by a job after edits/deletes)"""
+    return journal_metrics.get_trade_stats(db, Trade, TradeStats, TradeDailyPnl,
+                                           schedule_rebuild=schedule_trade_stats_rebuild)
+
+
+def schedule_trade_stats_rebuild(scope='all'):
+    """Queue a 'trade_stats' job unless one is already waiting"""
+    pending = BackgroundJob.query.filter_by(kind='trade_stats', status=job_queue.QUEUED) \
+        .filter(BackgroundJob.payload['scope'].as_string() == scope).first()
+    if pending is None:
+        job_queue.enqueue(db, BackgroundJob, 'trade_stats', {'scope': scope})
+
+
+@job_queue.job_handler('trade_stats')
+def run_trade_stats_job(ctx, payload):
+    """Rebuild a stale TradeStats row (a no-op if another job got there first)"""
+    ctx.progress(5, "Rebuilding trade statistics")
+    stats = journal_metrics.rebuild_trade_stats(db, Trade, TradeStats, payload.get('scope', 'all'),
+                                                only_if_stale=True)
+    return {'trade_count': stats.trade_count, 'rebuilt_at': stats.rebuilt_at.isoformat()}
+
+
+def daily_rollup(start, end):
+    """{date: TradeDailyPnl} for start..end; None if the rollup could not be built"""
+    if current_trade_stats() is None:
+        return None
+    return journal_metrics.daily_pnl(db, TradeDailyPnl, start, end)
+
 
 class Rule(db.Model):
     id = db.Column(db.Integer, primary_key=True)
@@ -419,6 +563,16 @@ class MistakeTradeLink(db.Model):
 
 Index('ix_mistakes_searchable_text', Mistake.searchable_text)
 
+# Mistake lists filter out soft-deleted rows and order by created_at; partial
+# indexes over live rows only (PostgreSQL), one per optional filter
+Index('ix_mistakes_live_created_at', Mistake.created_at,
+      postgresql_where=db.not_(Mistake.is_deleted))
+Index('ix_mistakes_live_category_created_at', Mistake.category, Mistake.created_at,
+      postgresql_where=db.not_(Mistake.is_deleted))
+Index('ix_mistakes_live_severity_created_at', Mistake.severity, Mistake.created_at,
+      postgresql_where=db.not_(Mistake.is_deleted))
+Index('ix_mistakes_related_trade_id', Mistake.related_trade_id)
+
 # PostgreSQL full-text search can be implemented using tsvector columns if needed
 
 
@@ -475,6 +629,8 @@ class ChallengeTrade(db.Model):
     pnl = db.Column(db.Float, nullable=False)
     notes = db.Column(db.Text)
     created_at = db.Column(db.DateTime, default=datetime.utcnow)
+
+    __table_args__ = (db.Index('ix_challenge_trades_challenge_id_trade_date', 'challenge_id', 'trade_date'),)
     
     def to_dict(self):
         return {
@@ -582,12 +738,33 @@ class Strategy(db.Model):
             "win_rate": self.win_rate
         }
 
+    @classmethod
+    def load_aggregates(cls, strategies):
+        """
+        Attach trade count, PnL and win/loss counts to every strategy in one
+        GROUP BY, so total_trades/total_pnl/win_rate stop querying per strategy.
+        Returns the strategies for chaining.
+        """
+        strategies = list(strategies)
+        if strategies:
+            aggregates = journal_metrics.strategy_aggregates(db, Trade, [s.id for s in strategies])
+            empty = {'total_trades': 0, 'total_pnl': 0.0, 'wins': 0, 'losses': 0}
+            for s in strategies:
+                s._aggregates = aggregates.get(s.id, empty)
+        return strategies
+
     @property
     def total_trades(self):
+        aggregates = self.__dict__.get('_aggregates')
+        if aggregates is not None:
+            return aggregates['total_trades']
         return self.trades.count()
 
     @property
     def total_pnl(self):
+        aggregates = self.__dict__.get('_aggregates')
+        if aggregates is not None:
+            return aggregates['total_pnl']
         # sum of trade.pnl for linked trades
         try:
             total = db.session.query(db.func.coalesce(db.func.sum(Trade.pnl), 0.0)).filter(Trade.strategy_id == self.id).scalar()
@@ -598,6 +775,10 @@ class Strategy(db.Model):
 
     @property
     def win_rate(self):
+        aggregates = self.__dict__.get('_aggregates')
+        if aggregates is not None:
+            total = aggregates['wins'] + aggregates['losses']
+            return round((aggregates['wins'] / total) * 100, 2) if total else 0.0
         total = self.trades.filter(Trade.result.in_(['win','loss'])).count()
         if total == 0:
             return 0.0
@@ -629,6 +810,47 @@ class BacktestSummary(db.Model):
     strategy = db.relationship('Strategy', backref=db.backref('backtest_models', lazy='dynamic'))
 
 
+class BackgroundJob(db.Model):
+    """A unit of work for job_worker.py (see job_queue)"""
+    __tablename__ = 'background_jobs'
+    id = db.Column(db.Integer, primary_key=True)
+    kind = db.Column(db.String(50), nullable=False)           # backtest, broker_import, broker_merge, report, trade_stats
+    status = db.Column(db.String(20), nullable=False, default='queued')  # queued, running, succeeded, failed, cancelled
+    payload = db.Column(db.JSON, default=dict)
+    result = db.Column(db.JSON, nullable=True)
+    error = db.Column(db.Text, nullable=True)
+    progress = db.Column(db.Float, default=0.0)               # 0-100
+    progress_message = db.Column(db.String(255), nullable=True)
+    cancel_requested = db.Column(db.Boolean, default=False, nullable=False)
+    attempts = db.Column(db.Integer, default=0, nullable=False)
+    worker = db.Column(db.String(100), nullable=True)
+    created_at = db.Column(db.DateTime, default=datetime.utcnow, nullable=False)
+    started_at = db.Column(db.DateTime, nullable=True)
+    heartbeat_at = db.Column(db.DateTime, nullable=True)
+    finished_at = db.Column(db.DateTime, nullable=True)
+
+    __table_args__ = (db.Index('ix_background_jobs_status_created_at', 'status', 'created_at'),)
+
+    def to_dict(self, include_result=True):
+        d = {
+            'id': self.id,
+            'kind': self.kind,
+            'status': self.status,
+            'progress': round(self.progress or 0, 1),
+            'progress_message': self.progress_message,
+            'cancel_requested': self.cancel_requested,
+            'attempts': self.attempts,
+            'created_at': self.created_at.isoformat() if self.created_at else None,
+            'started_at': self.started_at.isoformat() if self.started_at else None,
+            'finished_at': self.finished_at.isoformat() if self.finished_at else None,
+            # first line only; the traceback stays in the table
+            'error': self.error.splitlines()[0] if self.error else None,
+        }
+        if include_result:
+            d['result'] = self.result
+        return d
+
+
 
 class Watchlist(db.Model):
     __tablename__ = 'watchlists'
@@ -711,6 +933,7 @@ def save_broker_account(broker, user_id, **kwargs):
         acc.last_connected_at = datetime.utcnow()
 
     db.session.commit()
+    mark_account_changed(broker, user_id)
 
     # use current_app.logger instead of global app
     try:
@@ -731,16 +954,66 @@ def mark_connected(broker, user_id, connected=True):
     if connected:
         acc.last_connected_at = datetime.utcnow()
     db.session.commit()
+    mark_account_changed(broker, user_id)
     try:
         current_app.logger.info("Marked connected=%s for %s/%s", connected, broker, user_id)
     except RuntimeError:
         print(f"Marked connected={connected} for {broker}/{user_id}")
     return acc
 
+# Seconds a worker trusts its in-memory copy of one broker account before
+# re-reading that row (writes made by this worker invalidate it at once)
+BROKER_ACCOUNT_RECHECK_SECONDS = float(os.getenv("BROKER_ACCOUNT_RECHECK_SECONDS", "5"))
+
+# (broker, user_id) -> (row version stamp or None, time.monotonic() of the last check)
+_ACCOUNT_STAMPS = {}
+
+
+def _account_stamp(acc):
+    """Version stamp of the BrokerAccount fields mirrored in USER_APPS/USER_SESSIONS"""
+    return token_fingerprint(acc.api_key, acc.api_secret, acc.client_id, acc.access_token,
+                             acc.totp_secret, acc.connected, acc.last_connected_at)
+
+
+def _restore_account(acc, logger):
+    """Mirror one BrokerAccount row into USER_APPS (and USER_SESSIONS if its token is live)"""
+    # Always restore credentials to USER_APPS
+    USER_APPS.setdefault(acc.broker, {})[acc.user_id] = {
+        "api_key": acc.api_key,
+        "api_secret": acc.api_secret,
+        "client_id": acc.client_id,
+        "access_token": acc.access_token,
+        "totp_secret": acc.totp_secret
+    }
+    # restore in-memory session if token exists and not expired
+    if acc.access_token and acc.connected:
+        # Check if connection is not expired (24 hours)
+        if acc.last_connected_at and (datetime.utcnow() - acc.last_connected_at) < timedelta(hours=24):
+            current = USER_SESSIONS.get(acc.broker, {}).get(acc.user_id) or {}
+            if acc.access_token in (current.get("access_token"), current.get("jwt_token")):
+                # Same token: keep the live session (e.g. Angel's SmartConnect object)
+                return
+            if acc.broker == "kite":
+                USER_SESSIONS.setdefault("kite", {})[acc.user_id] = {"access_token": acc.access_token}
+            elif acc.broker == "dhan":
+                USER_SESSIONS.setdefault("dhan", {})[acc.user_id] = {"access_token": acc.access_token, "dhan_client_id": acc.client_id, "mode": "direct"}
+            elif acc.broker == "angel":
+                # We can't reconstruct SmartConnect object after restart, but store tokens so front-end knows it's connected
+                USER_SESSIONS.setdefault("angel", {})[acc.user_id] = {"jwt_token": acc.access_token, "client_code": acc.client_id}
+            logger.info("Restored session for %s/%s", acc.broker, acc.user_id)
+        else:
+            # Mark as disconnected if expired
+            acc.connected = False
+            acc.access_token = None
+            db.session.commit()
+            logger.info("Expired session for %s/%s", acc.broker, acc.user_id)
+
+
 def load_persisted_accounts_into_memory(app=None):
     """
     Load all persisted BrokerAccount rows into USER_APPS.
     If an account has an access_token, restore USER_SESSIONS for that user so endpoints remain usable.
+    Used at startup and for admin resyncs; request paths use ensure_account_loaded.
     """
     if app is None:
         from flask import current_app
@@ -754,33 +1027,44 @@ def load_persisted_accounts_into_memory(app=None):
             # not running inside an app context — ignore/log differently
             pass
 
+        now = time.monotonic()
         for acc in accounts:
-            # Always restore credentials to USER_APPS
-            USER_APPS.setdefault(acc.broker, {})[acc.user_id] = {
-                "api_key": acc.api_key,
-                "api_secret": acc.api_secret,
-                "client_id": acc.client_id,
-                "access_token": acc.access_token,
-                "totp_secret": acc.totp_secret
-            }
-            # restore in-memory session if token exists and not expired
-            if acc.access_token and acc.connected:
-                # Check if connection is not expired (24 hours)
-                if acc.last_connected_at and (datetime.utcnow() - acc.last_connected_at) < timedelta(hours=24):
-                    if acc.broker == "kite":
-                        USER_SESSIONS.setdefault("kite", {})[acc.user_id] = {"access_token": acc.access_token}
-                    elif acc.broker == "dhan":
-                        USER_SESSIONS.setdefault("dhan", {})[acc.user_id] = {"access_token": acc.access_token, "dhan_client_id": acc.client_id, "mode": "direct"}
-                    elif acc.broker == "angel":
-                        # We can't reconstruct SmartConnect object after restart, but store tokens so front-end knows it's connected
-                        USER_SESSIONS.setdefault("angel", {})[acc.user_id] = {"jwt_token": acc.access_token, "client_code": acc.client_id}
-                    app.logger.info("Restored session for %s/%s", acc.broker, acc.user_id)
-                else:
-                    # Mark as disconnected if expired
-                    acc.connected = False
-                    acc.access_token = None
-                    db.session.commit()
-                    app.logger.info("Expired session for %s/%s", acc.broker, acc.user_id)
+            _restore_account(acc, app.logger)
+            _ACCOUNT_STAMPS[(acc.broker, acc.user_id)] = (_account_stamp(acc), now)
+
+
+def ensure_account_loaded(broker, user_id):
+    """
+    Make USER_APPS/USER_SESSIONS current for one (broker, user_id).
+    Reads only that row, at most every BROKER_ACCOUNT_RECHECK_SECONDS, and
+    rebuilds the in-memory entries only when the row's version stamp changed.
+    """
+    key = (broker, user_id)
+    now = time.monotonic()
+    stamp, checked_at = _ACCOUNT_STAMPS.get(key, (None, None))
+    if checked_at is not None and now - checked_at < BROKER_ACCOUNT_RECHECK_SECONDS:
+        return
+
+    acc = BrokerAccount.query.filter_by(broker=broker, user_id=user_id).first()
+    if acc is None:
+        if stamp is not None:
+            # Deleted since this worker loaded it
+            USER_APPS.get(broker, {}).pop(user_id, None)
+            USER_SESSIONS.get(broker, {}).pop(user_id, None)
+            broker_clients.evict(broker, user_id)
+        _ACCOUNT_STAMPS[key] = (None, now)
+        return
+
+    new_stamp = _account_stamp(acc)
+    if checked_at is None or new_stamp != stamp:
+        _restore_account(acc, current_app.logger)
+        new_stamp = _account_stamp(acc)  # an expired token was just cleared
+    _ACCOUNT_STAMPS[key] = (new_stamp, now)
+
+
+def mark_account_changed(broker, user_id):
+    """Make the next ensure_account_loaded for this account re-read its row"""
+    _ACCOUNT_STAMPS.pop((broker, user_id), None)
 
 # ---------------- BROKER HELPER FUNCTIONS ---------------- #
 def get_kite_for_user(user_id, access_token=None):
@@ -798,12 +1082,15 @@ def get_kite_for_user(user_id, access_token=None):
         else:
             raise ValueError("No app credentials for this user")
     
-    kite = KiteConnect(api_key=creds["api_key"])
-    if access_token:
-        kite.set_access_token(access_token)
-    elif creds.get("access_token"):
-        kite.set_access_token(creds["access_token"])
-    return kite
+    token = access_token or creds.get("access_token")
+
+    def build():
+        kite = pooled(KiteConnect(api_key=creds["api_key"]), "kite")
+        if token:
+            kite.set_access_token(token)
+        return kite
+
+    return broker_clients.get("kite", user_id, token_fingerprint(creds["api_key"], token), build)
 
 def _dhan_headers(partner_id, partner_secret):
     return {
@@ -814,7 +1101,7 @@ def _dhan_headers(partner_id, partner_secret):
 
 def _dhan_generate_consent(partner_id, partner_secret):
     url = f"{DHAN_AUTH_BASE}/partner/generate-consent"
-    r = requests.post(url, headers=_dhan_headers(partner_id, partner_secret), json={})
+    r = upstream.post(url, endpoint="dhan.consent", headers=_dhan_headers(partner_id, partner_secret), json={})
     r.raise_for_status()
     data = r.json() if r.headers.get("content-type","").startswith("application/json") else {}
     consent_id = data.get("consentId") or data.get("consent_id")
@@ -824,7 +1111,7 @@ def _dhan_generate_consent(partner_id, partner_secret):
 
 def _dhan_consume_consent(partner_id, partner_secret, token_id):
     url = f"{DHAN_AUTH_BASE}/partner/consume-consent"
-    r = requests.get(url, headers=_dhan_headers(partner_id, partner_secret), params={"tokenId": token_id})
+    r = upstream.get(url, endpoint="dhan.consent", retries=0, headers=_dhan_headers(partner_id, partner_secret), params={"tokenId": token_id})
     r.raise_for_status()
     return r.json()
 
@@ -836,7 +1123,12 @@ def _dhan_client_from_session(user_id):
     access_token = sess.get("access_token")
     if not access_token:
         return None, jsonify({"ok": False, "message": "Missing Dhan access token"}), 500
-    return make_dhan_client(client_id, access_token), None, None
+    return cached_dhan_client(user_id, client_id, access_token), None, None
+
+def cached_dhan_client(user_id, client_id, access_token):
+    """Dhan client for user_id from the per-user cache (rebuilt when the token rotates)"""
+    return broker_clients.get("dhan", user_id, token_fingerprint(client_id, access_token),
+                              lambda: make_dhan_client(client_id, access_token))
 
 def _angel_auth_headers(jwt):
     return {
@@ -852,7 +1144,7 @@ def _angel_auth_headers(jwt):
     }
 
 def _angel_sdk_login(api_key: str, client_code: str, password: str, totp: str):
-    smart = SmartConnect(api_key=api_key)
+    smart = pooled(SmartConnect(api_key=api_key), "angel")
     data = smart.generateSession(clientCode=client_code, password=password, totp=totp)
     if data.get('errorcode'):
         raise RuntimeError(f"Angel login failed: {data.get('message')}")
@@ -993,37 +1285,30 @@ def api_dashboard_equity_curve():
     """Get equity curve data for dashboard chart"""
     days = int(request.args.get('days', 30))
     start_date = datetime.now() - timedelta(days=days)
-    trades = Trade.query.filter(Trade.date >= start_date).order_by(Trade.date).all()
-    
-    equity_data = []
-    cumulative_pnl = 0
-    for trade in trades:
-        cumulative_pnl += trade.pnl
-        equity_data.append({
-            'date': trade.date.strftime('%Y-%m-%d'),
-            'equity': round(cumulative_pnl, 2)
-        })
+    max_points = request.args.get('max_points', trade_analytics.EQUITY_CURVE_MAX_POINTS, type=int)
+    series = trade_analytics.load_series(db, Trade, start_date)
+    equity = trade_analytics.equity_curve(series.pnl)
+    idx = trade_analytics.downsample_indices(equity, max_points)
+    
+    equity_data = [
+        {'date': day, 'equity': round(float(eq), 2)}
+        for day, eq in zip(series.day_strings[idx].tolist(), equity[idx].tolist())
+    ]
     
-    return jsonify({'success': True, 'data': equity_data})
+    return jsonify({'success': True, 'data': equity_data, 'total_points': len(series)})
 
 @calculatentrade_bp.route('/api/dashboard/monthly_heatmap')
 def api_dashboard_monthly_heatmap():
     """Get monthly P&L heatmap data for dashboard"""
     months = int(request.args.get('months', 12))
-    heatmap_data = []
-    
-    for i in range(months):
-        month_start = (datetime.now().replace(day=1) - timedelta(days=30*i)).replace(day=1)
-        month_end = (month_start + timedelta(days=32)).replace(day=1) - timedelta(days=1)
-        month_trades = Trade.query.filter(Trade.date >= month_start.date(), Trade.date <= month_end.date()).all()
-        month_pnl = sum(t.pnl for t in month_trades)
-        
-        heatmap_data.append({
-            'month': month_start.strftime('%b %Y'),
-            'pnl': round(month_pnl, 2),
-            'trades': len(month_trades),
-            'color': 'green' if month_pnl > 0 else ('red' if month_pnl < 0 else 'gray')
-        })
+    if current_trade_stats() is not None:
+        heatmap_data = journal_metrics.rollup_monthly(db, TradeDailyPnl, months=months)
+    else:
+        heatmap_data = journal_metrics.monthly_heatmap(db, Trade, months=months)
+    
+    for month in heatmap_data:
+        month_pnl = month['pnl']
+        month['color'] = 'green' if month_pnl > 0 else ('red' if month_pnl < 0 else 'gray')
     
     return jsonify({'success': True, 'data': list(reversed(heatmap_data))})
 
@@ -1154,144 +1439,84 @@ def dashboard():
             safe_log_error(f"Error fetching recent trades: {e}")
             recent_trades = []
         
+        # All-time totals from the maintained stats row, plus this month/week
+        stats = None
         try:
-            # ✅ FIX: Ensure all counts are integers for safe comparison
-            total_trades = Trade.query.count() or 0
-            winning_trades = Trade.query.filter_by(result='win').count() or 0
-            losing_trades = Trade.query.filter_by(result='loss').count() or 0
-            
-            # Ensure they are integers
-            total_trades = int(total_trades)
-            winning_trades = int(winning_trades)
-            losing_trades = int(losing_trades)
+            stats = current_trade_stats()
+            if stats is not None:
+                totals = stats.to_dict()
+                totals.update(journal_metrics.period_totals(db, Trade))
+            else:
+                totals = journal_metrics.trade_totals(db, Trade)
         except Exception as e:
-            safe_log_error(f"Error fetching trade counts: {e}")
-            total_trades = 0
-            winning_trades = 0
-            losing_trades = 0
-        
+            safe_log_error(f"Error calculating trade totals: {e}")
+            db.session.rollback()
+            totals = {}
+
+        total_trades = totals.get('total_trades', 0)
+        winning_trades = totals.get('winning_trades', 0)
+        losing_trades = totals.get('losing_trades', 0)
+        total_pnl = totals.get('total_pnl', 0)
+        highest_pnl = totals.get('highest_pnl', 0)
+        trades_this_month = totals.get('trades_this_month', 0)
+        monthly_pnl = totals.get('monthly_pnl', 0)
+        risk_reward = totals.get('risk_reward', 0)
+        gross_profit = totals.get('gross_profit', 0)
+        gross_loss = totals.get('gross_loss', 0)
+
         win_rate = (winning_trades / total_trades * 100) if total_trades > 0 else 0
-    
-        # PnL calculations with error handling
-        try:
-            all_trades = Trade.query.all()
-            total_pnl = sum(float(t.pnl or 0) for t in all_trades)
-            highest_pnl_trade = Trade.query.filter_by(result='win').order_by(Trade.pnl.desc()).first()
-            highest_pnl = float(highest_pnl_trade.pnl) if highest_pnl_trade and highest_pnl_trade.pnl else 0
-        except Exception as e:
-            safe_log_error(f"Error calculating PnL: {e}")
-            total_pnl = 0
-            highest_pnl = 0
-    
-        # Monthly stats with error handling
-        try:
-            start_of_month = datetime.now().replace(day=1, hour=0, minute=0, second=0, microsecond=0)
-            # ✅ FIX: Ensure count is integer for safe comparison
-            trades_this_month = Trade.query.filter(Trade.date >= start_of_month.date()).count() or 0
-            trades_this_month = int(trades_this_month)
-            monthly_trades = Trade.query.filter(Trade.date >= start_of_month.date()).all()
-            monthly_pnl = sum(float(t.pnl or 0) for t in monthly_trades)
-        except Exception as e:
-            safe_log_error(f"Error calculating monthly stats: {e}")
-            trades_this_month = 0
-            monthly_pnl = 0
-    
-        # Risk/Reward calculations
-        try:
-            trades_with_risk = Trade.query.filter(
-                Trade.risk.isnot(None), 
-                Trade.reward.isnot(None),
-                Trade.risk > 0, 
-                Trade.reward > 0
-            ).all()
-        except Exception as e:
-            safe_log_error(f"Error fetching trades with risk: {e}")
-            trades_with_risk = []
-        
-        risk_reward = 0
-        if trades_with_risk:
-            # ✅ FIX: Ensure proper float conversion and safe comparison
-            valid_trades = []
-            for trade in trades_with_risk:
-                try:
-                    risk_val = float(trade.risk) if trade.risk is not None else 0.0
-                    reward_val = float(trade.reward) if trade.reward is not None else 0.0
-                    if risk_val > 0:
-                        valid_trades.append(reward_val / risk_val)
-                except (ValueError, TypeError, ZeroDivisionError):
-                    continue
-            if valid_trades:
-                risk_reward = round(sum(valid_trades) / len(valid_trades), 2)
         
         # Equity curve data (last 30 days)
         try:
-            last_30_days = datetime.now() - timedelta(days=30)
-            trades_30_days = Trade.query.filter(Trade.date >= last_30_days.date()).order_by(Trade.date).all()
-            equity_curve = []
-            cumulative_pnl = 0
-            for trade in trades_30_days:
-                try:
-                    cumulative_pnl += float(trade.pnl or 0)
-                    equity_curve.append({
-                        'date': trade.date.strftime('%Y-%m-%d'), 
-                        'pnl': round(cumulative_pnl, 2)
-                    })
-                except (ValueError, TypeError, AttributeError):
-                    continue
+            equity_curve = journal_metrics.equity_curve(db, Trade, days=30)
         except Exception as e:
             safe_log_error(f"Error calculating equity curve: {e}")
+            db.session.rollback()
             equity_curve = []
         
-        # Monthly heatmap data (last 12 months)
+        # Monthly heatmap data (last 12 calendar months from the daily rollup)
         try:
-            monthly_heatmap = []
-            for i in range(12):
-                try:
-                    month_start = (datetime.now().replace(day=1) - timedelta(days=30*i)).replace(day=1)
-                    month_end = (month_start + timedelta(days=32)).replace(day=1) - timedelta(days=1)
-                    month_trades = Trade.query.filter(
-                        Trade.date >= month_start.date(), 
-                        Trade.date <= month_end.date()
-                    ).all()
-                    month_pnl = sum(float(t.pnl or 0) for t in month_trades)
-                    monthly_heatmap.append({
-                        'month': month_start.strftime('%b %Y'),
-                        'pnl': round(month_pnl, 2),
-                        'trades': len(month_trades)
-                    })
-                except Exception:
-                    continue
+            if stats is not None:
+                monthly_heatmap = journal_metrics.rollup_monthly(db, TradeDailyPnl)
+            else:
+                monthly_heatmap = journal_metrics.monthly_heatmap(db, Trade)
         except Exception as e:
             safe_log_error(f"Error calculating monthly heatmap: {e}")
+            db.session.rollback()
             monthly_heatmap = []
         
-        # Win/Loss streaks
-        try:
-            current_streak = 0
-            longest_win_streak = 0
-            longest_loss_streak = 0
-            temp_win_streak = 0
-            temp_loss_streak = 0
+        # Win/Loss streaks (full history from the stats row, else the last 10 trades)
+        if 'current_streak' in totals:
+            current_streak = totals['current_streak']
+            longest_win_streak = totals['longest_win_streak']
+            longest_loss_streak = totals['longest_loss_streak']
+        else:
+            try:
+                current_streak = 0
+                longest_win_streak = 0
+                longest_loss_streak = 0
+                temp_win_streak = 0
+                temp_loss_streak = 0
             
-            for trade in reversed(recent_trades):
-                try:
-                    if trade.result == 'win':
-                        temp_win_streak += 1
-                        temp_loss_streak = 0
-                        longest_win_streak = max(longest_win_streak, temp_win_streak)
-                    elif trade.result == 'loss':
-                        temp_loss_streak += 1
-                        temp_win_streak = 0
-                        longest_loss_streak = max(longest_loss_streak, temp_loss_streak)
-                except AttributeError:
-                    continue
+                for trade in reversed(recent_trades):
+                    try:
+                        if trade.result == 'win':
+                            temp_win_streak += 1
+                            temp_loss_streak = 0
+                            longest_win_streak = max(longest_win_streak, temp_win_streak)
+                        elif trade.result == 'loss':
+                            temp_loss_streak += 1
+                            temp_win_streak = 0
+                            longest_loss_streak = max(longest_loss_streak, temp_loss_streak)
+                    except AttributeError:
+                        continue
             
-            current_streak = temp_win_streak if temp_win_streak > 0 else -temp_loss_streak
-        except Exception as e:
-            safe_log_error(f"Error calculating streaks: {e}")
-            current_streak = 0
-            longest_win_streak = 0
-            longest_loss_streak = 0
+                current_streak = temp_win_streak if temp_win_streak > 0 else -temp_loss_streak
+            except Exception as e:
+                safe_log_error(f"Error calculating streaks: {e}")
+                current_streak = 0
+                longest_win_streak = 0
+                longest_loss_streak = 0
         
         # AI insights (mock data for now)
         try:
@@ -1318,6 +1543,7 @@ def dashboard():
             ai_risk_suggestions = []
         
         # Mistake analysis
+        mistakes = []
         try:
             mistake_alerts = []
             mistakes = Mistake.query.all()
@@ -1351,48 +1577,21 @@ def dashboard():
             rule_compliance = 0
         
         # Advanced metrics
-        try:
-            # ✅ FIX: winning_trades and losing_trades are already cast to int above, so comparisons are safe
-            win_trades = Trade.query.filter_by(result='win').all()
-            loss_trades = Trade.query.filter_by(result='loss').all()
-            
-            avg_win = sum(float(t.pnl or 0) for t in win_trades) / winning_trades if winning_trades > 0 else 0
-            avg_loss = abs(sum(float(t.pnl or 0) for t in loss_trades) / losing_trades) if losing_trades > 0 else 0
-        except Exception as e:
-            safe_log_error(f"Error calculating advanced metrics: {e}")
-            avg_win = 0
-            avg_loss = 0
+        avg_win = gross_profit / winning_trades if winning_trades > 0 else 0
+        avg_loss = gross_loss / losing_trades if losing_trades > 0 else 0
         
         # Profit Factor = Gross Profit ÷ Gross Loss
-        try:
-            win_trades = Trade.query.filter_by(result='win').all()
-            loss_trades = Trade.query.filter_by(result='loss').all()
-            
-            gross_profit = sum(float(t.pnl or 0) for t in win_trades)
-            gross_loss = abs(sum(float(t.pnl or 0) for t in loss_trades))
-            profit_factor = gross_profit / gross_loss if gross_loss > 0 else 0
-        except Exception as e:
-            safe_log_error(f"Error calculating profit factor: {e}")
-            profit_factor = 0
+        profit_factor = gross_profit / gross_loss if gross_loss > 0 else 0
         
         # Max Drawdown calculation
         try:
-            all_trades = Trade.query.order_by(Trade.date).all()
-            cumulative_pnl = 0
-            peak = 0
-            max_drawdown = 0
-            for trade in all_trades:
-                try:
-                    cumulative_pnl += float(trade.pnl or 0)
-                    if cumulative_pnl > peak:
-                        peak = cumulative_pnl
-                    drawdown = peak - cumulative_pnl
-                    if drawdown > max_drawdown:
-                        max_drawdown = drawdown
-                except (ValueError, TypeError):
-                    continue
+            if 'max_drawdown' in totals:
+                max_drawdown = totals['max_drawdown']
+            else:
+                max_drawdown = journal_metrics.max_drawdown(db, Trade)
         except Exception as e:
             safe_log_error(f"Error calculating max drawdown: {e}")
+            db.session.rollback()
             max_drawdown = 0
         
         # Expectancy = (Win% × AvgWin) - (Loss% × AvgLoss)
@@ -1428,32 +1627,15 @@ def dashboard():
         avg_holding_time = "2.5 hours"  # Would need entry/exit timestamps
         
         # Best and worst trade symbols
-        try:
-            best_trade = Trade.query.filter_by(result='win').order_by(Trade.pnl.desc()).first()
-            worst_trade = Trade.query.filter_by(result='loss').order_by(Trade.pnl.asc()).first()
-            best_trade_symbol = best_trade.symbol if best_trade else None
-            worst_trade_symbol = worst_trade.symbol if worst_trade else None
-        except Exception as e:
-            safe_log_error(f"Error finding best/worst trades: {e}")
-            best_trade_symbol = None
-            worst_trade_symbol = None
+        best_trade_symbol = totals.get('best_trade_symbol')
+        worst_trade_symbol = totals.get('worst_trade_symbol')
         
-        # Most profitable strategy
+        # Most profitable strategy (one GROUP BY over strategies)
         try:
-            most_profitable_strategy = None
-            best_pnl = float('-inf')
-            strategies = Strategy.query.all()
-            for strategy in strategies:
-                try:
-                    strategy_trades = Trade.query.filter_by(strategy_id=strategy.id).all()
-                    strategy_pnl = sum(float(t.pnl or 0) for t in strategy_trades)
-                    if strategy_pnl > best_pnl:
-                        best_pnl = strategy_pnl
-                        most_profitable_strategy = {'name': strategy.name, 'pnl': strategy_pnl}
-                except Exception:
-                    continue
+            most_profitable_strategy = journal_metrics.most_profitable_strategy(db, Trade, Strategy)
         except Exception as e:
             safe_log_error(f"Error finding most profitable strategy: {e}")
+            db.session.rollback()
             most_profitable_strategy = None
         
         # Challenge progress
@@ -1481,14 +1663,10 @@ def dashboard():
         
         # Reports snapshot
         try:
-            last_7_days = datetime.now() - timedelta(days=7)
-            week_trades = Trade.query.filter(Trade.date >= last_7_days.date()).all()
-            week_pnl = sum(float(t.pnl or 0) for t in week_trades)
-            
             reports_snapshot = {
                 'period': 'Last 7 days',
-                'trades': len(week_trades),
-                'pnl': week_pnl
+                'trades': totals.get('week_trades', 0),
+                'pnl': totals.get('week_pnl', 0)
             }
         except Exception as e:
             safe_log_error(f"Error calculating reports snapshot: {e}")
@@ -1571,7 +1749,7 @@ def dashboard():
             
             # Other data
             strategies=Strategy.query.all() if db else [],
-            mistakes=Mistake.query.all() if db else [],
+            mistakes=mistakes,
             now=datetime.now()
         )
     except Exception as e:
@@ -1586,17 +1764,104 @@ def dashboard():
         )
 
 
+# ---------------- TRADE LISTING ---------------- #
+TRADES_PAGE_SIZE = 100
+TRADES_PAGE_MAX = 500
+
+# sort name -> (key column, descending); every sort is tie-broken on Trade.id
+TRADE_SORTS = {
+    'date-desc': ('date', True),
+    'date-asc': ('date', False),
+    'pnl-desc': ('pnl', True),
+    'pnl-asc': ('pnl', False),
+}
+
+
+def _encode_trade_cursor(value, trade_id):
+    raw = json.dumps([value.isoformat() if isinstance(value, datetime) else value, trade_id])
+    return base64.urlsafe_b64encode(raw.encode()).decode().rstrip('=')
+
+
+def _decode_trade_cursor(cursor, key):
+    """(key value, trade id) of the last row of the previous page; ValueError if malformed"""
+    try:
+        value, trade_id = json.loads(base64.urlsafe_b64decode(cursor + '=' * (-len(cursor) % 4)))
+        value = datetime.fromisoformat(value) if key == 'date' else float(value)
+        return value, int(trade_id)
+    except (TypeError, ValueError) as e:
+        raise ValueError(f"Invalid cursor: {cursor}") from e
+
+
+def trade_page(limit=TRADES_PAGE_SIZE, cursor=None, sort='date-desc', result=None):
+    """
+    One keyset page of trades as dicts, plus the cursor for the next page (None
+    on the last page). Only the listed columns are selected and the strategy
+    name comes from a join, so each page is a single index range scan no matter
+    how deep into the journal it is.
+    """
+    key, descending = TRADE_SORTS.get(sort, TRADE_SORTS['date-desc'])
+    key_col = getattr(Trade, key)
+    query = db.session.query(
+        Trade.id, Trade.date, Trade.symbol, Trade.trade_type, Trade.entry_price, Trade.exit_price,
+        Trade.quantity, Trade.pnl, Trade.result, Trade.notes,
+        Strategy.id.label('strategy_id'), Strategy.name.label('strategy_name'),
+    ).outerjoin(Strategy, Trade.strategy_id == Strategy.id)
+
+    if result:
+        query = query.filter(Trade.result == result)
+    if cursor:
+        value, last_id = _decode_trade_cursor(cursor, key)
+        position, after = db.tuple_(key_col, Trade.id), db.tuple_(value, last_id)
+        query = query.filter(position < after if descending else position > after)
+
+    if descending:
+        query = query.order_by(key_col.desc(), Trade.id.desc())
+    else:
+        query = query.order_by(key_col.asc(), Trade.id.asc())
+    rows = query.limit(limit + 1).all()
+
+    next_cursor = None
+    if len(rows) > limit:
+        rows = rows[:limit]
+        next_cursor = _encode_trade_cursor(getattr(rows[-1], key), rows[-1].id)
+
+    trades = [{
+        'id': r.id,
+        'symbol': r.symbol,
+        'entry_price': r.entry_price,
+        'exit_price': r.exit_price,
+        'quantity': r.quantity,
+        'date': r.date.strftime('%Y-%m-%d'),
+        'result': r.result,
+        'pnl': r.pnl,
+        'notes': r.notes,
+        'trade_type': r.trade_type,
+        'strategy': {'id': r.strategy_id, 'name': r.strategy_name} if r.strategy_id is not None else None
+    } for r in rows]
+    return trades, next_cursor
+
+
 @calculatentrade_bp.route('/trades')
 @subscription_required_journal
 def get_trades():
-    trades = Trade.query.order_by(Trade.date.desc()).all()
+    # First page only; the table fetches the rest from /api/trades after render
+    trades, next_cursor = trade_page()
     strategies = Strategy.query.all()
     
-    # Calculate stats for the template
-    total_trades = len(trades)
-    total_pnl = sum(t.pnl for t in trades) if trades else 0
-    winning_trades = len([t for t in trades if t.pnl > 0])
-    losing_trades = len([t for t in trades if t.pnl < 0])
+    # Stats for the template from the maintained stats row
+    stats = current_trade_stats()
+    if stats is not None:
+        total_trades = stats.trade_count or 0
+        total_pnl = stats.total_pnl or 0
+        winning_trades = stats.positive_count or 0
+        losing_trades = stats.negative_count or 0
+    else:
+        total_trades, total_pnl, winning_trades, losing_trades = db.session.query(
+            db.func.count(Trade.id),
+            db.func.coalesce(db.func.sum(Trade.pnl), 0),
+            db.func.coalesce(db.func.sum(db.case((Trade.pnl > 0, 1), else_=0)), 0),
+            db.func.coalesce(db.func.sum(db.case((Trade.pnl < 0, 1), else_=0)), 0),
+        ).one()
     win_rate = (winning_trades / total_trades * 100) if total_trades > 0 else 0
     
     # Detect mobile device from user agent
@@ -1615,6 +1880,8 @@ def get_trades():
     
     return render_template(template, 
                          trades=trades, 
+                         next_cursor=next_cursor,
+                         trades_page_size=TRADES_PAGE_MAX,
                          strategies=strategies,
                          total_trades=total_trades,
                          total_pnl=total_pnl,
@@ -1627,39 +1894,28 @@ def get_trades():
 # ---------------- API ROUTES ---------------- #
 @calculatentrade_bp.route('/api/trades', methods=['GET'])
 def api_get_trades():
+    """
+    Trades one keyset page at a time: ?limit=N (max TRADES_PAGE_MAX) and
+    ?cursor=<next_cursor from the previous page>, with the existing filter/sort.
+    """
     filter_type = request.args.get('filter', 'all')
     sort = request.args.get('sort', 'date-desc')
-    query = Trade.query
-
-    # Filter
-    if filter_type in ['win', 'loss']:
-        query = query.filter_by(result=filter_type)
-
-    # Sorting
-    if sort == 'date-asc':
-        query = query.order_by(Trade.date.asc())
-    elif sort == 'pnl-desc':
-        query = query.order_by(Trade.pnl.desc())
-    elif sort == 'pnl-asc':
-        query = query.order_by(Trade.pnl.asc())
-    else:  # default newest first
-        query = query.order_by(Trade.date.desc())
+    try:
+        limit = min(max(int(request.args.get('limit', TRADES_PAGE_SIZE)), 1), TRADES_PAGE_MAX)
+    except ValueError:
+        return jsonify({'error': 'limit must be an integer'}), 400
 
-    trades = [{
-        'id': t.id,
-        'symbol': t.symbol,
-        'entry_price': t.entry_price,
-        'exit_price': t.exit_price,
-        'quantity': t.quantity,
-        'date': t.date.strftime('%Y-%m-%d'),
-        'result': t.result,
-        'pnl': t.pnl,
-        'notes': t.notes,
-        'trade_type': t.trade_type,
-        'strategy': {'id': t.strategy.id, 'name': t.strategy.name} if t.strategy else None
-    } for t in query.all()]
+    try:
+        trades, next_cursor = trade_page(
+            limit=limit,
+            cursor=request.args.get('cursor'),
+            sort=sort,
+            result=filter_type if filter_type in ['win', 'loss'] else None,
+        )
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
 
-    return jsonify({'trades': trades})
+    return jsonify({'trades': trades, 'next_cursor': next_cursor})
 
 
 @calculatentrade_bp.route('/api/trades/<int:trade_id>', methods=['GET'])
@@ -1870,7 +2126,7 @@ def api_get_strategy(strategy_id):
 @calculatentrade_bp.route('/strategies')
 @subscription_required_journal
 def get_strategies():
-    strategies = Strategy.query.all()
+    strategies = Strategy.load_aggregates(Strategy.query.all())
     enriched_strategies = []
     for s in strategies:
         enriched_strategies.append({
@@ -2858,7 +3114,10 @@ def api_get_challenge_progress(challenge_id):
 @calculatentrade_bp.route("/api/challenges/<int:challenge_id>/calendar", methods=["GET"])
 def api_get_challenge_calendar(challenge_id):
     c = Challenge.query.get_or_404(challenge_id)
-    trades = {t.trade_date.isoformat(): t.pnl for t in c.trades.all()}
+    days = db.session.query(ChallengeTrade.trade_date, db.func.sum(ChallengeTrade.pnl)) \
+        .filter(ChallengeTrade.challenge_id == c.id) \
+        .group_by(ChallengeTrade.trade_date).all()
+    trades = {day.isoformat(): pnl for day, pnl in days}
     moods = {m.date.isoformat(): m.mood for m in c.moods.all()}
     
     calendar_data = []
@@ -2901,63 +3160,20 @@ def api_reports_summary():
     except ValueError:
         return jsonify({"error": "Invalid date format"}), 400
 
-    query = Trade.query.filter(Trade.date >= start_date, Trade.date <= end_date)
-    if strategy_id:
-        query = query.filter(Trade.strategy_id == strategy_id)
-    if symbol:
-        query = query.filter(Trade.symbol.ilike(f"%{symbol}%"))
-    if trade_type:
-        query = query.filter(Trade.trade_type == trade_type)
-    
-    trades = query.order_by(Trade.date).all()
-    
-    if not trades:
-        return jsonify({
-            "total_pnl": 0, "win_rate": 0, "total_trades": 0, "avg_rr": 0,
-            "expectancy": 0, "profit_factor": 0, "max_drawdown": 0, "avg_hold_time": 0
-        })
-
-    total_trades = len(trades)
-    total_pnl = sum(t.pnl for t in trades)
-    wins = [t for t in trades if t.pnl > 0]
-    losses = [t for t in trades if t.pnl < 0]
-    
-    win_rate = (len(wins) / total_trades) * 100 if total_trades else 0
-    avg_win = sum(t.pnl for t in wins) / len(wins) if wins else 0
-    avg_loss = abs(sum(t.pnl for t in losses) / len(losses)) if losses else 0
-    
-    # Expectancy = (Win% × AvgWin) – (Loss% × AvgLoss)
-    expectancy = (win_rate/100 * avg_win) - ((100-win_rate)/100 * avg_loss)
-    
-    # Profit Factor = Gross Profit ÷ Gross Loss
-    gross_profit = sum(t.pnl for t in wins)
-    gross_loss = abs(sum(t.pnl for t in losses))
-    profit_factor = gross_profit / gross_loss if gross_loss > 0 else 0
-    
-    # Max Drawdown calculation
-    cumulative_pnl = 0
-    peak = 0
-    max_drawdown = 0
-    for trade in trades:
-        cumulative_pnl += trade.pnl
-        if cumulative_pnl > peak:
-            peak = cumulative_pnl
-        drawdown = peak - cumulative_pnl
-        if drawdown > max_drawdown:
-            max_drawdown = drawdown
-    
-    # R-Multiple calculation
-    rr_trades = [t for t in trades if t.risk and t.reward and t.risk > 0]
-    avg_rr = sum(t.reward / t.risk for t in rr_trades) / len(rr_trades) if rr_trades else 0
+    series = trade_analytics.load_series(db, Trade, start_date, end_date,
+                                         strategy_id=strategy_id, symbol=symbol, trade_type=trade_type)
+    summary = trade_analytics.summarize(series)
     
     return jsonify({
-        "total_pnl": round(total_pnl, 2),
-        "win_rate": round(win_rate, 2),
-        "total_trades": total_trades,
-        "avg_rr": round(avg_rr, 2),
-        "expectancy": round(expectancy, 2),
-        "profit_factor": round(profit_factor, 2),
-        "max_drawdown": round(max_drawdown, 2),
+        "total_pnl": round(summary["total_pnl"], 2),
+        "win_rate": round(summary["win_rate"], 2),
+        "total_trades": summary["total_trades"],
+        "avg_rr": round(summary["avg_rr"], 2),
+        "expectancy": round(summary["expectancy"], 2),
+        "profit_factor": round(summary["profit_factor"], 2),
+        "max_drawdown": round(summary["max_drawdown"], 2),
+        "sharpe_ratio": round(summary["sharpe_ratio"], 2),
+        "sortino_ratio": round(summary["sortino_ratio"], 2),
         "avg_hold_time": 0  # Placeholder - would need entry/exit timestamps
     })
 
@@ -2969,25 +3185,29 @@ def api_reports_equity_curve():
     start_date = datetime.strptime(start_date_str, "%Y-%m-%d")
     end_date = datetime.strptime(end_date_str, "%Y-%m-%d")
     
-    trades = Trade.query.filter(Trade.date >= start_date, Trade.date <= end_date).order_by(Trade.date).all()
+    max_points = request.args.get("max_points", trade_analytics.EQUITY_CURVE_MAX_POINTS, type=int)
     
-    equity_data = []
-    cumulative_pnl = 0
-    peak = 0
+    series = trade_analytics.load_series(db, Trade, start_date, end_date)
+    equity = trade_analytics.equity_curve(series.pnl)
+    drawdown = trade_analytics.drawdown(equity)
+    # Bounded payload; troughs and highs are kept exactly
+    idx = trade_analytics.downsample_indices(equity, max_points)
     
-    for trade in trades:
-        cumulative_pnl += trade.pnl
-        if cumulative_pnl > peak:
-            peak = cumulative_pnl
-        drawdown = peak - cumulative_pnl
-        
-        equity_data.append({
-            "date": trade.date.strftime("%Y-%m-%d"),
-            "equity": round(cumulative_pnl, 2),
-            "drawdown": round(drawdown, 2)
-        })
+    equity_data = [
+        {"date": day, "equity": round(float(eq), 2), "drawdown": round(float(dd), 2)}
+        for day, eq, dd in zip(series.day_strings[idx].tolist(), equity[idx].tolist(), drawdown[idx].tolist())
+    ]
+    
+    # Optional trailing-window risk ratios, e.g. ?window=20
+    window = request.args.get("window", type=int)
+    if window:
+        sharpe = trade_analytics.rolling_sharpe(series.pnl, window)[idx]
+        sortino = trade_analytics.rolling_sortino(series.pnl, window)[idx]
+        for point, sh, so in zip(equity_data, sharpe.tolist(), sortino.tolist()):
+            point["rolling_sharpe"] = None if sh != sh else round(sh, 3)
+            point["rolling_sortino"] = None if so != so else round(so, 3)
     
-    return jsonify({"equity_curve": equity_data})
+    return jsonify({"equity_curve": equity_data, "total_points": len(series)})
 
 @calculatentrade_bp.route('/api/reports/r_multiples_hist')
 def api_reports_r_multiples():
@@ -2997,30 +3217,11 @@ def api_reports_r_multiples():
     start_date = datetime.strptime(start_date_str, "%Y-%m-%d")
     end_date = datetime.strptime(end_date_str, "%Y-%m-%d")
     
-    trades = Trade.query.filter(Trade.date >= start_date, Trade.date <= end_date).all()
+    series = trade_analytics.load_series(db, Trade, start_date, end_date)
     
-    # Calculate R-multiples (using PnL as proxy if risk/reward not available)
-    r_multiples = []
-    for trade in trades:
-        if trade.risk and trade.risk > 0:
-            r_multiple = trade.pnl / trade.risk
-        else:
-            # Fallback: normalize PnL to approximate R-multiple
-            r_multiple = trade.pnl / 100 if trade.pnl else 0
-        r_multiples.append(r_multiple)
-    
-    # Create histogram bins
-    bins = [-3, -2, -1, 0, 1, 2, 3, 4, 5]
-    histogram = [0] * (len(bins) - 1)
-    
-    for r in r_multiples:
-        for i in range(len(bins) - 1):
-            if bins[i] <= r < bins[i + 1]:
-                histogram[i] += 1
-                break
-        else:
-            if r >= bins[-1]:
-                histogram[-1] += 1
+    # R-multiples (PnL / 100 as a proxy when risk is not recorded)
+    bins = trade_analytics.R_MULTIPLE_BINS
+    histogram = trade_analytics.r_multiple_histogram(trade_analytics.r_multiples(series), bins)
     
     return jsonify({
         "bins": [f"{bins[i]:.1f} to {bins[i+1]:.1f}" for i in range(len(bins)-1)],
@@ -3140,18 +3341,23 @@ def api_reports_calendar():
     start_date = datetime.strptime(start_date_str, "%Y-%m-%d")
     end_date = datetime.strptime(end_date_str, "%Y-%m-%d")
     
-    trades = Trade.query.filter(Trade.date >= start_date, Trade.date <= end_date).all()
+    rollup = daily_rollup(start_date.date(), end_date.date())
+    if rollup is None:
+        return jsonify({"error": "Trade statistics unavailable"}), 500
+    daily_pnl = {
+        day.strftime("%Y-%m-%d"): {"pnl": row.pnl or 0, "trades": row.trade_count or 0, "notes": []}
+        for day, row in rollup.items() if row.trade_count
+    }
     
-    # Group trades by date
-    daily_pnl = {}
-    for trade in trades:
-        date_str = trade.date.strftime("%Y-%m-%d")
-        if date_str not in daily_pnl:
-            daily_pnl[date_str] = {"pnl": 0, "trades": 0, "notes": []}
-        daily_pnl[date_str]["pnl"] += trade.pnl
-        daily_pnl[date_str]["trades"] += 1
-        if trade.notes:
-            daily_pnl[date_str]["notes"].append(trade.notes)
+    # Notes still come from the trades, but only the two columns needed
+    notes = db.session.query(Trade.date, Trade.notes).filter(
+        Trade.date >= start_date, Trade.date < end_date + timedelta(days=1),
+        Trade.notes.isnot(None), Trade.notes != ''
+    ).order_by(Trade.date, Trade.id).all()
+    for trade_date, note in notes:
+        day_data = daily_pnl.get(trade_date.strftime("%Y-%m-%d"))
+        if day_data is not None:
+            day_data["notes"].append(note)
     
     calendar_data = []
     current_date = start_date
@@ -3170,22 +3376,118 @@ def api_reports_calendar():
     return jsonify({"calendar": calendar_data})
 
 
+# Report views that can also run as 'report' jobs for long date ranges
+REPORT_JOB_VIEWS = {
+    'summary': api_reports_summary,
+    'equity_curve': api_reports_equity_curve,
+    'r_multiples_hist': api_reports_r_multiples,
+    'trades': api_reports_trades,
+    'by_strategy': api_reports_by_strategy,
+    'by_symbol': api_reports_by_symbol,
+    'calendar': api_reports_calendar,
+}
+
+
+@job_queue.job_handler('report')
+def run_report_job(ctx, payload):
+    """Run a report view in the worker with the query string the page would have sent"""
+    report = payload.get('report')
+    view = REPORT_JOB_VIEWS.get(report)
+    if view is None:
+        raise ValueError(f"Unknown report: {report}")
+    ctx.progress(5, f"Building {report} report")
+    with current_app.test_request_context(query_string=payload.get('args') or {}):
+        response = current_app.make_response(view())
+    if response.status_code >= 400:
+        raise RuntimeError((response.get_json(silent=True) or {}).get('error') or f"HTTP {response.status_code}")
+    return response.get_json()
+
+
+@calculatentrade_bp.route('/api/jobs/report', methods=['POST'])
+def api_enqueue_report_job():
+    """{"report": "<REPORT_JOB_VIEWS key>", "args": {"start": ..., "end": ..., ...}}"""
+    data = request.get_json() or {}
+    if data.get('report') not in REPORT_JOB_VIEWS:
+        return jsonify({'ok': False, 'message': f"report must be one of {', '.join(REPORT_JOB_VIEWS)}"}), 400
+    args = {k: str(v) for k, v in (data.get('args') or {}).items() if v is not None}
+    return enqueue_job_response('report', {'report': data['report'], 'args': args})
+
+
+# ---------------- BACKGROUND JOBS API ---------------- #
+
+# Bulk job results keep at most this many per-row results
+JOB_RESULT_ROWS = int(os.getenv("JOB_RESULT_ROWS", "500"))
+
+
+def enqueue_job_response(kind, payload):
+    """Queue a job and answer 202 with the URL to poll"""
+    try:
+        job = job_queue.enqueue(db, BackgroundJob, kind, payload)
+    except Exception as e:
+        db.session.rollback()
+        safe_log_error(f"Failed to queue {kind} job: {e}")
+        return jsonify({'ok': False, 'success': False, 'message': f'Could not queue job: {e}'}), 500
+    return jsonify({
+        'ok': True,
+        'success': True,
+        'job_id': job.id,
+        'status': job.status,
+        'status_url': url_for('calculatentrade.api_get_job', job_id=job.id),
+        'message': 'Job queued'
+    }), 202
+
+
+@calculatentrade_bp.route('/api/jobs/<int:job_id>', methods=['GET'])
+def api_get_job(job_id):
+    """Status, progress and (once finished) result of a background job"""
+    job = BackgroundJob.query.get_or_404(job_id)
+    return jsonify({'ok': True, 'data': job.to_dict()})
+
+
+@calculatentrade_bp.route('/api/jobs/<int:job_id>/cancel', methods=['POST'])
+def api_cancel_job(job_id):
+    try:
+        job = job_queue.cancel(db, BackgroundJob, job_id)
+    except Exception as e:
+        db.session.rollback()
+        return jsonify({'ok': False, 'message': str(e)}), 500
+    if job is None:
+        return jsonify({'ok': False, 'message': 'Job not found'}), 404
+    if job.status in job_queue.FINISHED and job.status != job_queue.CANCELLED:
+        return jsonify({'ok': False, 'message': f'Job already {job.status}', 'data': job.to_dict()}), 409
+    return jsonify({'ok': True, 'data': job.to_dict(include_result=False)})
+
+
+@calculatentrade_bp.route('/api/jobs', methods=['GET'])
+def api_list_jobs():
+    """Recent jobs, newest first; ?status=running&kind=backtest&limit=50"""
+    query = BackgroundJob.query
+    if request.args.get('status'):
+        query = query.filter(BackgroundJob.status == request.args['status'])
+    if request.args.get('kind'):
+        query = query.filter(BackgroundJob.kind == request.args['kind'])
+    limit = min(max(request.args.get('limit', 50, type=int), 1), 200)
+    jobs = query.order_by(BackgroundJob.created_at.desc(), BackgroundJob.id.desc()).limit(limit).all()
+    return jsonify({'ok': True, 'data': [job.to_dict(include_result=False) for job in jobs]})
+
+
 # ---------------- MISSING API ENDPOINTS ---------------- #
 
 @calculatentrade_bp.route('/api/stats', methods=['GET'])
 def api_get_stats():
     """Get trading statistics for dashboard updates"""
     try:
-        trades = Trade.query.all()
-        total_trades = len(trades)
-        total_pnl = sum(t.pnl for t in trades) if trades else 0
-        winning_trades = len([t for t in trades if t.pnl > 0])
-        losing_trades = len([t for t in trades if t.pnl < 0])
+        stats = current_trade_stats()
+        if stats is None:
+            return jsonify({'error': 'Trade statistics unavailable'}), 500
+        total_trades = stats.trade_count
+        winning_trades = stats.positive_count
+        losing_trades = stats.negative_count
         win_rate = (winning_trades / total_trades * 100) if total_trades > 0 else 0
         
         return jsonify({
             'total_trades': total_trades,
-            'total_pnl': total_pnl,
+            'total_pnl': stats.total_pnl,
             'winning_trades': winning_trades,
             'losing_trades': losing_trades,
             'win_rate': win_rate
@@ -3197,8 +3499,10 @@ def api_get_stats():
 def api_get_analytics():
     """Get advanced analytics data"""
     try:
-        trades = Trade.query.all()
-        if not trades:
+        stats = current_trade_stats()
+        if stats is None:
+            return jsonify({'error': 'Trade statistics unavailable'}), 500
+        if not stats.trade_count:
             return jsonify({
                 'avg_win': 0,
                 'avg_loss': 0,
@@ -3210,54 +3514,30 @@ def api_get_analytics():
                 'most_traded': None
             })
         
-        wins = [t for t in trades if t.pnl > 0]
-        losses = [t for t in trades if t.pnl < 0]
-        
-        avg_win = sum(t.pnl for t in wins) / len(wins) if wins else 0
-        avg_loss = sum(t.pnl for t in losses) / len(losses) if losses else 0
-        
-        gross_profit = sum(t.pnl for t in wins)
-        gross_loss = abs(sum(t.pnl for t in losses))
-        profit_factor = gross_profit / gross_loss if gross_loss > 0 else 0
+        avg_win = stats.gross_profit / stats.positive_count if stats.positive_count else 0
+        avg_loss = -stats.gross_loss / stats.negative_count if stats.negative_count else 0
+        profit_factor = stats.gross_profit / stats.gross_loss if stats.gross_loss > 0 else 0
         
-        # Calculate max drawdown
-        cumulative_pnl = 0
-        peak = 0
-        max_drawdown = 0
-        for trade in sorted(trades, key=lambda x: x.date):
-            cumulative_pnl += trade.pnl
-            if cumulative_pnl > peak:
-                peak = cumulative_pnl
-            drawdown = peak - cumulative_pnl
-            if drawdown > max_drawdown:
-                max_drawdown = drawdown
-        
-        # Simple Sharpe ratio calculation
-        pnl_values = [t.pnl for t in trades]
-        avg_return = sum(pnl_values) / len(pnl_values)
-        std_dev = (sum((x - avg_return) ** 2 for x in pnl_values) / len(pnl_values)) ** 0.5
+        # Simple Sharpe ratio from the running sum and sum of squares
+        avg_return = stats.total_pnl / stats.trade_count
+        variance = max(stats.sum_pnl_sq / stats.trade_count - avg_return ** 2, 0)
+        std_dev = variance ** 0.5
         sharpe_ratio = avg_return / std_dev if std_dev > 0 else 0
         
-        # Symbol analysis
-        symbol_stats = {}
-        for trade in trades:
-            if trade.symbol not in symbol_stats:
-                symbol_stats[trade.symbol] = {'pnl': 0, 'count': 0}
-            symbol_stats[trade.symbol]['pnl'] += trade.pnl
-            symbol_stats[trade.symbol]['count'] += 1
-        
-        best_symbol = max(symbol_stats.items(), key=lambda x: x[1]['pnl'])[0] if symbol_stats else None
-        most_traded = max(symbol_stats.items(), key=lambda x: x[1]['count'])[0] if symbol_stats else None
-        
-        total_volume = sum(t.quantity for t in trades)
+        # Symbol analysis (one GROUP BY)
+        symbol_stats = db.session.query(
+            Trade.symbol, db.func.sum(Trade.pnl), db.func.count(Trade.id)
+        ).group_by(Trade.symbol).all()
+        best_symbol = max(symbol_stats, key=lambda x: x[1])[0] if symbol_stats else None
+        most_traded = max(symbol_stats, key=lambda x: x[2])[0] if symbol_stats else None
         
         return jsonify({
             'avg_win': avg_win,
             'avg_loss': avg_loss,
             'profit_factor': profit_factor,
-            'max_drawdown': max_drawdown,
+            'max_drawdown': stats.max_drawdown,
             'sharpe_ratio': sharpe_ratio,
-            'total_volume': total_volume,
+            'total_volume': stats.total_volume,
             'best_symbol': best_symbol,
             'most_traded': most_traded
         })
@@ -3391,7 +3671,7 @@ def create_strategy():
 def api_strategies():
     if request.method == 'GET':
         try:
-            strategies = Strategy.query.order_by(Strategy.created_at.desc()).all()
+            strategies = Strategy.load_aggregates(Strategy.query.order_by(Strategy.created_at.desc()).all())
             return jsonify({
                 'success': True,
                 'strategies': [{
@@ -4095,7 +4375,7 @@ def legacy_kite_callback():
         if not creds:
             return f"No stored credentials for user {user_id}. Please register your Kite app first.", 400
         
-        kite = KiteConnect(api_key=creds["api_key"])
+        kite = pooled(KiteConnect(api_key=creds["api_key"]), "kite")
         try:
             data = kite.generate_session(request_token, api_secret=creds["api_secret"])
             session_data = {
@@ -4268,7 +4548,7 @@ def angel_login_password():
 
     # Try SDK login
     try:
-        smart = SmartConnect(api_key=creds["api_key"])
+        smart = pooled(SmartConnect(api_key=creds["api_key"]), "angel")
         data = smart.generateSession(clientCode=client_code, password=password, totp=totp)
 
         if isinstance(data, dict) and data.get("errorcode"):
@@ -4368,7 +4648,7 @@ def _connect_kite(user_id, creds):
     if not KiteConnect:
         return jsonify({"ok": False, "message": "KiteConnect SDK not installed"}), 500
     
-    kite = KiteConnect(api_key=creds["api_key"])
+    kite = pooled(KiteConnect(api_key=creds["api_key"]), "kite")
     login_url = kite.login_url()
     
     # Store temporary state for verification
@@ -4482,7 +4762,7 @@ def kite_login():
     
     session["kite_user_id"] = user_id
     creds = USER_APPS["kite"][user_id]
-    kite = KiteConnect(api_key=creds["api_key"])
+    kite = pooled(KiteConnect(api_key=creds["api_key"]), "kite")
     login_url = kite.login_url()
     sep = "&" if "?" in login_url else "?"
     return redirect(f"{login_url}{sep}state={user_id}")
@@ -4495,12 +4775,11 @@ def dhan_login():
     if not user_id:
         return jsonify({"ok": False, "message": "user_id required"}), 400
 
-    # If missing in-memory, try to reload persisted accounts (helps after restarts)
-    if user_id not in USER_APPS.get("dhan", {}):
-        try:
-            load_persisted_accounts_into_memory()
-        except Exception:
-            app.logger.exception("Failed to resync accounts while handling dhan/login")
+    # Pick up credentials registered in another worker or before a restart
+    try:
+        ensure_account_loaded("dhan", user_id)
+    except Exception:
+        current_app.logger.exception("Failed to load account while handling dhan/login")
 
     creds = USER_APPS["dhan"].get(user_id)
     if not creds:
@@ -4576,7 +4855,7 @@ def kite_auth_callback():
             return render_template("multi_broker_connect.html", now=datetime.now(),
                                    broker_status={"ok": False, "broker": "kite", "message": "No app credentials registered for this user"})
 
-        kite = KiteConnect(api_key=creds["api_key"])
+        kite = pooled(KiteConnect(api_key=creds["api_key"]), "kite")
         data = kite.generate_session(request_token, api_secret=creds["api_secret"])
 
         access_token = data.get("access_token")
@@ -4737,6 +5016,7 @@ def api_delete_account(broker, user_id):
 
     USER_APPS.get(broker, {}).pop(user_id, None)
     USER_SESSIONS.get(broker, {}).pop(user_id, None)
+    broker_clients.evict(broker, user_id)
     return jsonify({"ok": True, "message": f"Deleted {broker}/{user_id}"})
 
 
@@ -4781,9 +5061,9 @@ def broker_status():
     if broker not in ["kite", "dhan", "angel"]:
         return jsonify({"connected": False, "message": "Unsupported broker"})
     
-    # Load persisted accounts first
+    # Load this account's persisted row first
     try:
-        load_persisted_accounts_into_memory()
+        ensure_account_loaded(broker, user_id)
     except Exception as e:
         current_app.logger.error(f"Failed to load accounts: {e}")
     
@@ -4863,11 +5143,20 @@ def api_get_all_broker_data():
             if sess and sess.get("access_token"):
                 try:
                     if make_dhan_client:
-                        client = make_dhan_client(sess.get("dhan_client_id", user_id), sess["access_token"])
+                        client = cached_dhan_client(user_id, sess.get("dhan_client_id", user_id), sess["access_token"])
+                        
+                        # Orders, positions and trades are fetched side by side
+                        fetched = broker_fanout.fan_out({
+                            'orders': client.get_order_list if hasattr(client, 'get_order_list') else list,
+                            'positions': client.get_positions if hasattr(client, 'get_positions') else list,
+                            'trades': client.get_trade_book if hasattr(client, 'get_trade_book') else list,
+                        })
+                        if fetched.errors:
+                            all_data['errors'] = fetched.errors
                         
                         # Get orders with proper error handling
                         try:
-                            orders = client.get_order_list() if hasattr(client, 'get_order_list') else []
+                            orders = fetched.result('orders')
                             all_data['orders'] = orders if orders else []
                         except Exception as e:
                             safe_log_error(f"Error fetching Dhan orders: {e}")
@@ -4875,7 +5164,7 @@ def api_get_all_broker_data():
                         
                         # Get positions with proper error handling
                         try:
-                            positions = client.get_positions() if hasattr(client, 'get_positions') else []
+                            positions = fetched.result('positions')
                             all_data['positions'] = positions if positions else []
                         except Exception as e:
                             safe_log_error(f"Error fetching Dhan positions: {e}")
@@ -4883,7 +5172,7 @@ def api_get_all_broker_data():
                         
                         # Get trades with proper error handling and price normalization
                         try:
-                            trades = client.get_trade_book() if hasattr(client, 'get_trade_book') else []
+                            trades = fetched.result('trades')
                             safe_log_error(f"Dhan raw trades response: {trades}")
                             
                             if trades:
@@ -4977,16 +5266,25 @@ def api_get_all_broker_data():
                     if KiteConnect:
                         kite = get_kite_for_user(user_id, sess["access_token"])
                         
+                        # Orders, trades and positions are fetched side by side
+                        fetched = broker_fanout.fan_out({
+                            'orders': kite.orders,
+                            'trades': kite.trades,
+                            'positions': kite.positions,
+                        })
+                        if fetched.errors:
+                            all_data['errors'] = fetched.errors
+                        
                         # Get orders with error handling
                         try:
-                            all_data['orders'] = kite.orders() or []
+                            all_data['orders'] = fetched.result('orders') or []
                         except Exception as e:
                             safe_log_error(f"Error fetching Kite orders: {e}")
                             all_data['orders'] = []
                         
                         # Get trades with error handling and price normalization
                         try:
-                            trades = kite.trades() or []
+                            trades = fetched.result('trades') or []
                             safe_log_error(f"Kite raw trades response: {trades}")
                             
                             if trades:
@@ -5061,7 +5359,7 @@ def api_get_all_broker_data():
                         
                         # Get positions with error handling
                         try:
-                            positions = kite.positions() or {}
+                            positions = fetched.result('positions') or {}
                             all_data['positions'] = positions.get('day', []) + positions.get('net', [])
                         except Exception as e:
                             safe_log_error(f"Error fetching Kite positions: {e}")
@@ -5108,15 +5406,13 @@ def api_debug_import_data():
             'error': str(e)
         })
 
-@calculatentrade_bp.route('/api/broker/import-trade', methods=['POST'])
-def api_import_broker_trade():
-    """Import a trade from broker to journal"""
+def import_broker_trade(data):
+    """Create a journal trade from one broker order row; returns a result dict"""
     try:
-        data = request.get_json()
         safe_log_error(f"Import trade request data: {data}")
         
         if not data:
-            return jsonify({'success': False, 'message': 'No data provided'})
+            return {'success': False, 'message': 'No data provided'}
         
         # Extract trade data with better error handling for different brokers
         symbol = data.get('symbol', '').strip().upper()
@@ -5166,22 +5462,22 @@ def api_import_broker_trade():
         
         # Validate required fields
         if not symbol:
-            return jsonify({
+            return {
                 'success': False, 
                 'message': 'Symbol is required'
-            })
+            }
             
         if quantity <= 0:
-            return jsonify({
+            return {
                 'success': False, 
                 'message': f'Invalid quantity: {quantity}. Must be greater than 0.'
-            })
+            }
             
         if price <= 0:
-            return jsonify({
+            return {
                 'success': False, 
                 'message': f'Invalid price: {price}. Must be greater than 0.'
-            })
+            }
         
         # Parse date
         trade_date = datetime.now()
@@ -5238,24 +5534,62 @@ def api_import_broker_trade():
         
         safe_log_error(f"Trade imported successfully with ID: {trade.id}")
         
-        return jsonify({
+        return {
             'success': True,
             'message': f'Trade imported successfully! Entry and exit prices are set to {price}. You can edit them in the trades journal.',
             'trade_id': trade.id,
             'symbol': symbol,
             'quantity': quantity,
             'price': price
-        })
+        }
         
     except Exception as e:
         db.session.rollback()
         safe_log_error(f"Error importing broker trade: {e}")
         import traceback
         safe_log_error(f"Import trade error traceback: {traceback.format_exc()}")
-        return jsonify({
+        return {
             'success': False,
             'message': f'Import failed: {str(e)}'
-        })
+        }
+
+
+@calculatentrade_bp.route('/api/broker/import-trade', methods=['POST'])
+def api_import_broker_trade():
+    """Queue the import of a trade from broker to journal (job kind 'broker_import')"""
+    data = request.get_json()
+    if not data:
+        return jsonify({'success': False, 'message': 'No data provided'})
+    return enqueue_job_response('broker_import', {'trades': [data]})
+
+
+@calculatentrade_bp.route('/api/broker/import-trades', methods=['POST'])
+def api_import_broker_trades():
+    """Queue the import of many broker trades as one job: {"trades": [row, ...]}"""
+    data = request.get_json() or {}
+    trades = data.get('trades')
+    if not isinstance(trades, list) or not trades:
+        return jsonify({'success': False, 'message': 'trades must be a non-empty list'}), 400
+    return enqueue_job_response('broker_import', {'trades': trades})
+
+
+@job_queue.job_handler('broker_import')
+def run_broker_import_job(ctx, payload):
+    rows = payload.get('trades') or []
+    results = []
+    for i, row in enumerate(rows):
+        results.append(import_broker_trade(row))
+        ctx.progress((i + 1) * 100.0 / len(rows), f"Imported {i + 1}/{len(rows)} trades")
+    imported = sum(1 for r in results if r.get('success'))
+    if len(rows) == 1:
+        return results[0]
+    return {
+        'success': imported > 0,
+        'message': f'Imported {imported} of {len(rows)} trades',
+        'imported': imported,
+        'failed': len(rows) - imported,
+        'results': results[:JOB_RESULT_ROWS],
+    }
 
 
 
@@ -5313,9 +5647,9 @@ def broker_status_api():
     if not broker or broker not in ["kite", "dhan", "angel"]:
         return jsonify({"connected": False, "user_id": user_id, "broker": broker})
     
-    # Load accounts first
+    # Load this account's persisted row first
     try:
-        load_persisted_accounts_into_memory()
+        ensure_account_loaded(broker, user_id)
     except Exception as e:
         current_app.logger.error(f"Failed to load accounts: {e}")
     
@@ -5405,6 +5739,7 @@ def broker_disconnect_api():
         # Clear in-memory sessions
         if broker in USER_SESSIONS and user_id in USER_SESSIONS[broker]:
             del USER_SESSIONS[broker][user_id]
+        broker_clients.evict(broker, user_id)
         
         current_app.logger.info(f"Broker {broker} disconnected for user {user_id}")
         return jsonify({"ok": True})
@@ -5434,6 +5769,7 @@ def disconnect_broker():
         # Remove from in-memory sessions
         if user_id in USER_SESSIONS.get(broker, {}):
             del USER_SESSIONS[broker][user_id]
+        broker_clients.evict(broker, user_id)
         
         return jsonify({"ok": True, "message": f"Disconnected from {broker}"})
     except Exception as e:
@@ -5453,9 +5789,9 @@ def get_portfolio():
     if not broker:
         return jsonify({"ok": False, "message": "broker parameter required"}), 400
     
-    # Ensure accounts are loaded
+    # Ensure this account is loaded
     try:
-        load_persisted_accounts_into_memory()
+        ensure_account_loaded(broker, user_id)
     except Exception as e:
         current_app.logger.error(f"Failed to load accounts: {e}")
     
@@ -5480,6 +5816,7 @@ def get_portfolio():
                     if "api_key" in str(e).lower() or "access_token" in str(e).lower():
                         # Clear invalid session
                         USER_SESSIONS.get("kite", {}).pop(user_id, None)
+                        broker_clients.evict("kite", user_id)
                         acc = BrokerAccount.query.filter_by(broker="kite", user_id=user_id).first()
                         if acc:
                             acc.connected = False
@@ -5562,6 +5899,100 @@ def _get_angel_portfolio(user_id):
         "broker": "angel"
     })
 
+def _portfolio_sources(broker, user_id):
+    """
+    {'holdings': fn, 'positions': fn} for one broker's connected session, or a
+    reason string when there is none. Runs in the request thread (session and
+    client lookups need the app context); only the returned calls go upstream.
+    """
+    try:
+        ensure_account_loaded(broker, user_id)
+    except Exception as e:
+        current_app.logger.error(f"Failed to load accounts: {e}")
+
+    sess = USER_SESSIONS.get(broker, {}).get(user_id)
+    if broker == "kite":
+        if not (sess and sess.get("access_token")):
+            return "Not connected"
+        kite = get_kite_for_user(user_id, sess["access_token"])
+        return {"holdings": kite.holdings, "positions": kite.positions}
+    if broker == "dhan":
+        client, _resp, _code = _dhan_client_from_session(user_id)
+        if client is None:
+            return "Not connected"
+        return {"holdings": client.get_holdings, "positions": client.get_positions}
+    if broker == "angel":
+        if not (sess and sess.get("smart_api")):
+            return "Not connected"
+        return {"holdings": sess["smart_api"].holding, "positions": sess["smart_api"].position}
+    return "Unsupported broker"
+
+
+@calculatentrade_bp.route("/api/portfolio/all")
+def get_portfolio_all():
+    """
+    Holdings and positions from every connected broker in one response, fetched
+    concurrently and merged by symbol. ?user_id= applies to every broker;
+    kite_user_id / dhan_user_id / angel_user_id override it per broker.
+    """
+    user_id = request.args.get("user_id", "NES881").strip()
+    brokers = {b: (request.args.get(f"{b}_user_id") or user_id).strip() for b in ("kite", "dhan", "angel")}
+
+    status = {}
+    calls = {}
+    for broker, broker_user in brokers.items():
+        try:
+            sources = _portfolio_sources(broker, broker_user)
+        except Exception as e:
+            sources = f"Client error: {e}"
+        if isinstance(sources, str):
+            status[broker] = {"user_id": broker_user, "connected": False, "message": sources}
+            continue
+        status[broker] = {"user_id": broker_user, "connected": True, "ok": True}
+        for kind, fn in sources.items():
+            calls[(broker, kind)] = fn
+
+    # Every broker's holdings and positions in flight at once: latency is the slowest call
+    fetched = broker_fanout.fan_out(calls)
+
+    holdings, positions, errors = [], [], {}
+    for (broker, kind), message in fetched.errors.items():
+        errors[f"{broker}.{kind}"] = message
+        status[broker]["ok"] = False
+        if "api_key" in message.lower() or "access_token" in message.lower():
+            status[broker]["auth_error"] = True
+    for (broker, kind), response in fetched.values.items():
+        # Dhan/Angel report API errors (e.g. an expired token) in the payload
+        failed = portfolio_aggregate.failure(response)
+        if failed:
+            errors[f"{broker}.{kind}"], auth = failed
+            status[broker]["ok"] = False
+            if auth:
+                status[broker]["auth_error"] = True
+            continue
+        if kind == "holdings":
+            holdings.extend(portfolio_aggregate.normalize_holdings(broker, response))
+        else:
+            positions.extend(portfolio_aggregate.normalize_positions(broker, response))
+
+    merged_holdings = portfolio_aggregate.merge_by_symbol(holdings)
+    merged_positions = portfolio_aggregate.merge_by_symbol(positions)
+    body = {
+        "ok": any(f"{broker}.{kind}" not in errors for broker, kind in fetched.values),
+        "data": {
+            "holdings": merged_holdings,
+            "positions": merged_positions,
+            "totals": portfolio_aggregate.totals(merged_holdings, merged_positions),
+            "brokers": status,
+        }
+    }
+    if not calls:
+        body["message"] = "No broker connected. Please connect first."
+    if errors:
+        body["errors"] = errors
+    return jsonify(body)
+
+
 # ---------------- Generic /api/broker/* endpoints (add to your app) ----------------
 
 @calculatentrade_bp.route("/api/broker/positions")
@@ -5572,9 +6003,9 @@ def api_broker_positions():
     if not broker:
         return jsonify({"ok": False, "message": "broker parameter required"}), 400
 
-    # Ensure accounts are loaded
+    # Ensure this account is loaded
     try:
-        load_persisted_accounts_into_memory()
+        ensure_account_loaded(broker, user_id)
     except Exception as e:
         current_app.logger.error(f"Failed to load accounts: {e}")
 
@@ -5593,6 +6024,7 @@ def api_broker_positions():
                     if "api_key" in str(e).lower() or "access_token" in str(e).lower():
                         # Clear invalid session
                         USER_SESSIONS.get("kite", {}).pop(user_id, None)
+                        broker_clients.evict("kite", user_id)
                         acc = BrokerAccount.query.filter_by(broker="kite", user_id=user_id).first()
                         if acc:
                             acc.connected = False
@@ -5636,9 +6068,9 @@ def api_broker_orders():
     if not broker:
         return jsonify({"ok": False, "message": "broker parameter required"}), 400
 
-    # Ensure accounts are loaded
+    # Ensure this account is loaded
     try:
-        load_persisted_accounts_into_memory()
+        ensure_account_loaded(broker, user_id)
     except Exception as e:
         current_app.logger.error(f"Failed to load accounts: {e}")
 
@@ -5657,6 +6089,7 @@ def api_broker_orders():
                     if "api_key" in str(e).lower() or "access_token" in str(e).lower():
                         # Clear invalid session
                         USER_SESSIONS.get("kite", {}).pop(user_id, None)
+                        broker_clients.evict("kite", user_id)
                         acc = BrokerAccount.query.filter_by(broker="kite", user_id=user_id).first()
                         if acc:
                             acc.connected = False
@@ -5748,9 +6181,9 @@ def api_broker_trades():
     if not broker:
         return jsonify({"ok": False, "message": "broker parameter required"}), 400
 
-    # Ensure accounts are loaded
+    # Ensure this account is loaded
     try:
-        load_persisted_accounts_into_memory()
+        ensure_account_loaded(broker, user_id)
     except Exception as e:
         current_app.logger.error(f"Failed to load accounts: {e}")
 
@@ -5769,6 +6202,7 @@ def api_broker_trades():
                     if "api_key" in str(e).lower() or "access_token" in str(e).lower():
                         # Clear invalid session
                         USER_SESSIONS.get("kite", {}).pop(user_id, None)
+                        broker_clients.evict("kite", user_id)
                         acc = BrokerAccount.query.filter_by(broker="kite", user_id=user_id).first()
                         if acc:
                             acc.connected = False
@@ -5807,9 +6241,9 @@ def api_broker_trades():
 def kite_positions():
     user_id = request.args.get("user_id", "NES881")
     
-    # Ensure accounts are loaded
+    # Ensure this account is loaded
     try:
-        load_persisted_accounts_into_memory()
+        ensure_account_loaded("kite", user_id)
     except Exception as e:
         current_app.logger.error(f"Failed to load accounts: {e}")
     
@@ -5823,6 +6257,7 @@ def kite_positions():
         # Clear invalid session on auth error
         if "api_key" in str(e).lower() or "access_token" in str(e).lower():
             USER_SESSIONS.get("kite", {}).pop(user_id, None)
+            broker_clients.evict("kite", user_id)
             acc = BrokerAccount.query.filter_by(broker="kite", user_id=user_id).first()
             if acc:
                 acc.connected = False
@@ -5835,9 +6270,9 @@ def kite_positions():
 def kite_orders():
     user_id = request.args.get("user_id", "NES881")
     
-    # Ensure accounts are loaded
+    # Ensure this account is loaded
     try:
-        load_persisted_accounts_into_memory()
+        ensure_account_loaded("kite", user_id)
     except Exception as e:
         current_app.logger.error(f"Failed to load accounts: {e}")
     
@@ -5851,6 +6286,7 @@ def kite_orders():
         # Clear invalid session on auth error
         if "api_key" in str(e).lower() or "access_token" in str(e).lower():
             USER_SESSIONS.get("kite", {}).pop(user_id, None)
+            broker_clients.evict("kite", user_id)
             acc = BrokerAccount.query.filter_by(broker="kite", user_id=user_id).first()
             if acc:
                 acc.connected = False
@@ -5863,9 +6299,9 @@ def kite_orders():
 def kite_trades():
     user_id = request.args.get("user_id", "NES881")
     
-    # Ensure accounts are loaded
+    # Ensure this account is loaded
     try:
-        load_persisted_accounts_into_memory()
+        ensure_account_loaded("kite", user_id)
     except Exception as e:
         current_app.logger.error(f"Failed to load accounts: {e}")
     
@@ -5879,6 +6315,7 @@ def kite_trades():
         # Clear invalid session on auth error
         if "api_key" in str(e).lower() or "access_token" in str(e).lower():
             USER_SESSIONS.get("kite", {}).pop(user_id, None)
+            broker_clients.evict("kite", user_id)
             acc = BrokerAccount.query.filter_by(broker="kite", user_id=user_id).first()
             if acc:
                 acc.connected = False
@@ -5962,15 +6399,14 @@ def angel_trades():
     except Exception as e:
         return jsonify({"ok": False, "message": str(e)}), 400
     
-@calculatentrade_bp.route('/api/trades/from_broker', methods=['POST'])
-def api_add_trade_from_broker():
+def add_trade_from_broker(data):
     """
     Accepts either:
       - JSON with 'legs': [leg1, leg2] where each leg is a broker row (dict)
       - or JSON with merged trade fields (symbol, date, entry_price, exit_price, quantity, trade_type, strategy_id)
     Attempts to create a single Trade row or update an existing open placeholder for that symbol+qty.
+    Returns (response dict, HTTP status).
     """
-    data = request.get_json(force=True) or {}
     try:
         # If legs present -> merge them
         legs = data.get('legs')
@@ -6024,7 +6460,7 @@ def api_add_trade_from_broker():
                 if strategy_id:
                     trade.strategy_id = strategy_id
                 db.session.commit()
-                return jsonify({'success': True, 'id': trade.id, 'updated': True})
+                return {'success': True, 'id': trade.id, 'updated': True}, 200
             else:
                 new_trade = Trade(
                     symbol=symbol or data.get('symbol'),
@@ -6040,7 +6476,7 @@ def api_add_trade_from_broker():
                 )
                 db.session.add(new_trade)
                 db.session.commit()
-                return jsonify({'success': True, 'id': new_trade.id, 'created': True})
+                return {'success': True, 'id': new_trade.id, 'created': True}, 200
 
         # fallback: direct merged fields provided
         symbol = data.get('symbol')
@@ -6066,11 +6502,27 @@ def api_add_trade_from_broker():
             )
             db.session.add(new_trade)
             db.session.commit()
-            return jsonify({'success': True, 'id': new_trade.id})
-        return jsonify({'ok': False, 'message': 'Unrecognized payload'}), 400
+            return {'success': True, 'id': new_trade.id}, 200
+        return {'ok': False, 'message': 'Unrecognized payload'}, 400
     except Exception as e:
-        app.logger.exception('Failed /api/trades/from_broker: %s', e)
-        return jsonify({'ok': False, 'message': str(e)}), 500
+        db.session.rollback()
+        safe_log_error(f"Failed broker trade merge: {e}")
+        return {'ok': False, 'message': str(e)}, 500
+
+
+@calculatentrade_bp.route('/api/trades/from_broker', methods=['POST'])
+def api_add_trade_from_broker():
+    """Queue a broker trade merge (job kind 'broker_merge'); payload as for add_trade_from_broker"""
+    data = request.get_json(force=True) or {}
+    return enqueue_job_response('broker_merge', data)
+
+
+@job_queue.job_handler('broker_merge')
+def run_broker_merge_job(ctx, payload):
+    body, status = add_trade_from_broker(payload)
+    if status >= 400:
+        raise RuntimeError(body.get('message') or 'Broker trade merge failed')
+    return body
 
 
 # ---------------- NEW ENHANCED API ENDPOINTS ---------------- #
@@ -6115,48 +6567,71 @@ def api_revert_strategy(strategy_id, version_id):
 # backtestss API
 @calculatentrade_bp.route('/api/strategies/<int:strategy_id>/backtest', methods=['POST'])
 def api_run_backtest(strategy_id):
+    """Queue a backtest (job kind 'backtest'); poll /api/jobs/<job_id> for the summary"""
     data = request.json or {}
-    strategy = Strategy.query.get_or_404(strategy_id)
+    Strategy.query.get_or_404(strategy_id)
+    return enqueue_job_response('backtest', {'strategy_id': strategy_id, 'data': data})
+
+
+@job_queue.job_handler('backtest')
+def run_backtest_job(ctx, payload):
+    strategy = Strategy.query.get(payload['strategy_id'])
+    if strategy is None:
+        raise backtest_engine.BacktestError(f"Strategy {payload['strategy_id']} no longer exists")
+    summary = run_strategy_backtest(strategy, payload.get('data') or {}, progress=ctx.progress)
+    # the per-trade log is in BacktestSummary; keep the job row small
+    return {k: v for k, v in summary.items() if k != 'trades'}
 
-    # simple mock backtest (replace with real backtesting logic)
-    import random
-    total_return = random.uniform(-20, 50)
-    sharpe_ratio = random.uniform(0.5, 2.5)
-    max_drawdown = random.uniform(5, 25)
-    win_rate = random.uniform(40, 70)
-    total_trades = random.randint(50, 200)
-    winning_trades = int(total_trades * win_rate / 100)
-
-    # create equity curve
-    start_date = datetime.strptime(data.get('start_date', datetime.now().strftime('%Y-%m-%d')), '%Y-%m-%d').date()
-    initial_capital = float(data.get('initial_capital', 10000))
-    equity_curve = []
-    equity = initial_capital
-    for i in range(30):
-        equity *= (1 + random.uniform(-0.05, 0.08))
-        equity_curve.append({'date': (start_date + timedelta(days=i*7)).isoformat(), 'equity': round(equity, 2)})
-
-    summary = {
+
+def run_strategy_backtest(strategy, data, progress=None):
+    """
+    Backtest a strategy on one symbol's Dhan OHLC bars and store the summary
+    (BacktestSummary row, strategy.backtests, top-level strategy metrics).
+    data: symbol (or a 'symbol' strategy parameter), start_date, end_date,
+    interval ('1'..'60' minutes or 'D'), initial_capital, commission_per_trade,
+    name, plus optional config overrides (see backtest_engine.BacktestConfig).
+    progress(percent, message), when given, is called as the bars download.
+    """
+    from app import resolve_input, get_dhan_headers, DHAN_BASE_URL
+
+    interval = str(data.get('interval', '5'))
+    end_date = backtest_engine.parse_date(data.get('end_date'), datetime.now().date())
+    start_date = backtest_engine.parse_date(data.get('start_date'), end_date - timedelta(days=365))
+    config = backtest_engine.BacktestConfig.from_strategy(strategy, data, interval=interval)
+
+    symbol = data.get('symbol') or backtest_engine.parameter_map(strategy.parameters).get('symbol')
+    if not symbol:
+        raise backtest_engine.BacktestError('symbol is required (request body or strategy parameter)')
+    instrument = resolve_input(symbol)
+    if not instrument:
+        raise backtest_engine.BacktestError(f'Unknown symbol: {symbol}')
+
+    fetched = None
+    if progress:
+        fetched = lambda done, total: progress(done * 80.0 / total, f"Fetched {done}/{total} bar requests")
+    bars = backtest_engine.fetch_bars(DHAN_BASE_URL, get_dhan_headers(), instrument['security_id'],
+                                      start_date, end_date, interval, progress=fetched)
+    if progress:
+        progress(90, f"Simulating {len(bars)} bars")
+    summary = backtest_engine.backtest(bars, config)
+    summary.update({
         "id": int(datetime.utcnow().timestamp()),            # small unique id
         "name": data.get('name', f'{strategy.name} backtest'),
-        "start_date": data.get('start_date'),
-        "end_date": data.get('end_date'),
-        "initial_capital": initial_capital,
-        "commission_per_trade": data.get('commission_per_trade', 1.0),
-        "total_return": total_return,
-        "sharpe_ratio": sharpe_ratio,
-        "max_drawdown": max_drawdown,
-        "win_rate": win_rate,
-        "total_trades": total_trades,
-        "winning_trades": winning_trades,
-        "losing_trades": total_trades - winning_trades,
-        "equity_curve": equity_curve,
+        "symbol": instrument['symbol'],
+        "security_id": instrument['security_id'],
+        "interval": interval,
+        "start_date": start_date.isoformat(),
+        "end_date": end_date.isoformat(),
+        "initial_capital": config.initial_capital,
+        "commission_per_trade": config.commission,
+        "config": config.to_dict(),
         "created_at": datetime.utcnow().isoformat(),
         "status": "completed"
-    }
-        # append to strategy.backtests JSON column
-    curr = strategy.backtests or []
-    curr.append(summary)
+    })
+
+    # append to strategy.backtests JSON column (without the per-trade log)
+    curr = list(strategy.backtests or [])
+    curr.append({k: v for k, v in summary.items() if k != 'trades'})
     strategy.backtests = curr
 
     # store as model record too
@@ -6164,19 +6639,20 @@ def api_run_backtest(strategy_id):
     db.session.add(bt)
 
     # update top-level metrics on strategy
-    strategy.sharpe_ratio = sharpe_ratio
-    strategy.max_drawdown = max_drawdown
+    strategy.sharpe_ratio = summary['sharpe_ratio']
+    strategy.max_drawdown = summary['max_drawdown']
+    strategy.avg_trade_pl = summary['avg_trade_pnl']
 
     db.session.commit()
 
-    log_audit('create', 'strategy_backtest', strategy_id, None, summary)
-
-    return jsonify({'ok': True, 'data': summary})
+    log_audit('create', 'strategy_backtest', strategy.id, None, {k: v for k, v in summary.items() if k != 'trades'})
+    return summary
 
 
 @calculatentrade_bp.route('/api/strategies/<int:strategy_id>/details', methods=['GET'])
 def api_get_strategy_details(strategy_id):
     strategy = Strategy.query.get_or_404(strategy_id)
+    Strategy.load_aggregates([strategy])
 
     # latest backtest stored in BacktestSummary model if exists
     latest = BacktestSummary.query.filter_by(strategy_id=strategy_id).order_by(BacktestSummary.created_at.desc()).first()
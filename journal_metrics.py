@@ -0,0 +1,542 @@
+"""
+Trade metrics for the journal dashboard
+Counts, sums, averages, best/worst trade, drawdown and per-strategy PnL are
+computed in the database with a fixed number of grouped statements, so the
+dashboard does not load the trade table into Python and its cost stays flat
+as the number of trades grows.
+
+All-time totals are also kept in a TradeStats row, and per-day totals in
+TradeDailyPnl, both updated on every Trade insert/update/delete
+(register_trade_stats), so reads are O(1) or a short range scan.
+"""
+
+from datetime import date, datetime, timedelta
+
+from sqlalchemy import event, func, case, and_, extract, select, inspect, literal
+from sqlalchemy.orm import Session
+
+
+def _count_if(cond):
+    return func.coalesce(func.sum(case((cond, 1), else_=0)), 0)
+
+
+def _sum_if(expr, cond):
+    return func.coalesce(func.sum(case((cond, expr), else_=0)), 0)
+
+
+def month_starts(now, months=12):
+    """First day of the current and previous months, newest first (calendar exact)"""
+    starts = []
+    year, month = now.year, now.month
+    for _ in range(months):
+        starts.append(datetime(year, month, 1))
+        year, month = (year, month - 1) if month > 1 else (year - 1, 12)
+    return starts
+
+
+def trade_totals(db, Trade, now=None):
+    """
+    One pass over the trade table: counts, PnL sums, gross profit/loss,
+    month/week slices, average reward:risk and best/worst trade symbols.
+    """
+    now = now or datetime.now()
+    month_start = now.replace(day=1, hour=0, minute=0, second=0, microsecond=0).date()
+    week_start = (now - timedelta(days=7)).date()
+
+    is_win = Trade.result == 'win'
+    is_loss = Trade.result == 'loss'
+    in_month = Trade.date >= month_start
+    in_week = Trade.date >= week_start
+    has_rr = and_(Trade.risk > 0, Trade.reward > 0)
+
+    best_symbol = (select(Trade.symbol).where(is_win)
+                   .order_by(Trade.pnl.desc()).limit(1).scalar_subquery())
+    worst_symbol = (select(Trade.symbol).where(is_loss)
+                    .order_by(Trade.pnl.asc()).limit(1).scalar_subquery())
+
+    row = db.session.query(
+        func.count(Trade.id),
+        _count_if(is_win),
+        _count_if(is_loss),
+        func.coalesce(func.sum(Trade.pnl), 0),
+        _sum_if(Trade.pnl, is_win),
+        _sum_if(Trade.pnl, is_loss),
+        func.max(case((is_win, Trade.pnl))),
+        _count_if(in_month),
+        _sum_if(Trade.pnl, in_month),
+        _count_if(in_week),
+        _sum_if(Trade.pnl, in_week),
+        func.avg(case((has_rr, Trade.reward / Trade.risk))),
+        best_symbol,
+        worst_symbol,
+    ).one()
+
+    (total, wins, losses, total_pnl, win_pnl, loss_pnl, highest_win, month_trades,
+     month_pnl, week_trades, week_pnl, avg_rr, best, worst) = row
+    return {
+        'total_trades': int(total or 0),
+        'winning_trades': int(wins or 0),
+        'losing_trades': int(losses or 0),
+        'total_pnl': float(total_pnl or 0),
+        'gross_profit': float(win_pnl or 0),
+        'gross_loss': abs(float(loss_pnl or 0)),
+        'highest_pnl': float(highest_win or 0),
+        'trades_this_month': int(month_trades or 0),
+        'monthly_pnl': float(month_pnl or 0),
+        'week_trades': int(week_trades or 0),
+        'week_pnl': float(week_pnl or 0),
+        'risk_reward': round(float(avg_rr), 2) if avg_rr is not None else 0,
+        'best_trade_symbol': best,
+        'worst_trade_symbol': worst,
+    }
+
+
+def period_totals(db, Trade, now=None):
+    """Trade count and PnL for this month and the last 7 days (date range scan only)"""
+    now = now or datetime.now()
+    month_start = now.replace(day=1, hour=0, minute=0, second=0, microsecond=0).date()
+    week_start = (now - timedelta(days=7)).date()
+    in_month = Trade.date >= month_start
+    in_week = Trade.date >= week_start
+
+    row = db.session.query(
+        _count_if(in_month),
+        _sum_if(Trade.pnl, in_month),
+        _count_if(in_week),
+        _sum_if(Trade.pnl, in_week),
+    ).filter(Trade.date >= min(month_start, week_start)).one()
+    month_trades, month_pnl, week_trades, week_pnl = row
+    return {
+        'trades_this_month': int(month_trades or 0),
+        'monthly_pnl': float(month_pnl or 0),
+        'week_trades': int(week_trades or 0),
+        'week_pnl': float(week_pnl or 0),
+    }
+
+def max_drawdown(db, Trade):
+    """Largest peak-to-trough drop of cumulative PnL (peak starts at 0), via window functions"""
+    equity = db.session.query(
+        Trade.date, Trade.id,
+        func.sum(Trade.pnl).over(order_by=(Trade.date, Trade.id)).label('cum'),
+    ).subquery()
+    peaks = db.session.query(
+        equity.c.cum,
+        func.max(equity.c.cum).over(order_by=(equity.c.date, equity.c.id)).label('peak'),
+    ).subquery()
+    value = db.session.query(
+        func.max(case((peaks.c.peak > 0, peaks.c.peak), else_=0) - peaks.c.cum)
+    ).scalar()
+    return max(0.0, float(value or 0))
+
+
+def monthly_heatmap(db, Trade, now=None, months=12):
+    """PnL and trade count for each of the last `months` calendar months, newest first"""
+    now = now or datetime.now()
+    starts = month_starts(now, months)
+    next_month = datetime(now.year + 1, 1, 1) if now.month == 12 else datetime(now.year, now.month + 1, 1)
+
+    year = extract('year', Trade.date)
+    month = extract('month', Trade.date)
+    rows = db.session.query(year, month, func.coalesce(func.sum(Trade.pnl), 0), func.count(Trade.id)) \
+        .filter(Trade.date >= starts[-1], Trade.date < next_month) \
+        .group_by(year, month).all()
+    by_month = {(int(y), int(m)): (float(pnl or 0), int(n)) for y, m, pnl, n in rows}
+
+    heatmap = []
+    for start in starts:
+        pnl, count = by_month.get((start.year, start.month), (0.0, 0))
+        heatmap.append({'month': start.strftime('%b %Y'), 'pnl': round(pnl, 2), 'trades': count})
+    return heatmap
+
+
+def equity_curve(db, Trade, days=30, now=None):
+    """Cumulative PnL points for trades in the last `days` days (columns only)"""
+    now = now or datetime.now()
+    rows = db.session.query(Trade.date, Trade.pnl) \
+        .filter(Trade.date >= (now - timedelta(days=days)).date()) \
+        .order_by(Trade.date, Trade.id).all()
+    curve, cumulative = [], 0.0
+    for date, pnl in rows:
+        cumulative += float(pnl or 0)
+        curve.append({'date': date.strftime('%Y-%m-%d'), 'pnl': round(cumulative, 2)})
+    return curve
+
+
+def strategy_pnl(db, Trade, Strategy):
+    """[(strategy_id, name, pnl, trades)] for every strategy, in one GROUP BY"""
+    rows = db.session.query(
+        Strategy.id, Strategy.name,
+        func.coalesce(func.sum(Trade.pnl), 0), func.count(Trade.id),
+    ).outerjoin(Trade, Trade.strategy_id == Strategy.id) \
+        .group_by(Strategy.id, Strategy.name).order_by(Strategy.id).all()
+    return [(sid, name, float(pnl or 0), int(n)) for sid, name, pnl, n in rows]
+
+
+def strategy_aggregates(db, Trade, strategy_ids=None):
+    """
+    {strategy_id: {'total_trades', 'total_pnl', 'wins', 'losses'}} for every
+    strategy with trades (or just strategy_ids), in one GROUP BY strategy_id
+    """
+    query = db.session.query(
+        Trade.strategy_id,
+        func.count(Trade.id),
+        func.coalesce(func.sum(Trade.pnl), 0),
+        _count_if(Trade.result == 'win'),
+        _count_if(Trade.result == 'loss'),
+    ).filter(Trade.strategy_id.isnot(None))
+    if strategy_ids is not None:
+        query = query.filter(Trade.strategy_id.in_(list(strategy_ids)))
+    rows = query.group_by(Trade.strategy_id).all()
+    return {
+        sid: {'total_trades': int(n), 'total_pnl': float(pnl or 0), 'wins': int(w or 0), 'losses': int(l or 0)}
+        for sid, n, pnl, w, l in rows
+    }
+
+
+def most_profitable_strategy(db, Trade, Strategy):
+    best = None
+    for _, name, pnl, _ in strategy_pnl(db, Trade, Strategy):
+        if best is None or pnl > best['pnl']:
+            best = {'name': name, 'pnl': pnl}
+    return best
+
+
+# ----------------- incremental trade stats ----------------- #
+
+STATS_FIELDS = ('date', 'pnl', 'result', 'risk', 'reward', 'quantity', 'symbol')
+# Edits to other fields (risk, reward, quantity, symbol) leave drawdown and streaks alone
+ORDERED_FIELDS = ('date', 'pnl', 'result')
+
+
+def _as_datetime(value):
+    """Trade.date as a datetime; some writers (the broker import) assign a plain date"""
+    if isinstance(value, date) and not isinstance(value, datetime):
+        return datetime.combine(value, datetime.min.time())
+    return value
+
+
+def _values(trade, old=False):
+    """Fields the stats depend on; old=True gives the values before pending changes"""
+    if not old:
+        values = {f: getattr(trade, f) for f in STATS_FIELDS}
+    else:
+        state = inspect(trade)
+        values, unknown = {}, False
+        for f in STATS_FIELDS:
+            history = state.attrs[f].history
+            values[f] = history.deleted[0] if history.deleted else getattr(trade, f)
+            # Set on an expired instance: the old value was never loaded
+            unknown = unknown or bool(history.added and not history.deleted and not history.unchanged)
+        if unknown and state.persistent:
+            model = type(trade)
+            with state.session.no_autoflush:
+                row = state.session.query(*(getattr(model, f) for f in STATS_FIELDS)) \
+                    .filter(model.id == trade.id).first()
+            if row is not None:
+                values = dict(zip(STATS_FIELDS, row))
+    values['date'] = _as_datetime(values['date'])
+    return values
+
+
+def _reset(stats):
+    for name in ('trade_count', 'win_count', 'loss_count', 'positive_count', 'negative_count',
+                 'rr_count', 'current_streak', 'longest_win_streak', 'longest_loss_streak'):
+        setattr(stats, name, 0)
+    for name in ('total_pnl', 'sum_pnl_sq', 'win_pnl', 'loss_pnl', 'gross_profit', 'gross_loss',
+                 'rr_sum', 'total_volume', 'equity', 'peak', 'max_drawdown'):
+        setattr(stats, name, 0.0)
+    stats.best_pnl = stats.best_symbol = stats.worst_pnl = stats.worst_symbol = None
+    stats.last_trade_date = None
+
+
+def _add(stats, v, sign=1):
+    """Add (sign=1) or remove (sign=-1) a trade's order-independent contribution"""
+    pnl = float(v['pnl'] or 0)
+    stats.trade_count += sign
+    stats.total_pnl += sign * pnl
+    stats.sum_pnl_sq += sign * pnl * pnl
+    stats.total_volume += sign * float(v['quantity'] or 0)
+    if v['result'] == 'win':
+        stats.win_count += sign
+        stats.win_pnl += sign * pnl
+    elif v['result'] == 'loss':
+        stats.loss_count += sign
+        stats.loss_pnl += sign * pnl
+    if pnl > 0:
+        stats.positive_count += sign
+        stats.gross_profit += sign * pnl
+    elif pnl < 0:
+        stats.negative_count += sign
+        stats.gross_loss -= sign * pnl
+    risk, reward = float(v['risk'] or 0), float(v['reward'] or 0)
+    if risk > 0 and reward > 0:
+        stats.rr_count += sign
+        stats.rr_sum += sign * reward / risk
+
+
+def _extrema(stats, v):
+    """Best win and worst loss (the dashboard's best/worst trade); insert order does not matter"""
+    pnl = float(v['pnl'] or 0)
+    if v['result'] == 'win' and (stats.best_pnl is None or pnl > stats.best_pnl):
+        stats.best_pnl, stats.best_symbol = pnl, v['symbol']
+    elif v['result'] == 'loss' and (stats.worst_pnl is None or pnl < stats.worst_pnl):
+        stats.worst_pnl, stats.worst_symbol = pnl, v['symbol']
+
+
+def _holds_extremum(stats, v):
+    """True if removing this trade could change the best win or worst loss"""
+    pnl = float(v['pnl'] or 0)
+    if v['result'] == 'win':
+        return stats.best_pnl is not None and pnl >= stats.best_pnl
+    if v['result'] == 'loss':
+        return stats.worst_pnl is not None and pnl <= stats.worst_pnl
+    return False
+
+
+def _append(stats, v):
+    """Advance the ordered state (equity, peak, drawdown, streaks) by one trade"""
+    pnl = float(v['pnl'] or 0)
+    stats.equity += pnl
+    stats.peak = max(stats.peak, stats.equity)
+    stats.max_drawdown = max(stats.max_drawdown, stats.peak - stats.equity)
+
+    # Breakeven trades leave the streak alone (as the dashboard always has)
+    if v['result'] == 'win':
+        stats.current_streak = stats.current_streak + 1 if stats.current_streak > 0 else 1
+        stats.longest_win_streak = max(stats.longest_win_streak, stats.current_streak)
+    elif v['result'] == 'loss':
+        stats.current_streak = stats.current_streak - 1 if stats.current_streak < 0 else -1
+        stats.longest_loss_streak = max(stats.longest_loss_streak, -stats.current_streak)
+    stats.last_trade_date = v['date']
+
+
+def _changed(trade, fields=STATS_FIELDS):
+    attrs = inspect(trade).attrs
+    return any(attrs[f].history.has_changes() for f in fields)
+
+
+# ----------------- daily rollup ----------------- #
+
+ROLLUP_FIELDS = ('pnl', 'trade_count', 'wins', 'losses', 'gross_profit', 'gross_loss')
+
+
+def _day_delta(deltas, v, sign):
+    """Accumulate a trade's contribution to its day's rollup row"""
+    day = v['date']
+    if day is None:
+        return
+    day = day.date() if isinstance(day, datetime) else day
+    pnl = float(v['pnl'] or 0)
+    row = deltas.setdefault(day, dict.fromkeys(ROLLUP_FIELDS, 0))
+    row['pnl'] += sign * pnl
+    row['trade_count'] += sign
+    if pnl > 0:
+        row['wins'] += sign
+        row['gross_profit'] += sign * pnl
+    elif pnl < 0:
+        row['losses'] += sign
+        row['gross_loss'] -= sign * pnl
+
+
+def _insert_for(session):
+    """The dialect's INSERT construct (with ON CONFLICT support)"""
+    dialect = session.get_bind().dialect.name
+    if dialect == 'postgresql':
+        from sqlalchemy.dialects.postgresql import insert
+    elif dialect == 'sqlite':
+        from sqlalchemy.dialects.sqlite import insert
+    else:
+        raise RuntimeError(f"Upsert not supported on {dialect}")
+    return insert
+
+
+def _upsert_daily(session, TradeDailyPnl, scope, deltas):
+    """INSERT .. ON CONFLICT (scope, day) DO UPDATE SET col = col + delta"""
+    insert = _insert_for(session)
+    table = TradeDailyPnl.__table__
+    for day, delta in sorted(deltas.items()):
+        if not any(delta.values()):
+            continue
+        stmt = insert(table).values(scope=scope, day=day, **delta)
+        stmt = stmt.on_conflict_do_update(
+            index_elements=[table.c.scope, table.c.day],
+            set_={f: table.c[f] + stmt.excluded[f] for f in ROLLUP_FIELDS},
+        )
+        session.execute(stmt)
+
+
+def rebuild_daily_pnl(db, Trade, TradeDailyPnl, scope='all'):
+    """Replace the scope's rollup rows with one grouped INSERT .. SELECT (no commit)"""
+    table = TradeDailyPnl.__table__
+    day = func.date(Trade.date)
+    grouped = select(
+        literal(scope, table.c.scope.type).label('scope'), day,
+        func.coalesce(func.sum(Trade.pnl), 0),
+        func.count(Trade.id),
+        _count_if(Trade.pnl > 0),
+        _count_if(Trade.pnl < 0),
+        _sum_if(Trade.pnl, Trade.pnl > 0),
+        -_sum_if(Trade.pnl, Trade.pnl < 0),
+    ).group_by(day)
+    db.session.execute(table.delete().where(table.c.scope == scope))
+    db.session.execute(table.insert().from_select(['scope', 'day', *ROLLUP_FIELDS], grouped))
+
+
+def daily_pnl(db, TradeDailyPnl, start, end, scope='all'):
+    """{date: TradeDailyPnl} for start..end inclusive (a range scan over the rollup)"""
+    rows = TradeDailyPnl.query.filter(
+        TradeDailyPnl.scope == scope, TradeDailyPnl.day >= start, TradeDailyPnl.day <= end
+    ).all()
+    return {row.day: row for row in rows}
+
+
+def rollup_monthly(db, TradeDailyPnl, now=None, months=12, scope='all'):
+    """Monthly heatmap (same shape as monthly_heatmap) from the daily rollup, newest first"""
+    now = now or datetime.now()
+    starts = month_starts(now, months)
+    last_day = now.date().replace(day=1) + timedelta(days=31)
+    by_month = {}
+    for day, row in daily_pnl(db, TradeDailyPnl, starts[-1].date(), last_day, scope).items():
+        if (day.year, day.month) > (now.year, now.month):
+            continue
+        pnl, count = by_month.get((day.year, day.month), (0.0, 0))
+        by_month[(day.year, day.month)] = (pnl + (row.pnl or 0), count + (row.trade_count or 0))
+
+    heatmap = []
+    for start in starts:
+        pnl, count = by_month.get((start.year, start.month), (0.0, 0))
+        heatmap.append({'month': start.strftime('%b %Y'), 'pnl': round(pnl, 2), 'trades': count})
+    return heatmap
+
+
+# ----------------- write hook ----------------- #
+
+def register_trade_stats(Trade, TradeStats, TradeDailyPnl=None, scope='all'):
+    """
+    Keep the TradeStats row (and the TradeDailyPnl rollup) in step with every
+    flushed Trade change, in the same transaction. Counts, sums, win/loss
+    totals and reward:risk are exact after any insert, edit or delete, and so
+    are the rollup rows (both are additive). Best win / worst loss follow
+    inserts in any order. Only what depends on trade order (drawdown, streaks)
+    or on a removed extremum is marked stale: by back-dated inserts, deletes,
+    and edits to date, pnl or result (or to the symbol of the best/worst
+    trade). get_trade_stats() serves the row as is and schedules a rebuild.
+    """
+
+    @event.listens_for(Session, 'before_flush')
+    def _track_trade_stats(session, flush_context, instances):
+        new = [o for o in session.new if isinstance(o, Trade)]
+        deleted = [o for o in session.deleted if isinstance(o, Trade)]
+        dirty = [o for o in session.dirty
+                 if isinstance(o, Trade) and o not in session.deleted and _changed(o)]
+        if not (new or deleted or dirty):
+            return
+
+        # Row lock serialises concurrent writers (and waits out a rebuild); the
+        # row is only created by rebuild_trade_stats, so a missing row never
+        # fails a trade write
+        stats = session.query(TradeStats).filter_by(scope=scope).with_for_update().first()
+        if stats is None:
+            return
+
+        days = {}
+        for trade in deleted:
+            old = _values(trade, old=True)
+            _add(stats, old, -1)
+            _day_delta(days, old, -1)
+            stats.stale = True
+        for trade in dirty:
+            old, cur = _values(trade, old=True), _values(trade)
+            _add(stats, old, -1)
+            _add(stats, cur)
+            _day_delta(days, old, -1)
+            _day_delta(days, cur, 1)
+            if _changed(trade, ORDERED_FIELDS) or (
+                    _changed(trade, ('symbol',)) and _holds_extremum(stats, old)):
+                stats.stale = True
+            _extrema(stats, cur)
+
+        for v in sorted((_values(t) for t in new), key=lambda v: v['date'] or datetime.min):
+            _add(stats, v)
+            _extrema(stats, v)
+            _day_delta(days, v, 1)
+            if stats.stale or v['date'] is None or (
+                    stats.last_trade_date is not None and v['date'] < stats.last_trade_date):
+                stats.stale = True
+            else:
+                _append(stats, v)
+
+        if TradeDailyPnl is not None and days:
+            _upsert_daily(session, TradeDailyPnl, scope, days)
+
+    return _track_trade_stats
+
+
+def rebuild_trade_stats(db, Trade, TradeStats, scope='all', TradeDailyPnl=None, only_if_stale=False):
+    """
+    Recompute the TradeStats row from scratch in one ordered column scan, and
+    the daily rollup too when TradeDailyPnl is given. With only_if_stale, a
+    row that is already current once the lock is held (another process just
+    rebuilt it) is returned untouched.
+    """
+    # Create the row race-free; a new row is stale until this build commits
+    insert = _insert_for(db.session)
+    db.session.execute(insert(TradeStats.__table__).values(scope=scope, stale=True)
+                       .on_conflict_do_nothing(index_elements=['scope']))
+    stats = db.session.query(TradeStats).filter_by(scope=scope).with_for_update() \
+        .populate_existing().one()
+    if only_if_stale and not stats.stale and stats.rebuilt_at is not None:
+        db.session.commit()
+        return stats
+    _reset(stats)
+
+    if TradeDailyPnl is not None:
+        rebuild_daily_pnl(db, Trade, TradeDailyPnl, scope)
+
+    rows = db.session.query(*(getattr(Trade, f) for f in STATS_FIELDS)) \
+        .order_by(Trade.date, Trade.id).yield_per(5000)
+    for row in rows:
+        v = dict(zip(STATS_FIELDS, row))
+        _add(stats, v)
+        _extrema(stats, v)
+        _append(stats, v)
+
+    stats.stale = False
+    stats.rebuilt_at = datetime.utcnow()
+    db.session.commit()
+    return stats
+
+
+def get_trade_stats(db, Trade, TradeStats, TradeDailyPnl=None, scope='all', schedule_rebuild=None):
+    """
+    The TradeStats row; None if it does not exist and cannot be built. The
+    first build (with the daily rollup) runs once, in the calling request;
+    concurrent first builds wait for each other instead of failing. A stale
+    row is returned as is, since its totals are exact, and
+    schedule_rebuild(scope) refreshes drawdown, streaks and best/worst off
+    the request path (without a scheduler it is rebuilt here).
+    """
+    stats = TradeStats.query.filter_by(scope=scope).first()
+    if stats is None or stats.rebuilt_at is None:
+        kwargs = {'only_if_stale': True, 'TradeDailyPnl': TradeDailyPnl}
+    elif TradeDailyPnl is not None and stats.trade_count and \
+            db.session.query(TradeDailyPnl.id).filter_by(scope=scope).first() is None:
+        kwargs = {'TradeDailyPnl': TradeDailyPnl}
+    elif not stats.stale:
+        return stats
+    elif schedule_rebuild is not None:
+        try:
+            schedule_rebuild(scope)
+        except Exception as e:
+            print(f"[TRADE_STATS] Could not schedule rebuild: {e}")
+            db.session.rollback()
+        return stats
+    else:
+        kwargs = {'only_if_stale': True}
+
+    try:
+        return rebuild_trade_stats(db, Trade, TradeStats, scope, **kwargs)
+    except Exception as e:
+        print(f"[TRADE_STATS] Rebuild failed: {e}")
+        db.session.rollback()
+        return TradeStats.query.filter_by(scope=scope).first()
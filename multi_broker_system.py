@@ -6,6 +6,11 @@ from dotenv import load_dotenv
 from datetime import datetime
 import pyotp
 
+from upstream_http import upstream, pooled
+from broker_clients import broker_clients, token_fingerprint
+from broker_session_store import session_store
+import broker_fanout
+
 # KiteConnect SDK
 from kiteconnect import KiteConnect
 
@@ -13,11 +18,11 @@ from kiteconnect import KiteConnect
 try:
     from dhanhq import DhanHQ
     def make_dhan_client(client_id: str, access_token: str):
-        return DhanHQ(client_id=client_id, access_token=access_token)
+        return pooled(DhanHQ(client_id=client_id, access_token=access_token), "dhan")
 except ImportError:
     from dhanhq import dhanhq as _dhan_factory
     def make_dhan_client(client_id: str, access_token: str):
-        return _dhan_factory(client_id, access_token)
+        return pooled(_dhan_factory(client_id, access_token), "dhan")
 
 # Angel One SmartAPI SDK
 try:
@@ -38,27 +43,43 @@ if os.getenv('FLASK_ENV') == 'production':
 else:
     BASE_URL = os.getenv("APP_BASE_URL", "http://localhost:5000")
 
-# In-memory stores (replace with DB in production)
-USER_APPS = {
-    "kite": {},
-    "dhan": {},
-    "angel": {}
-}
-USER_SESSIONS = {
-    "kite": {},
-    "dhan": {},
-    "angel": {}
-}
+# Shared with journal.py; sessions are visible to every worker (see broker_session_store)
+USER_APPS = session_store.apps
+USER_SESSIONS = session_store.sessions
+
+
+def _revive_angel_session(user_id, sess):
+    """SmartConnect for an Angel session that another worker logged in"""
+    token = sess.get("access_token") or sess.get("jwt_token")
+    creds = USER_APPS["angel"].get(user_id) or {}
+    api_key = sess.get("angel_client_id") or creds.get("api_key")
+    if SmartConnect is None or not token or not api_key:
+        return {}
+    smart = pooled(SmartConnect(api_key=api_key, access_token=token,
+                                refresh_token=sess.get("refresh_token"),
+                                feed_token=sess.get("feed_token")), "angel")
+    return {"smart_api": smart}
+
+
+session_store.register_reviver("angel", _revive_angel_session)
+
+
+def _angel_smart_api(user_id):
+    return (USER_SESSIONS["angel"].get(user_id) or {}).get("smart_api")
 
 # ===================== KITE HELPERS =====================
 def get_kite_for_user(user_id, access_token=None):
     creds = USER_APPS["kite"].get(user_id)
     if not creds:
         raise ValueError("No app credentials for this user")
-    kite = KiteConnect(api_key=creds["api_key"])
-    if access_token:
-        kite.set_access_token(access_token)
-    return kite
+
+    def build():
+        kite = pooled(KiteConnect(api_key=creds["api_key"]), "kite")
+        if access_token:
+            kite.set_access_token(access_token)
+        return kite
+
+    return broker_clients.get("kite", user_id, token_fingerprint(creds["api_key"], access_token), build)
 
 # ===================== DHAN HELPERS =====================
 DHAN_AUTH_BASE = "https://auth.dhan.co"
@@ -72,7 +93,7 @@ def _dhan_headers(partner_id, partner_secret):
 
 def _dhan_generate_consent(partner_id, partner_secret):
     url = f"{DHAN_AUTH_BASE}/partner/generate-consent"
-    r = requests.post(url, headers=_dhan_headers(partner_id, partner_secret), json={})
+    r = upstream.post(url, endpoint="dhan.consent", headers=_dhan_headers(partner_id, partner_secret), json={})
     r.raise_for_status()
     data = r.json() if r.headers.get("content-type","").startswith("application/json") else {}
     consent_id = data.get("consentId") or data.get("consent_id")
@@ -82,7 +103,7 @@ def _dhan_generate_consent(partner_id, partner_secret):
 
 def _dhan_consume_consent(partner_id, partner_secret, token_id):
     url = f"{DHAN_AUTH_BASE}/partner/consume-consent"
-    r = requests.get(url, headers=_dhan_headers(partner_id, partner_secret), params={"tokenId": token_id})
+    r = upstream.get(url, endpoint="dhan.consent", retries=0, headers=_dhan_headers(partner_id, partner_secret), params={"tokenId": token_id})
     r.raise_for_status()
     return r.json()
 
@@ -102,8 +123,9 @@ def _dhan_client_from_session(user_id):
         return None, jsonify({"ok": False, "message": "Missing Dhan access token"}), 500
     
     try:
-        client = make_dhan_client(client_id, access_token)
-        print(f"Dhan client created successfully for {user_id}")
+        client = broker_clients.get("dhan", user_id, token_fingerprint(client_id, access_token),
+                                    lambda: make_dhan_client(client_id, access_token))
+        print(f"Dhan client ready for {user_id}")
         return client, None, None
     except Exception as e:
         print(f"Error creating Dhan client: {e}")
@@ -113,7 +135,7 @@ def _dhan_client_from_session(user_id):
 def _angel_sdk_login(api_key: str, client_code: str, password: str, totp: str):
     if SmartConnect is None:
         raise RuntimeError("SmartAPI not available")
-    smart = SmartConnect(api_key=api_key)
+    smart = pooled(SmartConnect(api_key=api_key), "angel")
     data = smart.generateSession(clientCode=client_code, password=password, totp=totp)
     if data.get('errorcode'):
         raise RuntimeError(f"Angel login failed: {data.get('message')}")
@@ -184,7 +206,7 @@ def kite_callback():
     if not creds:
         return f"No stored credentials for user {user_id}. Please register Kite app first.", 400
     
-    kite = KiteConnect(api_key=creds["api_key"])
+    kite = pooled(KiteConnect(api_key=creds["api_key"]), "kite")
     try:
         data = kite.generate_session(request_token, api_secret=creds["api_secret"])
         USER_SESSIONS["kite"][user_id] = {
@@ -349,13 +371,10 @@ def angel_login_password():
             "feed_token": result["feed_token"],
             "angel_client_id": creds["api_key"],
             "client_code": client_code,
-            "connected": True
+            "connected": True,
+            # Kept in this worker only; others rebuild it from the tokens
+            "smart_api": result["smart_api"]
         }
-        
-        # Store SmartConnect object separately (not in session)
-        if not hasattr(USER_SESSIONS["angel"], "_smart_apis"):
-            USER_SESSIONS["angel"]["_smart_apis"] = {}
-        USER_SESSIONS["angel"]["_smart_apis"][user_id] = result["smart_api"]
         # Redirect to calculatentrade_journal real_broker_connect page
         return redirect("/calculatentrade_journal/real_broker_connect?login_success=angel&user_id=" + user_id)
     except Exception as e:
@@ -495,8 +514,8 @@ def angel_orders():
     if not sess:
         return jsonify({"ok": False, "message": "Not connected"}), 401
     
-    # Get SmartConnect object from separate storage
-    smart_api = USER_SESSIONS["angel"].get("_smart_apis", {}).get(user_id)
+    # SmartConnect object from the session (rebuilt if another worker logged in)
+    smart_api = _angel_smart_api(user_id)
     if not smart_api:
         return jsonify({"ok": False, "message": "SmartAPI object not found"}), 401
     
@@ -532,8 +551,8 @@ def angel_positions():
     if not sess:
         return jsonify({"ok": False, "message": "Not connected"}), 401
     
-    # Get SmartConnect object from separate storage
-    smart_api = USER_SESSIONS["angel"].get("_smart_apis", {}).get(user_id)
+    # SmartConnect object from the session (rebuilt if another worker logged in)
+    smart_api = _angel_smart_api(user_id)
     if not smart_api:
         return jsonify({"ok": False, "message": "SmartAPI object not found"}), 401
     
@@ -569,8 +588,8 @@ def angel_trades():
     if not sess:
         return jsonify({"ok": False, "message": "Not connected"}), 401
     
-    # Get SmartConnect object from separate storage
-    smart_api = USER_SESSIONS["angel"].get("_smart_apis", {}).get(user_id)
+    # SmartConnect object from the session (rebuilt if another worker logged in)
+    smart_api = _angel_smart_api(user_id)
     if not smart_api:
         return jsonify({"ok": False, "message": "SmartAPI object not found"}), 401
     
@@ -686,9 +705,8 @@ def angel_status():
     if not sess:
         return jsonify({"msg": "no session"})
     
-    # Check if SmartConnect object exists in separate storage
-    has_smart_api = user_id in USER_SESSIONS["angel"].get("_smart_apis", {})
-    smart_api = USER_SESSIONS["angel"].get("_smart_apis", {}).get(user_id)
+    smart_api = _angel_smart_api(user_id)
+    has_smart_api = smart_api is not None
     
     # Test API call if SmartConnect object exists
     api_test_result = None
@@ -712,6 +730,18 @@ def angel_status():
     })
 
 # ===================== BROKER API ENDPOINTS =====================
+def _all_data_response(fetched, empty):
+    """get-all-data body from a fan-out: failed or late calls come back empty and are listed in errors"""
+    if not fetched.ok:
+        return jsonify({"success": False, "message": "All broker calls failed", "errors": fetched.errors}), 502
+    response = {
+        "success": True,
+        "data": {name: fetched.get(name, default) for name, default in empty.items()}
+    }
+    if fetched.errors:
+        response["errors"] = fetched.errors
+    return jsonify(response)
+
 @broker_api_bp.route('/get-all-data', methods=['GET'])
 def api_get_all_data():
     """Get all broker data via /api/broker/get-all-data"""
@@ -731,14 +761,12 @@ def api_get_all_data():
                 return jsonify({"success": False, "message": "Kite not connected"}), 401
             
             kite = get_kite_for_user(user_id, sess["access_token"])
-            return jsonify({
-                "success": True,
-                "data": {
-                    "orders": kite.orders(),
-                    "positions": kite.positions(),
-                    "trades": kite.trades()
-                }
+            fetched = broker_fanout.fan_out({
+                "orders": kite.orders,
+                "positions": kite.positions,
+                "trades": kite.trades,
             })
+            return _all_data_response(fetched, {"orders": [], "positions": {}, "trades": []})
             
         elif broker == 'dhan':
             client, resp, code = _dhan_client_from_session(user_id)
@@ -746,82 +774,89 @@ def api_get_all_data():
                 return jsonify({"success": False, "message": "Dhan not connected"}), 401
             
             # Get trades using the same logic as dhan_trades endpoint
-            trades = []
-            try:
-                # Method 1: get_trade_book (most common)
-                if hasattr(client, "get_trade_book"):
-                    try:
-                        trades = client.get_trade_book()
-                        print(f"Dhan get_trade_book returned: {trades}")
-                    except Exception as e:
-                        print(f"get_trade_book failed: {e}")
+            def fetch_trades():
+                trades = []
+                try:
+                    # Method 1: get_trade_book (most common)
+                    if hasattr(client, "get_trade_book"):
+                        try:
+                            trades = client.get_trade_book()
+                            print(f"Dhan get_trade_book returned: {trades}")
+                        except Exception as e:
+                            print(f"get_trade_book failed: {e}")
                 
-                # Method 2: get_trade_history with today's date
-                if not trades and hasattr(client, "get_trade_history"):
-                    try:
-                        from datetime import datetime
-                        today = datetime.now().strftime("%Y-%m-%d")
-                        trades = client.get_trade_history(from_date=today, to_date=today, page_number=0)
-                        print(f"Dhan get_trade_history returned: {trades}")
-                    except Exception as e:
-                        print(f"get_trade_history failed: {e}")
+                    # Method 2: get_trade_history with today's date
+                    if not trades and hasattr(client, "get_trade_history"):
+                        try:
+                            from datetime import datetime
+                            today = datetime.now().strftime("%Y-%m-%d")
+                            trades = client.get_trade_history(from_date=today, to_date=today, page_number=0)
+                            print(f"Dhan get_trade_history returned: {trades}")
+                        except Exception as e:
+                            print(f"get_trade_history failed: {e}")
                 
-                # Method 3: get_tradebook (alternative spelling)
-                if not trades and hasattr(client, "get_tradebook"):
-                    try:
-                        trades = client.get_tradebook()
-                        print(f"Dhan get_tradebook returned: {trades}")
-                    except Exception as e:
-                        print(f"get_tradebook failed: {e}")
+                    # Method 3: get_tradebook (alternative spelling)
+                    if not trades and hasattr(client, "get_tradebook"):
+                        try:
+                            trades = client.get_tradebook()
+                            print(f"Dhan get_tradebook returned: {trades}")
+                        except Exception as e:
+                            print(f"get_tradebook failed: {e}")
                 
-                # Method 4: tradebook property
-                if not trades and hasattr(client, "tradebook"):
-                    try:
-                        trades = client.tradebook()
-                        print(f"Dhan tradebook() returned: {trades}")
-                    except Exception as e:
-                        print(f"tradebook() failed: {e}")
+                    # Method 4: tradebook property
+                    if not trades and hasattr(client, "tradebook"):
+                        try:
+                            trades = client.tradebook()
+                            print(f"Dhan tradebook() returned: {trades}")
+                        except Exception as e:
+                            print(f"tradebook() failed: {e}")
                 
-                # Handle response format
-                if isinstance(trades, dict):
-                    if 'data' in trades:
-                        trades = trades['data']
-                    elif 'tradebook' in trades:
-                        trades = trades['tradebook']
+                    # Handle response format
+                    if isinstance(trades, dict):
+                        if 'data' in trades:
+                            trades = trades['data']
+                        elif 'tradebook' in trades:
+                            trades = trades['tradebook']
                 
-                # Ensure trades is a list
-                if not isinstance(trades, list):
-                    trades = []
+                    # Ensure trades is a list
+                    if not isinstance(trades, list):
+                        trades = []
                 
-                print(f"Final Dhan trades count: {len(trades)}")
-            except Exception as e:
-                print(f"Error getting Dhan trades: {e}")
-                trades = []
-            
-            return jsonify({
-                "success": True,
-                "data": {
-                    "orders": client.get_order_list(),
-                    "positions": client.get_positions(),
-                    "trades": trades
-                }
+                    print(f"Final Dhan trades count: {len(trades)}")
+                except Exception as e:
+                    print(f"Error getting Dhan trades: {e}")
+                    trades = []
+                return trades
+
+            fetched = broker_fanout.fan_out({
+                "orders": client.get_order_list,
+                "positions": client.get_positions,
+                "trades": fetch_trades,
             })
+            return _all_data_response(fetched, {"orders": [], "positions": [], "trades": []})
             
         elif broker == 'angel':
             sess = USER_SESSIONS["angel"].get(user_id)
             if not sess:
                 return jsonify({"success": False, "message": "Angel not connected"}), 401
             
-            # Get SmartConnect object from separate storage
-            smart_api = USER_SESSIONS["angel"].get("_smart_apis", {}).get(user_id)
+            # SmartConnect object from the session (rebuilt if another worker logged in)
+            smart_api = _angel_smart_api(user_id)
             if not smart_api:
                 return jsonify({"success": False, "message": "SmartAPI object not found"}), 401
             
             # Fetch all data with proper error handling
             try:
-                orders_response = smart_api.orderBook()
-                positions_response = smart_api.position()
-                trades_response = smart_api.tradeBook()
+                fetched = broker_fanout.fan_out({
+                    "orders": smart_api.orderBook,
+                    "positions": smart_api.position,
+                    "trades": smart_api.tradeBook,
+                })
+                if not fetched.ok:
+                    raise RuntimeError("; ".join(f"{name}: {err}" for name, err in fetched.errors.items()))
+                orders_response = fetched.get("orders")
+                positions_response = fetched.get("positions")
+                trades_response = fetched.get("trades")
                 
                 # Debug logging for Angel One API responses
                 print(f"Angel get-all-data - Orders response type: {type(orders_response)}, length: {len(orders_response) if isinstance(orders_response, (list, dict)) else 'N/A'}")
@@ -854,14 +889,17 @@ def api_get_all_data():
                 
                 print(f"Angel processed data - Orders: {len(orders)}, Positions: {len(positions)}, Trades: {len(trades)}")
                 
-                return jsonify({
+                response = {
                     "success": True,
                     "data": {
                         "orders": orders,
                         "positions": positions,
                         "trades": trades
                     }
-                })
+                }
+                if fetched.errors:
+                    response["errors"] = fetched.errors
+                return jsonify(response)
             except Exception as e:
                 print(f"Angel get-all-data error: {str(e)}")
                 return jsonify({"success": False, "message": f"Angel API error: {str(e)}"}), 500
@@ -915,13 +953,10 @@ def validate_session(broker, user_id):
 def disconnect_broker_session(broker, user_id):
     """Disconnect from a broker"""
     try:
-        # Remove from memory
-        if broker in USER_SESSIONS and user_id in USER_SESSIONS[broker]:
-            del USER_SESSIONS[broker][user_id]
-        
-        # Also clean up SmartConnect objects for Angel One
-        if broker == 'angel' and "_smart_apis" in USER_SESSIONS["angel"] and user_id in USER_SESSIONS["angel"]["_smart_apis"]:
-            del USER_SESSIONS["angel"]["_smart_apis"][user_id]
+        # Remove from every worker (Angel's SmartConnect goes with the session)
+        if broker in USER_SESSIONS:
+            USER_SESSIONS[broker].pop(user_id, None)
+        broker_clients.evict(broker, user_id)
         
         if request.method == 'GET':
             return redirect('/calculatentrade_journal/real_broker_connect')
@@ -937,10 +972,6 @@ def saved_sessions():
         
         for broker in ['kite', 'dhan', 'angel']:
             for user_id, sess in USER_SESSIONS[broker].items():
-                # Skip _smart_apis entries for Angel One
-                if broker == 'angel' and user_id == '_smart_apis':
-                    continue
-                    
                 session_info = {
                     'broker': broker,
                     'user_id': user_id,
@@ -970,18 +1001,15 @@ def debug_sessions():
     
     # Show Angel sessions (without sensitive data)
     for user_id, sess in USER_SESSIONS["angel"].items():
-        if user_id != "_smart_apis":
-            debug_info["angel_sessions"][user_id] = {
-                "has_access_token": bool(sess.get("access_token")),
-                "client_code": sess.get("client_code"),
-                "connected": sess.get("connected", False),
-                "session_keys": list(sess.keys())
-            }
-    
-    # Show SmartAPI objects
-    smart_apis = USER_SESSIONS["angel"].get("_smart_apis", {})
-    for user_id in smart_apis:
-        debug_info["angel_smart_apis"][user_id] = "exists"
+        debug_info["angel_sessions"][user_id] = {
+            "has_access_token": bool(sess.get("access_token")),
+            "client_code": sess.get("client_code"),
+            "connected": sess.get("connected", False),
+            "session_keys": list(sess.keys())
+        }
+        # Show SmartAPI objects
+        if sess.get("smart_api") is not None:
+            debug_info["angel_smart_apis"][user_id] = "exists"
     
     return jsonify(debug_info)
 
@@ -0,0 +1,178 @@
+"""
+One portfolio across brokers
+Kite, Dhan and Angel return holdings and positions in different shapes and
+field names. normalize_* map them to one row schema:
+
+    {broker, symbol, exchange, product, quantity, average_price, last_price, pnl}
+
+and merge_by_symbol folds rows for the same instrument across brokers.
+"""
+
+# Suffixes brokers add to the NSE/BSE trading symbol (RELIANCE-EQ -> RELIANCE)
+SYMBOL_SERIES_SUFFIXES = ("-EQ", "-BE", "-BZ", "-SM", "-ST")
+
+
+def _num(value):
+    try:
+        return float(str(value).replace(",", ""))
+    except (TypeError, ValueError):
+        return None
+
+
+def _first(row, *fields):
+    for field in fields:
+        value = row.get(field)
+        if value not in (None, ""):
+            return value
+    return None
+
+
+# Error codes meaning the session's token is no longer accepted
+AUTH_ERROR_CODES = {"DH-901", "DH-902", "AG8001", "AG8002", "AG8003"}
+
+
+def failure(response):
+    """
+    (message, auth_error) if an SDK response is an API error payload, else None.
+    Dhan and Angel return errors instead of raising:
+    {'status': 'failure', 'remarks': ...} and {'status': False, 'message': ...}.
+    """
+    if not isinstance(response, dict):
+        return None
+    status = response.get("status")
+    if not (status is False or (isinstance(status, str) and status.lower() == "failure")):
+        return None
+    remarks = response.get("remarks")
+    code = response.get("errorcode") or response.get("error_code")
+    if isinstance(remarks, dict):
+        code = code or remarks.get("error_code")
+        message = remarks.get("error_message") or remarks.get("message")
+    else:
+        message = remarks
+    message = str(message or response.get("message") or "Broker returned an error")
+    auth = str(code or "").upper() in AUTH_ERROR_CODES or any(
+        word in message.lower() for word in ("token", "session", "authenticat", "unauthori"))
+    return (f"{code}: {message}" if code else message), auth
+
+
+def unwrap(response):
+    """The row list from an SDK response ({'data': [...]}, {'net': [...]} or a bare list)"""
+    if isinstance(response, dict):
+        if "net" in response:  # Kite positions: {'net': [...], 'day': [...]}
+            return response.get("net") or []
+        data = response.get("data")
+        if isinstance(data, dict) and "net" in data:
+            return data.get("net") or []
+        return data if isinstance(data, list) else []
+    return response if isinstance(response, list) else []
+
+
+def base_symbol(symbol):
+    symbol = (symbol or "").strip().upper()
+    for suffix in SYMBOL_SERIES_SUFFIXES:
+        if symbol.endswith(suffix):
+            return symbol[:-len(suffix)]
+    return symbol
+
+
+def _row(broker, symbol, exchange, product, quantity, average_price, last_price, pnl):
+    return {
+        "broker": broker,
+        "symbol": base_symbol(symbol),
+        "exchange": exchange,
+        "product": product,
+        "quantity": quantity or 0.0,
+        "average_price": average_price,
+        "last_price": last_price,
+        "pnl": pnl,
+    }
+
+
+def normalize_holdings(broker, response):
+    rows = []
+    for h in unwrap(response):
+        if broker == "kite":
+            qty = (_num(h.get("quantity")) or 0) + (_num(h.get("t1_quantity")) or 0)
+            rows.append(_row(broker, h.get("tradingsymbol"), h.get("exchange"), h.get("product"), qty,
+                             _num(h.get("average_price")), _num(h.get("last_price")), _num(h.get("pnl"))))
+        elif broker == "dhan":
+            qty = _num(_first(h, "totalQty", "availableQty", "dpQty"))
+            avg, ltp = _num(h.get("avgCostPrice")), _num(_first(h, "lastTradedPrice", "ltp"))
+            pnl = (ltp - avg) * qty if None not in (ltp, avg, qty) else None
+            rows.append(_row(broker, h.get("tradingSymbol"), h.get("exchange"), "CNC", qty, avg, ltp, pnl))
+        elif broker == "angel":
+            rows.append(_row(broker, h.get("tradingsymbol"), h.get("exchange"), h.get("product"),
+                             _num(h.get("quantity")), _num(h.get("averageprice")), _num(h.get("ltp")),
+                             _num(h.get("profitandloss"))))
+    return rows
+
+
+def normalize_positions(broker, response):
+    rows = []
+    for p in unwrap(response):
+        if broker == "kite":
+            rows.append(_row(broker, p.get("tradingsymbol"), p.get("exchange"), p.get("product"),
+                             _num(p.get("quantity")), _num(p.get("average_price")), _num(p.get("last_price")),
+                             _num(p.get("pnl"))))
+        elif broker == "dhan":
+            realized, unrealized = _num(p.get("realizedProfit")), _num(p.get("unrealizedProfit"))
+            pnl = None if realized is None and unrealized is None else (realized or 0) + (unrealized or 0)
+            rows.append(_row(broker, p.get("tradingSymbol"), p.get("exchangeSegment"), p.get("productType"),
+                             _num(p.get("netQty")), _num(_first(p, "costPrice", "buyAvg")),
+                             _num(_first(p, "lastTradedPrice", "ltp")), pnl))
+        elif broker == "angel":
+            rows.append(_row(broker, p.get("tradingsymbol"), p.get("exchange"), p.get("producttype"),
+                             _num(p.get("netqty")), _num(_first(p, "avgnetprice", "netprice")),
+                             _num(p.get("ltp")), _num(_first(p, "pnl", "unrealised"))))
+    return rows
+
+
+def merge_by_symbol(rows):
+    """
+    One row per symbol: quantities and P&L summed, average price weighted by
+    quantity, per-broker rows kept under 'legs'. Sorted by |P&L|, largest first.
+    """
+    merged = {}
+    for row in rows:
+        m = merged.get(row["symbol"])
+        if m is None:
+            m = merged[row["symbol"]] = {"symbol": row["symbol"], "quantity": 0.0, "average_price": None,
+                                         "last_price": None, "pnl": None, "brokers": [], "legs": [],
+                                         "_cost": 0.0, "_cost_qty": 0.0}
+        m["quantity"] += row["quantity"]
+        if row["average_price"] is not None and row["quantity"]:
+            m["_cost"] += row["average_price"] * abs(row["quantity"])
+            m["_cost_qty"] += abs(row["quantity"])
+        if m["last_price"] is None:
+            m["last_price"] = row["last_price"]
+        if row["pnl"] is not None:
+            m["pnl"] = (m["pnl"] or 0.0) + row["pnl"]
+        if row["broker"] not in m["brokers"]:
+            m["brokers"].append(row["broker"])
+        m["legs"].append(row)
+
+    result = []
+    for m in merged.values():
+        cost, cost_qty = m.pop("_cost"), m.pop("_cost_qty")
+        m["average_price"] = round(cost / cost_qty, 4) if cost_qty else None
+        if m["pnl"] is not None:
+            m["pnl"] = round(m["pnl"], 2)
+        result.append(m)
+    return sorted(result, key=lambda m: abs(m["pnl"] or 0), reverse=True)
+
+
+def totals(merged_holdings, merged_positions):
+    def pnl(rows):
+        return round(sum(r["pnl"] or 0 for r in rows), 2)
+
+    invested = sum((r["average_price"] or 0) * abs(r["quantity"]) for r in merged_holdings)
+    current = sum((r["last_price"] if r["last_price"] is not None else (r["average_price"] or 0)) * abs(r["quantity"])
+                  for r in merged_holdings)
+    return {
+        "holdings_count": len(merged_holdings),
+        "positions_count": len(merged_positions),
+        "holdings_invested": round(invested, 2),
+        "holdings_value": round(current, 2),
+        "holdings_pnl": pnl(merged_holdings),
+        "positions_pnl": pnl(merged_positions),
+    }
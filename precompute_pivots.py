@@ -0,0 +1,190 @@
+#!/usr/bin/env python3
+"""
+Nightly pivot precomputation for CalculatenTrade
+Run after the NSE close (e.g. cron: 45 15 * * 1-5, IST). Fetches the base-day
+OHLC for every tracked NSE equity and stores Fibonacci and classic pivots in
+pivot_levels, so request paths only read precomputed levels.
+"""
+
+import os
+import sys
+import json
+import time
+import argparse
+import threading
+from concurrent.futures import ThreadPoolExecutor, as_completed
+
+# Add the current directory to Python path
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+PIVOT_JOB_WORKERS = int(os.getenv("PIVOT_JOB_WORKERS", "4"))
+PIVOT_JOB_RATE = float(os.getenv("PIVOT_JOB_RATE", "4"))  # upstream requests per second
+PIVOT_JOB_BATCH = 200
+
+
+class RateLimiter:
+    """Spaces calls at least 1/rate seconds apart across threads"""
+
+    def __init__(self, rate):
+        self.interval = 1.0 / rate if rate > 0 else 0
+        self._next = time.monotonic()
+        self._lock = threading.Lock()
+
+    def wait(self):
+        with self._lock:
+            now = time.monotonic()
+            slot = max(now, self._next)
+            self._next = slot + self.interval
+        delay = slot - now
+        if delay > 0:
+            time.sleep(delay)
+
+
+def _traded_symbols(db):
+    """Symbols that appear in any saved calculator trade, journal trade or watchlist"""
+    from sqlalchemy import text
+
+    symbols = set()
+    queries = [
+        "SELECT DISTINCT symbol FROM intraday_trades WHERE symbol IS NOT NULL",
+        "SELECT DISTINCT symbol FROM delivery_trades WHERE symbol IS NOT NULL",
+        "SELECT DISTINCT symbol FROM swing_trades WHERE symbol IS NOT NULL",
+        "SELECT DISTINCT symbol FROM mtf_trades WHERE symbol IS NOT NULL",
+        "SELECT DISTINCT symbol FROM trade WHERE symbol IS NOT NULL",
+    ]
+    for sql in queries:
+        try:
+            symbols.update(r[0] for r in db.session.execute(text(sql)).fetchall())
+        except Exception as e:
+            print(f"⚠ Skipping symbol source ({sql.split('FROM')[1].split()[0]}): {e}")
+            db.session.rollback()
+
+    try:
+        for (raw,) in db.session.execute(text("SELECT symbols FROM watchlists")).fetchall():
+            try:
+                symbols.update(json.loads(raw or "[]"))
+            except (ValueError, TypeError):
+                continue
+    except Exception as e:
+        print(f"⚠ Skipping watchlists: {e}")
+        db.session.rollback()
+
+    return {s.strip() for s in symbols if isinstance(s, str) and s.strip()}
+
+
+def _flush(db, rows, counted):
+    """
+    Commit a batch and return how many `counted` rows were stored. On a
+    conflict (a request stored the same row meanwhile) fall back to row-by-row.
+    """
+    if not rows:
+        return 0
+    try:
+        db.session.add_all(rows)
+        db.session.commit()
+        return sum(isinstance(r, counted) for r in rows)
+    except Exception:
+        db.session.rollback()
+
+    stored = 0
+    for row in rows:
+        try:
+            db.session.add(row)
+            db.session.commit()
+            stored += isinstance(row, counted)
+        except Exception:
+            db.session.rollback()
+    return stored
+
+
+def _universe(db, mode):
+    """Security ids to precompute"""
+    from instrument_index import get_instrument_index
+
+    index = get_instrument_index()
+    if mode == "all":
+        return sorted({inst.security_id for inst in index.snapshot(db).instruments})
+
+    sec_ids = set()
+    for symbol in _traded_symbols(db):
+        inst = index.resolve(db, symbol)
+        if inst:
+            sec_ids.add(inst.security_id)
+    return sorted(sec_ids)
+
+
+def precompute(mode="traded", workers=PIVOT_JOB_WORKERS, rate=PIVOT_JOB_RATE, force=False):
+    from app import (app, db, IST, OhlcDayCache, PivotLevels, fetch_intraday_ohlc,
+                     build_pivot_levels, last_completed_trading_day, pivot_base_day,
+                     is_zero_range, _market_closed_for_today, _dt)
+
+    with app.app_context():
+        now = _dt.now(IST)
+        if not force and not _market_closed_for_today(now):
+            print("⚠ Market has not closed yet; run after the NSE close or pass --force")
+            return False
+
+        # Today's pivot base, and tomorrow's (the day that just completed)
+        days = sorted({pivot_base_day(now), last_completed_trading_day(now)})
+        sec_ids = _universe(db, mode)
+        print(f"Precomputing pivots for {len(sec_ids)} securities on {', '.join(map(str, days))}")
+
+        limiter = RateLimiter(rate)
+
+        def fetch(sec_id, day):
+            limiter.wait()
+            return fetch_intraday_ohlc(sec_id, day)
+
+        stored = failed = skipped = 0
+        for day in days:
+            done = {r[0] for r in db.session.query(PivotLevels.security_id).filter_by(base_date=day)}
+            cached = {r.security_id: r.to_result() for r in OhlcDayCache.query.filter_by(trade_date=day)}
+            todo = [s for s in sec_ids if s not in done]
+
+            pending = [build_pivot_levels(s, day, cached[s]) for s in todo
+                       if s in cached and not is_zero_range(cached[s])]
+            to_fetch = [s for s in todo if s not in cached]
+
+            with ThreadPoolExecutor(max_workers=max(1, workers)) as pool:
+                futures = {pool.submit(fetch, sec_id, day): sec_id for sec_id in to_fetch}
+                for fut in as_completed(futures):
+                    sec_id = futures[fut]
+                    try:
+                        ohlc = fut.result()
+                    except Exception as e:
+                        failed += 1
+                        print(f"⚠ {sec_id} {day}: {e}")
+                        continue
+                    # Zero-range bars are stored neither as OHLC nor as pivots (same
+                    # rule as get_day_ohlc); the next run or a request refetches them
+                    if is_zero_range(ohlc):
+                        skipped += 1
+                        continue
+                    pending.append(OhlcDayCache(
+                        security_id=sec_id, trade_date=day,
+                        high=ohlc["high"], low=ohlc["low"], close=ohlc["close"],
+                        candles=ohlc["data"],
+                    ))
+                    pending.append(build_pivot_levels(sec_id, day, ohlc))
+
+                    if len(pending) >= PIVOT_JOB_BATCH:
+                        stored += _flush(db, pending, PivotLevels)
+                        pending = []
+
+            stored += _flush(db, pending, PivotLevels)
+
+        print(f"✓ Stored {stored} pivot rows ({failed} failed, {skipped} zero-range skipped)")
+        return True
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Precompute pivot levels after market close")
+    parser.add_argument("--universe", choices=["traded", "all"], default="traded",
+                        help="'traded' = symbols in saved trades/watchlists, 'all' = every NSE equity")
+    parser.add_argument("--workers", type=int, default=PIVOT_JOB_WORKERS)
+    parser.add_argument("--rate", type=float, default=PIVOT_JOB_RATE, help="max upstream requests per second")
+    parser.add_argument("--force", action="store_true", help="run even if the market has not closed")
+    args = parser.parse_args()
+
+    success = precompute(args.universe, args.workers, args.rate, args.force)
+    sys.exit(0 if success else 1)
@@ -0,0 +1,130 @@
+"""
+Live-price fan-out for Server-Sent Events
+Clients subscribe to a set of NSE equity security ids. One poller thread per
+worker fetches the union of all subscribed ids in a single batched call and
+pushes only changed prices to each subscriber, so upstream load grows with the
+number of distinct symbols rather than with users x symbols.
+"""
+
+import os
+import threading
+
+PRICE_STREAM_INTERVAL = float(os.getenv("PRICE_STREAM_INTERVAL", "1"))
+PRICE_STREAM_CLOSED_INTERVAL = float(os.getenv("PRICE_STREAM_CLOSED_INTERVAL", "30"))
+# Each open stream holds one gthread request thread, so keep this below GUNICORN_THREADS
+PRICE_STREAM_MAX_SUBSCRIBERS = int(os.getenv("PRICE_STREAM_MAX_SUBSCRIBERS", "4"))
+PRICE_STREAM_MAX_SYMBOLS = int(os.getenv("PRICE_STREAM_MAX_SYMBOLS", "50"))
+# Streams are closed after this long; EventSource reconnects on its own
+PRICE_STREAM_MAX_SECONDS = int(os.getenv("PRICE_STREAM_MAX_SECONDS", "300"))
+PRICE_STREAM_HEARTBEAT = float(os.getenv("PRICE_STREAM_HEARTBEAT", "15"))
+
+
+class PriceHubFull(Exception):
+    """Raised when this worker already serves PRICE_STREAM_MAX_SUBSCRIBERS streams"""
+
+
+class Subscription:
+    """One client's view of the hub; keeps only the latest value per id"""
+
+    def __init__(self, ids):
+        self.ids = frozenset(str(i) for i in ids)
+        self._sent = {}
+        self._pending = {}
+        self._cond = threading.Condition()
+
+    def offer(self, results):
+        """Queue results for ids this subscriber wants and whose value changed"""
+        with self._cond:
+            for sid in self.ids:
+                value = results.get(sid)
+                if value is None or self._sent.get(sid) == value:
+                    continue
+                self._pending[sid] = value
+            if self._pending:
+                self._cond.notify()
+
+    def next(self, timeout):
+        """Block up to timeout for changes; returns {security_id: ltp dict} (possibly empty)"""
+        with self._cond:
+            if not self._pending:
+                self._cond.wait(timeout)
+            ticks, self._pending = self._pending, {}
+            self._sent.update(ticks)
+            return ticks
+
+
+class PriceHub:
+    """Per-process subscriber registry with a single upstream poller thread"""
+
+    def __init__(self, fetch_many, interval_fn=lambda: PRICE_STREAM_INTERVAL,
+                 max_subscribers=PRICE_STREAM_MAX_SUBSCRIBERS):
+        self.fetch_many = fetch_many
+        self.interval_fn = interval_fn
+        self.max_subscribers = max_subscribers
+        self._subs = set()
+        self._latest = {}
+        self._thread = None
+        self._wake = threading.Event()
+        self._pid = None
+        self._lock = threading.Lock()
+
+    def _reset_after_fork(self):
+        # Threads do not survive fork (preload_app); start a fresh poller per worker
+        pid = os.getpid()
+        if self._pid != pid:
+            self._subs = set()
+            self._latest = {}
+            self._thread = None
+            self._wake = threading.Event()
+            self._pid = pid
+
+    def subscribe(self, ids):
+        sub = Subscription(ids)
+        with self._lock:
+            self._reset_after_fork()
+            if len(self._subs) >= self.max_subscribers:
+                raise PriceHubFull(f"{len(self._subs)} price streams already open in this worker")
+            self._subs.add(sub)
+            latest = {sid: self._latest[sid] for sid in sub.ids if sid in self._latest}
+            if self._thread is None or not self._thread.is_alive():
+                self._thread = threading.Thread(target=self._run, name="price-stream-poller", daemon=True)
+                self._thread.start()
+        # Send the last known prices straight away, then poll for ids nobody had yet
+        sub.offer(latest)
+        if len(latest) < len(sub.ids):
+            self._wake.set()
+        return sub
+
+    def unsubscribe(self, sub):
+        with self._lock:
+            self._subs.discard(sub)
+
+    @property
+    def subscriber_count(self):
+        return len(self._subs)
+
+    def _run(self):
+        while True:
+            with self._lock:
+                subs = list(self._subs)
+                if not subs:
+                    self._thread = None
+                    self._latest = {}
+                    return
+            ids = set().union(*(s.ids for s in subs))
+            try:
+                results = self.fetch_many(sorted(ids))
+            except Exception as e:
+                print(f"[PRICE_STREAM] Poll failed: {e}")
+                results = {}
+            self._latest = {sid: v for sid, v in results.items() if sid in ids}
+            for sub in subs:
+                sub.offer(results)
+
+            self._wake.wait(max(0.1, self.interval_fn()))
+            self._wake.clear()
+
+
+def sse_event(event, data):
+    """Format one Server-Sent Events message (data is already JSON text)"""
+    return f"event: {event}\ndata: {data}\n\n"
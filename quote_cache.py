@@ -0,0 +1,229 @@
+"""
+Short-TTL quote cache for live prices
+Sits in front of the Dhan marketfeed calls so identical requests from many users
+share one upstream call. Entries live in a per-process near-cache backed by a
+SQLite file that all gunicorn workers on the host share. Misses are coalesced:
+within a process through a per-key in-flight event, across workers through a
+short lease row in the shared store.
+"""
+
+import os
+import json
+import time
+import sqlite3
+import threading
+
+QUOTE_CACHE_PATH = os.getenv("QUOTE_CACHE_PATH", "/tmp/calculatentrade_quotes.sqlite3")
+QUOTE_CACHE_LEASE_SECONDS = float(os.getenv("QUOTE_CACHE_LEASE_SECONDS", "5"))
+# How often set() sweeps expired entries out of the near-cache and the shared store
+QUOTE_CACHE_PURGE_SECONDS = float(os.getenv("QUOTE_CACHE_PURGE_SECONDS", "60"))
+
+
+class QuoteCache:
+    """TTL cache with single-flight misses and an optional cross-worker SQLite store"""
+
+    def __init__(self, ttl_fn, path=QUOTE_CACHE_PATH, lease_seconds=QUOTE_CACHE_LEASE_SECONDS,
+                 purge_seconds=QUOTE_CACHE_PURGE_SECONDS):
+        self.ttl_fn = ttl_fn
+        self.path = path
+        self.lease_seconds = lease_seconds
+        self.purge_seconds = purge_seconds
+        self._next_purge = time.time() + purge_seconds
+        self._near = {}
+        self._inflight = {}
+        self._lock = threading.Lock()
+        self._local = threading.local()
+        self._shared_ok = bool(path)
+        if self._shared_ok:
+            try:
+                self._setup()
+            except Exception as e:
+                print(f"[QUOTE_CACHE] Shared store disabled: {e}")
+                self._shared_ok = False
+
+    # ----------------- shared store ----------------- #
+    @property
+    def owner(self):
+        return str(os.getpid())
+
+    def _conn(self):
+        # One connection per thread, reopened after fork (preload_app)
+        pid = os.getpid()
+        if getattr(self._local, "pid", None) != pid:
+            conn = sqlite3.connect(self.path, timeout=1.0, isolation_level=None, check_same_thread=False)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=OFF")
+            self._local.conn = conn
+            self._local.pid = pid
+        return self._local.conn
+
+    def _setup(self):
+        conn = self._conn()
+        conn.execute("""
+            CREATE TABLE IF NOT EXISTS quotes (
+                key TEXT PRIMARY KEY,
+                value TEXT NOT NULL,
+                expires_at REAL NOT NULL
+            )
+        """)
+        conn.execute("""
+            CREATE TABLE IF NOT EXISTS quote_leases (
+                key TEXT PRIMARY KEY,
+                owner TEXT NOT NULL,
+                expires_at REAL NOT NULL
+            )
+        """)
+
+    def _shared_get(self, key, now):
+        if not self._shared_ok:
+            return None
+        try:
+            row = self._conn().execute(
+                "SELECT value, expires_at FROM quotes WHERE key = ?", (key,)
+            ).fetchone()
+        except Exception as e:
+            print(f"[QUOTE_CACHE] Read failed: {e}")
+            return None
+        if row and row[1] > now:
+            return json.loads(row[0]), row[1]
+        return None
+
+    def _shared_set(self, key, value, expires_at):
+        if not self._shared_ok:
+            return
+        try:
+            conn = self._conn()
+            conn.execute(
+                "INSERT OR REPLACE INTO quotes (key, value, expires_at) VALUES (?, ?, ?)",
+                (key, json.dumps(value), expires_at),
+            )
+        except Exception as e:
+            print(f"[QUOTE_CACHE] Write failed: {e}")
+
+    def _acquire_lease(self, key, now):
+        """True if this worker should call upstream for key"""
+        if not self._shared_ok:
+            return True
+        try:
+            conn = self._conn()
+            conn.execute("DELETE FROM quote_leases WHERE key = ? AND expires_at <= ?", (key, now))
+            cur = conn.execute(
+                "INSERT OR IGNORE INTO quote_leases (key, owner, expires_at) VALUES (?, ?, ?)",
+                (key, self.owner, now + self.lease_seconds),
+            )
+            return cur.rowcount == 1
+        except Exception as e:
+            print(f"[QUOTE_CACHE] Lease failed: {e}")
+            return True
+
+    def _release_lease(self, key):
+        if not self._shared_ok:
+            return
+        try:
+            self._conn().execute("DELETE FROM quote_leases WHERE key = ? AND owner = ?", (key, self.owner))
+        except Exception:
+            pass
+
+    def _lease_held(self, key, now):
+        try:
+            return self._conn().execute(
+                "SELECT 1 FROM quote_leases WHERE key = ? AND expires_at > ?", (key, now)
+            ).fetchone() is not None
+        except Exception:
+            return False
+
+    def _wait_for_peer(self, key):
+        """
+        Another worker holds the lease; poll the shared store until it publishes.
+        The holder releases the lease whether or not it cached a value, so a
+        released lease with nothing published means its fetch failed: stop
+        waiting and let the caller fetch.
+        """
+        deadline = time.time() + self.lease_seconds
+        while time.time() < deadline:
+            time.sleep(0.05)
+            now = time.time()
+            hit = self._shared_get(key, now)
+            if hit:
+                return hit
+            if not self._lease_held(key, now):
+                return None
+        return None
+
+    # ----------------- public API ----------------- #
+    def peek(self, key):
+        """Cached value for key or None, without fetching"""
+        now = time.time()
+        entry = self._near.get(key)
+        if entry and entry[1] > now:
+            return entry[0]
+        hit = self._shared_get(key, now)
+        if hit:
+            self._near[key] = hit
+            return hit[0]
+        return None
+
+    def set(self, key, value, ttl=None):
+        ttl = self.ttl_fn() if ttl is None else ttl
+        if ttl <= 0:
+            return
+        now = time.time()
+        self._near[key] = (value, now + ttl)
+        self._shared_set(key, value, now + ttl)
+        if now >= self._next_purge:
+            self._next_purge = now + self.purge_seconds
+            self.purge_expired()
+
+    def get_or_fetch(self, key, fetch, cacheable=lambda value: True):
+        """
+        Return the cached value for key, or call fetch() exactly once across
+        concurrent callers and cache its result when cacheable(result).
+        """
+        value = self.peek(key)
+        if value is not None:
+            return value
+
+        with self._lock:
+            slot = self._inflight.get(key)
+            leader = slot is None
+            if leader:
+                slot = {"event": threading.Event(), "value": None}
+                self._inflight[key] = slot
+
+        if not leader:
+            # Share the leader's result, even an uncacheable error
+            if slot["event"].wait(self.lease_seconds * 2) and slot["value"] is not None:
+                return slot["value"]
+            return self.peek(key) or fetch()
+
+        try:
+            if not self._acquire_lease(key, time.time()):
+                hit = self._wait_for_peer(key)
+                if hit:
+                    self._near[key] = hit
+                    slot["value"] = hit[0]
+                    return hit[0]
+            value = fetch()
+            if cacheable(value):
+                self.set(key, value)
+            slot["value"] = value
+            return value
+        finally:
+            self._release_lease(key)
+            with self._lock:
+                self._inflight.pop(key, None)
+            slot["event"].set()
+
+    def purge_expired(self):
+        """Drop expired entries and leases (run from set() every purge_seconds)"""
+        now = time.time()
+        for key, (_, expires_at) in list(self._near.items()):
+            if expires_at <= now:
+                self._near.pop(key, None)
+        if self._shared_ok:
+            try:
+                conn = self._conn()
+                conn.execute("DELETE FROM quotes WHERE expires_at <= ?", (now,))
+                conn.execute("DELETE FROM quote_leases WHERE expires_at <= ?", (now,))
+            except Exception as e:
+                print(f"[QUOTE_CACHE] Purge failed: {e}")
@@ -0,0 +1,41 @@
+#!/usr/bin/env python3
+"""
+Rebuild the journal's trade_stats row and trade_daily_pnl rollup from the trade table
+Both are maintained incrementally on every trade write; run this after bulk
+SQL edits, restores or anything else that bypassed the ORM, or on a schedule
+to clear floating-point drift.
+"""
+
+import os
+import sys
+import argparse
+
+# Add the current directory to Python path
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+
+def rebuild(scope="all"):
+    from app import app
+    from journal import db, Trade, TradeStats, TradeDailyPnl
+    import journal_metrics
+
+    with app.app_context():
+        TradeStats.__table__.create(bind=db.engine, checkfirst=True)
+        TradeDailyPnl.__table__.create(bind=db.engine, checkfirst=True)
+        stats = journal_metrics.rebuild_trade_stats(db, Trade, TradeStats, scope, TradeDailyPnl=TradeDailyPnl)
+        print(f"✓ Rebuilt trade stats ({scope}): {stats.trade_count} trades, "
+              f"PnL {stats.total_pnl:.2f}, max drawdown {stats.max_drawdown:.2f}")
+        return True
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Rebuild the trade_stats row and daily PnL rollup from scratch")
+    parser.add_argument("--scope", default="all")
+    args = parser.parse_args()
+
+    try:
+        success = rebuild(args.scope)
+    except Exception as e:
+        print(f"❌ Rebuild failed: {e}")
+        success = False
+    sys.exit(0 if success else 1)
@@ -0,0 +1,47 @@
+/**
+ * Background job polling for CalculateNTrade
+ * Routes that queue work (backtests, broker imports, long-range reports)
+ * answer 202 with a job_id; waitForJob polls its status until it finishes.
+ */
+(function () {
+    const JOBS_URL = '/calculatentrade_journal/api/jobs/';
+
+    /**
+     * Resolve with the job's result once it succeeds; reject with an Error when
+     * it fails, is cancelled or cannot be polled.
+     * options.onProgress(job) is called on every poll, options.interval is in ms.
+     */
+    function waitForJob(jobId, options = {}) {
+        const interval = options.interval || 1000;
+        return new Promise((resolve, reject) => {
+            const poll = () => {
+                fetch(JOBS_URL + jobId, { credentials: 'same-origin' })
+                    .then(response => {
+                        if (!response.ok) throw new Error(`Job ${jobId}: HTTP ${response.status}`);
+                        return response.json();
+                    })
+                    .then(body => {
+                        const job = body.data;
+                        if (options.onProgress) options.onProgress(job);
+                        if (job.status === 'succeeded') {
+                            resolve(job.result);
+                        } else if (job.status === 'failed' || job.status === 'cancelled') {
+                            reject(new Error(job.error || `Job ${job.status}`));
+                        } else {
+                            setTimeout(poll, interval);
+                        }
+                    })
+                    .catch(reject);
+            };
+            poll();
+        });
+    }
+
+    function cancelJob(jobId) {
+        return fetch(JOBS_URL + jobId + '/cancel', { method: 'POST', credentials: 'same-origin' })
+            .then(response => response.json());
+    }
+
+    window.waitForJob = waitForJob;
+    window.cancelJob = cancelJob;
+})();
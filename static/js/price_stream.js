@@ -0,0 +1,74 @@
+// Price Stream - live prices pushed over /stream-prices (Server-Sent Events)
+// Falls back to polling /get-prices when EventSource is unavailable or the
+// server is at its stream limit. onPrices receives the /get-prices payload:
+// { prices: { SYMBOL: { price, security_id, segment, last_updated } }, errors: { SYMBOL: msg } }
+(function() {
+    'use strict';
+
+    const POLL_INTERVAL_MS = 5000;
+
+    function subscribePrices(symbols, onPrices) {
+        symbols = Array.from(new Set((symbols || []).map(s => String(s).trim()).filter(Boolean)));
+        let source = null;
+        let pollTimer = null;
+        let stopped = false;
+        let gotMessage = false;
+
+        async function poll() {
+            try {
+                const response = await fetch('/get-prices', {
+                    method: 'POST',
+                    headers: { 'Content-Type': 'application/json' },
+                    body: JSON.stringify({ symbols: symbols })
+                });
+                const data = await response.json();
+                if (!stopped && data && data.prices) onPrices(data);
+            } catch (e) {
+                console.error('Price poll failed', e);
+            }
+        }
+
+        function startPolling() {
+            if (stopped || pollTimer) return;
+            poll();
+            pollTimer = setInterval(poll, POLL_INTERVAL_MS);
+        }
+
+        if (!symbols.length) {
+            return { close: function() {} };
+        }
+
+        if (window.EventSource) {
+            source = new EventSource('/stream-prices?symbols=' + encodeURIComponent(symbols.join(',')));
+            source.addEventListener('prices', function(event) {
+                gotMessage = true;
+                try {
+                    onPrices(JSON.parse(event.data));
+                } catch (e) {
+                    console.error('Bad price event', e);
+                }
+            });
+            source.onerror = function() {
+                // A stream that never delivered anything was refused (busy/unsupported);
+                // otherwise EventSource reconnects by itself
+                if (!gotMessage || source.readyState === EventSource.CLOSED) {
+                    source.close();
+                    source = null;
+                    startPolling();
+                }
+            };
+        } else {
+            startPolling();
+        }
+
+        return {
+            close: function() {
+                stopped = true;
+                if (source) source.close();
+                if (pollTimer) clearInterval(pollTimer);
+            }
+        };
+    }
+
+    window.subscribePrices = subscribePrices;
+})();
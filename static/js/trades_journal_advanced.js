@@ -302,12 +302,16 @@ class TradingJournalAdvanced {
         trades.forEach((trade, index) => {
             const formattedTrade = this.formatTradeForImport(trade, broker, strategyId);
             
-            $.ajax({
+            // The merge runs as a background job; count the trade once it has finished
+            Promise.resolve($.ajax({
                 url: '/calculatentrade_journal/api/trades/from_broker',
                 method: 'POST',
                 contentType: 'application/json',
                 data: JSON.stringify(formattedTrade)
-            }).always(() => {
+            }))
+            .then(queued => (queued && queued.job_id && window.waitForJob) ? window.waitForJob(queued.job_id) : queued)
+            .catch(() => null)
+            .then(() => {
                 importedCount++;
                 const progress = 50 + (importedCount / totalCount) * 50;
                 $('#import-progress-bar').css('width', `${progress}%`);
@@ -0,0 +1,87 @@
+"""
+job_queue heartbeat and completion against a SQLite file database
+"""
+
+import os
+import sys
+import time
+from datetime import datetime
+
+import pytest
+from flask import Flask
+from flask_sqlalchemy import SQLAlchemy
+from sqlalchemy import update
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import job_queue  # noqa: E402
+
+db = SQLAlchemy()
+
+
+class BackgroundJob(db.Model):
+    __tablename__ = 'background_jobs'
+    id = db.Column(db.Integer, primary_key=True)
+    kind = db.Column(db.String(50), nullable=False)
+    status = db.Column(db.String(20), nullable=False, default='queued')
+    payload = db.Column(db.JSON, default=dict)
+    result = db.Column(db.JSON, nullable=True)
+    error = db.Column(db.Text, nullable=True)
+    progress = db.Column(db.Float, default=0.0)
+    progress_message = db.Column(db.String(255), nullable=True)
+    cancel_requested = db.Column(db.Boolean, default=False, nullable=False)
+    attempts = db.Column(db.Integer, default=0, nullable=False)
+    worker = db.Column(db.String(100), nullable=True)
+    created_at = db.Column(db.DateTime, default=datetime.utcnow, nullable=False)
+    started_at = db.Column(db.DateTime, nullable=True)
+    heartbeat_at = db.Column(db.DateTime, nullable=True)
+    finished_at = db.Column(db.DateTime, nullable=True)
+
+
+@job_queue.job_handler('test_sleep')
+def _sleep_job(ctx, payload):
+    time.sleep(payload.get('seconds', 0))
+    if payload.get('reclaim'):
+        # Simulate reclaim_stale + another worker claiming the job meanwhile
+        with ctx.db.engine.begin() as conn:
+            table = ctx.table
+            conn.execute(update(table).where(table.c.id == ctx.job_id).values(worker='other:1'))
+    return {'slept': payload.get('seconds', 0)}
+
+
+@pytest.fixture
+def app(tmp_path, monkeypatch):
+    monkeypatch.setattr(job_queue, 'JOB_HEARTBEAT_INTERVAL', 0.05)
+    app = Flask(__name__)
+    app.config['SQLALCHEMY_DATABASE_URI'] = f"sqlite:///{tmp_path / 'jobs.sqlite3'}"
+    db.init_app(app)
+    with app.app_context():
+        db.create_all()
+        yield app
+        db.session.remove()
+
+
+def test_heartbeat_advances_without_progress_calls(app, capsys):
+    job = job_queue.enqueue(db, BackgroundJob, 'test_sleep', {'seconds': 0.3})
+    claimed = job_queue.claim_next(db, BackgroundJob, 'host:1')
+    started = claimed.heartbeat_at
+
+    assert job_queue.run_job(db, BackgroundJob, claimed) == job_queue.SUCCEEDED
+    assert 'Heartbeat failed' not in capsys.readouterr().out
+
+    db.session.expire_all()
+    job = db.session.get(BackgroundJob, job.id)
+    assert job.status == job_queue.SUCCEEDED
+    assert job.heartbeat_at > started
+
+
+def test_reclaimed_run_does_not_overwrite_the_new_owner(app):
+    job = job_queue.enqueue(db, BackgroundJob, 'test_sleep', {'reclaim': True})
+    claimed = job_queue.claim_next(db, BackgroundJob, 'host:1')
+    job_queue.run_job(db, BackgroundJob, claimed)
+
+    db.session.expire_all()
+    job = db.session.get(BackgroundJob, job.id)
+    assert job.status == job_queue.RUNNING
+    assert job.worker == 'other:1'
+    assert job.result is None
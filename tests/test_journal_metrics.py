@@ -0,0 +1,205 @@
+"""
+journal_metrics write hook against an in-memory SQLite database
+The models mirror the journal's Trade / TradeStats / TradeDailyPnl columns that
+the hook reads and writes; journal.py itself needs the full app environment.
+"""
+
+import os
+import sys
+from datetime import date, datetime
+
+import pytest
+from flask import Flask
+from flask_sqlalchemy import SQLAlchemy
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import journal_metrics  # noqa: E402
+
+db = SQLAlchemy()
+
+
+class Trade(db.Model):
+    id = db.Column(db.Integer, primary_key=True)
+    symbol = db.Column(db.String(20), nullable=False)
+    entry_price = db.Column(db.Float, nullable=False, default=0)
+    exit_price = db.Column(db.Float, nullable=False, default=0)
+    quantity = db.Column(db.Float, nullable=False, default=1)
+    date = db.Column(db.DateTime, nullable=False)
+    result = db.Column(db.String(10), nullable=False)
+    pnl = db.Column(db.Float, nullable=False)
+    risk = db.Column(db.Float, default=0)
+    reward = db.Column(db.Float, default=0)
+
+
+class TradeStats(db.Model):
+    __tablename__ = 'trade_stats'
+    id = db.Column(db.Integer, primary_key=True)
+    scope = db.Column(db.String(32), nullable=False, unique=True, default='all')
+    trade_count = db.Column(db.Integer, default=0)
+    win_count = db.Column(db.Integer, default=0)
+    loss_count = db.Column(db.Integer, default=0)
+    positive_count = db.Column(db.Integer, default=0)
+    negative_count = db.Column(db.Integer, default=0)
+    total_pnl = db.Column(db.Float, default=0.0)
+    sum_pnl_sq = db.Column(db.Float, default=0.0)
+    win_pnl = db.Column(db.Float, default=0.0)
+    loss_pnl = db.Column(db.Float, default=0.0)
+    gross_profit = db.Column(db.Float, default=0.0)
+    gross_loss = db.Column(db.Float, default=0.0)
+    rr_sum = db.Column(db.Float, default=0.0)
+    rr_count = db.Column(db.Integer, default=0)
+    total_volume = db.Column(db.Float, default=0.0)
+    best_pnl = db.Column(db.Float)
+    best_symbol = db.Column(db.String(20))
+    worst_pnl = db.Column(db.Float)
+    worst_symbol = db.Column(db.String(20))
+    equity = db.Column(db.Float, default=0.0)
+    peak = db.Column(db.Float, default=0.0)
+    max_drawdown = db.Column(db.Float, default=0.0)
+    current_streak = db.Column(db.Integer, default=0)
+    longest_win_streak = db.Column(db.Integer, default=0)
+    longest_loss_streak = db.Column(db.Integer, default=0)
+    last_trade_date = db.Column(db.DateTime)
+    stale = db.Column(db.Boolean, default=False, nullable=False)
+    rebuilt_at = db.Column(db.DateTime)
+
+
+class TradeDailyPnl(db.Model):
+    __tablename__ = 'trade_daily_pnl'
+    id = db.Column(db.Integer, primary_key=True)
+    scope = db.Column(db.String(32), nullable=False, default='all')
+    day = db.Column(db.Date, nullable=False)
+    pnl = db.Column(db.Float, nullable=False, default=0.0)
+    trade_count = db.Column(db.Integer, nullable=False, default=0)
+    wins = db.Column(db.Integer, nullable=False, default=0)
+    losses = db.Column(db.Integer, nullable=False, default=0)
+    gross_profit = db.Column(db.Float, nullable=False, default=0.0)
+    gross_loss = db.Column(db.Float, nullable=False, default=0.0)
+    __table_args__ = (db.UniqueConstraint('scope', 'day'),)
+
+
+journal_metrics.register_trade_stats(Trade, TradeStats, TradeDailyPnl)
+
+
+@pytest.fixture
+def app():
+    app = Flask(__name__)
+    app.config['SQLALCHEMY_DATABASE_URI'] = 'sqlite://'
+    db.init_app(app)
+    with app.app_context():
+        db.create_all()
+        journal_metrics.rebuild_trade_stats(db, Trade, TradeStats, TradeDailyPnl=TradeDailyPnl)
+        yield app
+        db.session.remove()
+        db.drop_all()
+
+
+def _stats():
+    return TradeStats.query.filter_by(scope='all').one()
+
+
+def test_insert_with_plain_date(app):
+    """The broker import stores Trade(date=<date>); the hook must accept it"""
+    db.session.add(Trade(symbol='INFY', date=datetime(2025, 1, 2, 10, 0), result='win', pnl=100))
+    db.session.commit()
+    db.session.add(Trade(symbol='TCS', date=date(2025, 1, 3), result='loss', pnl=-40))
+    db.session.commit()
+
+    stats = _stats()
+    assert stats.trade_count == 2
+    assert stats.total_pnl == pytest.approx(60)
+    assert not stats.stale
+    assert stats.last_trade_date == datetime(2025, 1, 3)
+
+    days = journal_metrics.daily_pnl(db, TradeDailyPnl, date(2025, 1, 1), date(2025, 1, 31))
+    assert days[date(2025, 1, 3)].pnl == pytest.approx(-40)
+    assert days[date(2025, 1, 3)].trade_count == 1
+
+
+def _trade(symbol, day, pnl, result=None, **kw):
+    result = result or ('win' if pnl > 0 else 'loss' if pnl < 0 else 'breakeven')
+    return Trade(symbol=symbol, date=datetime(2025, 1, day), result=result, pnl=pnl, **kw)
+
+
+def test_edits_and_deletes_keep_totals_exact(app):
+    a, b, c = _trade('A', 1, 100), _trade('B', 2, -30), _trade('C', 3, 50)
+    db.session.add_all([a, b, c])
+    db.session.commit()
+
+    a.risk, a.reward = 10, 20           # does not affect order-dependent state
+    db.session.commit()
+    stats = _stats()
+    assert not stats.stale
+    assert stats.rr_count == 1
+
+    c.pnl = -20
+    c.result = 'loss'
+    db.session.delete(b)
+    db.session.commit()
+
+    stats = _stats()
+    assert stats.stale
+    assert stats.trade_count == 2
+    assert stats.win_count == 1 and stats.loss_count == 1
+    assert stats.total_pnl == pytest.approx(80)
+    assert stats.win_pnl == pytest.approx(100) and stats.loss_pnl == pytest.approx(-20)
+
+
+def test_stale_row_is_served_and_rebuild_scheduled(app):
+    db.session.add_all([_trade('A', 2, 100), _trade('B', 1, -40)])  # second is back-dated
+    db.session.commit()
+    db.session.add(_trade('C', 1, 10))
+    db.session.commit()
+    assert _stats().stale
+
+    scheduled = []
+    stats = journal_metrics.get_trade_stats(db, Trade, TradeStats, TradeDailyPnl,
+                                            schedule_rebuild=scheduled.append)
+    assert scheduled == ['all']
+    assert stats.stale and stats.trade_count == 3
+
+    stats = journal_metrics.rebuild_trade_stats(db, Trade, TradeStats, only_if_stale=True)
+    assert not stats.stale
+    assert stats.max_drawdown == pytest.approx(40)
+    rebuilt_at = stats.rebuilt_at
+    # A second (racing) rebuild finds the row current and leaves it alone
+    assert journal_metrics.rebuild_trade_stats(db, Trade, TradeStats, only_if_stale=True).rebuilt_at == rebuilt_at
+
+
+def test_first_build_creates_row(app):
+    TradeStats.query.delete()
+    db.session.commit()
+    db.session.add(_trade('A', 1, 5))
+    db.session.commit()     # no row yet: the hook skips
+
+    stats = journal_metrics.get_trade_stats(db, Trade, TradeStats, TradeDailyPnl)
+    assert stats is not None and not stats.stale
+    assert stats.trade_count == 1
+    assert TradeStats.query.count() == 1
+
+
+def test_best_and_worst_come_from_wins_and_losses(app):
+    db.session.add_all([
+        _trade('BIGBE', 1, 500, result='breakeven'),
+        _trade('WIN', 2, 80),
+        _trade('LOSS', 3, -60),
+        _trade('SMALL', 4, -10),
+    ])
+    db.session.commit()
+    stats = _stats()
+    assert (stats.best_symbol, stats.best_pnl) == ('WIN', 80)
+    assert (stats.worst_symbol, stats.worst_pnl) == ('LOSS', -60)
+
+    totals = journal_metrics.trade_totals(db, Trade)
+    assert totals['best_trade_symbol'] == stats.best_symbol
+    assert totals['worst_trade_symbol'] == stats.worst_symbol
+    assert totals['highest_pnl'] == stats.best_pnl
+
+
+def test_day_delta_accepts_date_and_datetime():
+    deltas = {}
+    journal_metrics._day_delta(deltas, {'date': date(2025, 1, 3), 'pnl': 10}, 1)
+    journal_metrics._day_delta(deltas, {'date': datetime(2025, 1, 3, 15, 0), 'pnl': -4}, 1)
+    assert deltas[date(2025, 1, 3)]['pnl'] == pytest.approx(6)
+    assert deltas[date(2025, 1, 3)]['trade_count'] == 2
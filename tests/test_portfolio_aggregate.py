@@ -0,0 +1,41 @@
+"""
+portfolio_aggregate: error payloads, normalisation and merging
+"""
+
+import os
+import sys
+
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import portfolio_aggregate as pa  # noqa: E402
+
+
+def test_failure_payloads_are_not_data():
+    dhan = {'status': 'failure', 'data': '',
+            'remarks': {'error_code': 'DH-901', 'error_type': 'Invalid_Authentication',
+                        'error_message': 'Client ID or user generated access token is invalid or expired.'}}
+    angel = {'status': False, 'message': 'Invalid Token', 'errorcode': 'AG8001', 'data': None}
+    assert pa.failure(dhan) == ('DH-901: Client ID or user generated access token is invalid or expired.', True)
+    assert pa.failure(angel) == ('AG8001: Invalid Token', True)
+    assert pa.failure({'status': 'failure', 'remarks': 'Market closed', 'data': ''}) == ('Market closed', False)
+
+
+def test_success_payloads_pass():
+    assert pa.failure({'status': 'success', 'data': []}) is None
+    assert pa.failure({'status': True, 'message': 'SUCCESS', 'data': None}) is None
+    assert pa.failure([{'tradingsymbol': 'INFY'}]) is None
+
+
+def test_merge_across_brokers():
+    rows = pa.normalize_holdings('kite', [{'tradingsymbol': 'INFY', 'quantity': 10, 'average_price': 100,
+                                           'last_price': 110, 'pnl': 100}])
+    rows += pa.normalize_holdings('angel', {'status': True, 'data': [
+        {'tradingsymbol': 'INFY-EQ', 'quantity': 30, 'averageprice': 120, 'ltp': 110, 'profitandloss': -300}]})
+    (merged,) = pa.merge_by_symbol(rows)
+    assert merged['symbol'] == 'INFY'
+    assert merged['quantity'] == 40
+    assert merged['average_price'] == pytest.approx(115)
+    assert merged['pnl'] == pytest.approx(-200)
+    assert merged['brokers'] == ['kite', 'angel']
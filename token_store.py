@@ -6,10 +6,60 @@ Provides persistent token storage with expiration handling
 import os
 import json
 import time
+import threading
 from datetime import datetime, timedelta
 
 TOKEN_FILE = "dhan_token.json"
 
+# In-memory view of TOKEN_FILE, refreshed when the file's mtime/size changes.
+# save_token replaces the file atomically, so every gunicorn worker sees a
+# rotation on its next call without re-parsing the file per request.
+_cache_lock = threading.Lock()
+_cache = {"stat": None, "data": None, "headers": {}}
+_last_notice = None
+
+def _notice(message):
+    """Print state changes once instead of on every call"""
+    global _last_notice
+    if message != _last_notice:
+        _last_notice = message
+        print(message)
+
+def _file_stat():
+    try:
+        st = os.stat(TOKEN_FILE)
+        return (st.st_mtime_ns, st.st_size, st.st_ino)
+    except OSError:
+        return None
+
+def _load_token_data():
+    """Parsed TOKEN_FILE contents, re-read only when the file changed"""
+    stat = _file_stat()
+    if stat == _cache["stat"]:
+        return _cache["data"]
+
+    with _cache_lock:
+        if stat == _cache["stat"]:
+            return _cache["data"]
+        data = None
+        if stat is not None:
+            try:
+                with open(TOKEN_FILE, 'r') as f:
+                    data = json.load(f)
+            except Exception as e:
+                _notice(f"Error reading token file: {e}")
+        _cache["data"] = data
+        _cache["headers"] = {}
+        _cache["stat"] = stat
+        return data
+
+def invalidate_token_cache():
+    """Force the next get_token() to re-read TOKEN_FILE"""
+    with _cache_lock:
+        _cache["stat"] = None
+        _cache["data"] = None
+        _cache["headers"] = {}
+
 def save_token(access_token: str, expires_in_seconds: int = 86400):
     """Save access token with expiration time"""
     expires_at = time.time() + expires_in_seconds
@@ -20,40 +70,56 @@ def save_token(access_token: str, expires_in_seconds: int = 86400):
     }
     
     try:
-        with open(TOKEN_FILE, 'w') as f:
+        # Write then rename so readers in other workers never see a partial file
+        tmp_path = f"{TOKEN_FILE}.{os.getpid()}.tmp"
+        with open(tmp_path, 'w') as f:
             json.dump(token_data, f, indent=2)
+        os.replace(tmp_path, TOKEN_FILE)
+        invalidate_token_cache()
         print(f"Token saved successfully, expires at: {datetime.fromtimestamp(expires_at)}")
     except Exception as e:
         print(f"Error saving token: {e}")
 
 def get_token():
     """Get valid access token, returns None if expired or missing"""
-    # First try to get from JSON file
-    if os.path.exists(TOKEN_FILE):
-        try:
-            with open(TOKEN_FILE, 'r') as f:
-                token_data = json.load(f)
-            
-            access_token = token_data.get("access_token")
-            expires_at = token_data.get("expires_at", 0)
-            
-            # Check if token is still valid
-            if access_token and time.time() < expires_at:
-                return access_token
-            else:
-                print("Token from file is expired")
-        except Exception as e:
-            print(f"Error reading token file: {e}")
+    # First try the (cached) JSON file
+    token_data = _load_token_data()
+    if token_data:
+        access_token = token_data.get("access_token")
+        expires_at = token_data.get("expires_at", 0)
+        
+        # Check if token is still valid
+        if access_token and time.time() < expires_at:
+            return access_token
+        else:
+            _notice("Token from file is expired")
     
     # Fallback to environment variable
     env_token = os.getenv("DHAN_ACCESS_TOKEN")
     if env_token:
-        print("Using token from environment variable")
+        _notice("Using token from environment variable")
         return env_token
     
-    print("No valid token found")
+    _notice("No valid token found")
     return None
 
+def get_dhan_headers(client_id):
+    """Dhan REST headers for the current token, built once per token/client id"""
+    access_token = get_token()
+    if not access_token:
+        return None
+    key = (access_token, client_id)
+    headers = _cache["headers"].get(key)
+    if headers is None:
+        headers = {
+            "Accept": "application/json",
+            "Content-Type": "application/json",
+            "access-token": access_token,  # raw JWT, no 'Bearer'
+            "client-id": client_id,
+        }
+        _cache["headers"] = {key: headers}
+    return headers
+
 def is_token_valid():
     """Check if current token is valid"""
     return get_token() is not None
@@ -62,8 +128,9 @@ def get_token_info():
     """Get token information for debugging"""
     if os.path.exists(TOKEN_FILE):
         try:
-            with open(TOKEN_FILE, 'r') as f:
-                token_data = json.load(f)
+            token_data = _load_token_data()
+            if token_data is None:
+                raise ValueError("token file unreadable")
             
             expires_at = token_data.get("expires_at", 0)
             saved_at = token_data.get("saved_at", "unknown")
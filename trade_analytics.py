@@ -0,0 +1,206 @@
+"""
+Vectorised analytics over journal trades
+Pulls (date, pnl, risk, reward, quantity) for a filtered range as column arrays
+in one query and computes equity, running peak, drawdown, R-multiples, ratios
+and histograms with NumPy instead of per-ORM-object Python loops.
+"""
+
+import numpy as np
+
+# R-multiple histogram edges used by the reports page
+R_MULTIPLE_BINS = (-3, -2, -1, 0, 1, 2, 3, 4, 5)
+
+# Default cap on equity-curve points sent to charts
+EQUITY_CURVE_MAX_POINTS = 1000
+EQUITY_CURVE_MIN_POINTS = 16
+
+
+class TradeSeries:
+    """Column arrays for a set of trades in (date, id) order"""
+
+    def __init__(self, dates, pnl, risk, reward, quantity):
+        self.dates = dates
+        self.pnl = pnl
+        self.risk = risk
+        self.reward = reward
+        self.quantity = quantity
+
+    def __len__(self):
+        return len(self.pnl)
+
+    @property
+    def day_strings(self):
+        """'YYYY-MM-DD' for every trade"""
+        return np.datetime_as_string(self.dates, unit='D')
+
+
+def load_series(db, Trade, start=None, end=None, strategy_id=None, symbol=None, trade_type=None):
+    """One projected query for the trades matching the report filters"""
+    query = db.session.query(Trade.date, Trade.pnl, Trade.risk, Trade.reward, Trade.quantity)
+    if start is not None:
+        query = query.filter(Trade.date >= start)
+    if end is not None:
+        query = query.filter(Trade.date <= end)
+    if strategy_id:
+        query = query.filter(Trade.strategy_id == strategy_id)
+    if symbol:
+        query = query.filter(Trade.symbol.ilike(f"%{symbol}%"))
+    if trade_type:
+        query = query.filter(Trade.trade_type == trade_type)
+    rows = query.order_by(Trade.date, Trade.id).all()
+
+    n = len(rows)
+    dates = np.array([r[0] for r in rows], dtype='datetime64[us]') if n else np.array([], dtype='datetime64[us]')
+    cols = np.array([r[1:] for r in rows], dtype=float).reshape(n, 4) if n else np.zeros((0, 4))
+    cols = np.nan_to_num(cols)  # NULL risk/reward/quantity count as 0
+    return TradeSeries(dates, cols[:, 0], cols[:, 1], cols[:, 2], cols[:, 3])
+
+
+# ----------------- equity ----------------- #
+def equity_curve(pnl):
+    return np.cumsum(pnl)
+
+
+def running_peak(equity):
+    """Highest equity so far; the peak starts at 0 (flat account before the first trade)"""
+    return np.maximum.accumulate(np.maximum(equity, 0)) if len(equity) else equity
+
+
+def drawdown(equity):
+    return running_peak(equity) - equity
+
+
+def max_drawdown(pnl):
+    return float(drawdown(equity_curve(pnl)).max()) if len(pnl) else 0.0
+
+
+def downsample_indices(equity, max_points=EQUITY_CURVE_MAX_POINTS):
+    """
+    Indices of at most max_points equity points to plot, in order.
+
+    Min/max per bucket: the curve is cut into equal-width index buckets and the
+    lowest and highest point of each is kept, so every local trough and high
+    survives. The first and last points, the all-time high and the deepest
+    drawdown trough (with the peak it fell from) are always kept exactly.
+    """
+    n = len(equity)
+    max_points = max(int(max_points), EQUITY_CURVE_MIN_POINTS)
+    if n <= max_points:
+        return np.arange(n)
+
+    dd = drawdown(equity)
+    trough = int(dd.argmax())
+    peak_before = int(equity[:trough + 1].argmax())
+    forced = np.unique([0, n - 1, int(equity.argmax()), trough, peak_before])
+
+    buckets = (max_points - len(forced)) // 2
+    bucket = (np.arange(n) * buckets) // n
+    starts = np.r_[0, np.flatnonzero(np.diff(bucket)) + 1]
+
+    # lexsort orders by bucket, then value: the first of each bucket run is its
+    # minimum and the last is its maximum
+    by_low = np.lexsort((equity, bucket))
+    ends = np.r_[starts[1:], n] - 1
+    lows = by_low[starts]
+    highs = by_low[ends]
+
+    return np.unique(np.concatenate([forced, lows, highs]))
+
+
+# ----------------- ratios ----------------- #
+def sharpe_ratio(pnl):
+    """Mean over (population) standard deviation of per-trade PnL"""
+    if len(pnl) == 0:
+        return 0.0
+    std = pnl.std()
+    return float(pnl.mean() / std) if std > 0 else 0.0
+
+
+def sortino_ratio(pnl):
+    """Mean over downside deviation (root mean square of losses)"""
+    if len(pnl) == 0:
+        return 0.0
+    downside = np.sqrt(np.mean(np.minimum(pnl, 0) ** 2))
+    return float(pnl.mean() / downside) if downside > 0 else 0.0
+
+
+def _windows(values, window):
+    return np.lib.stride_tricks.sliding_window_view(values, window)
+
+
+def rolling_sharpe(pnl, window=20):
+    """Sharpe over each trailing `window` trades; NaN until the window is full"""
+    out = np.full(len(pnl), np.nan)
+    if window < 2 or len(pnl) < window:
+        return out
+    w = _windows(pnl, window)
+    mean, std = w.mean(axis=1), w.std(axis=1)
+    out[window - 1:] = np.divide(mean, std, out=np.zeros_like(mean), where=std > 0)
+    return out
+
+
+def rolling_sortino(pnl, window=20):
+    """Sortino over each trailing `window` trades; NaN until the window is full"""
+    out = np.full(len(pnl), np.nan)
+    if window < 2 or len(pnl) < window:
+        return out
+    w = _windows(pnl, window)
+    mean = w.mean(axis=1)
+    downside = np.sqrt(np.mean(np.minimum(w, 0) ** 2, axis=1))
+    out[window - 1:] = np.divide(mean, downside, out=np.zeros_like(mean), where=downside > 0)
+    return out
+
+
+# ----------------- R-multiples ----------------- #
+def r_multiples(series):
+    """pnl / risk, or pnl / 100 as an approximation when no risk was recorded"""
+    with np.errstate(divide='ignore', invalid='ignore'):
+        return np.where(series.risk > 0, series.pnl / series.risk, series.pnl / 100)
+
+
+def r_multiple_histogram(values, bins=R_MULTIPLE_BINS):
+    """
+    Counts per [edge_i, edge_i+1) bucket. Values at or above the last edge fall
+    in the last bucket; values below the first edge are not counted.
+    """
+    edges = np.asarray(bins, dtype=float)
+    values = values[values >= edges[0]]
+    counts, _ = np.histogram(np.minimum(values, edges[-1]), bins=edges)
+    return counts.astype(int).tolist()
+
+
+# ----------------- summary ----------------- #
+def summarize(series):
+    """Report summary metrics for a TradeSeries (same definitions as the reports page)"""
+    pnl = series.pnl
+    total = len(pnl)
+    if total == 0:
+        return {
+            "total_pnl": 0, "win_rate": 0, "total_trades": 0, "avg_rr": 0,
+            "expectancy": 0, "profit_factor": 0, "max_drawdown": 0,
+            "sharpe_ratio": 0, "sortino_ratio": 0,
+        }
+
+    wins, losses = pnl[pnl > 0], pnl[pnl < 0]
+    win_rate = len(wins) / total * 100
+    avg_win = float(wins.mean()) if len(wins) else 0.0
+    avg_loss = float(abs(losses.mean())) if len(losses) else 0.0
+    gross_profit, gross_loss = float(wins.sum()), float(abs(losses.sum()))
+
+    has_rr = (series.risk > 0) & (series.reward != 0)
+    avg_rr = float((series.reward[has_rr] / series.risk[has_rr]).mean()) if has_rr.any() else 0.0
+
+    return {
+        "total_pnl": float(pnl.sum()),
+        "win_rate": win_rate,
+        "total_trades": total,
+        "avg_win": avg_win,
+        "avg_loss": avg_loss,
+        "avg_rr": avg_rr,
+        # Expectancy = (Win% × AvgWin) – (Loss% × AvgLoss)
+        "expectancy": (win_rate / 100 * avg_win) - ((100 - win_rate) / 100 * avg_loss),
+        "profit_factor": gross_profit / gross_loss if gross_loss > 0 else 0,
+        "max_drawdown": max_drawdown(pnl),
+        "sharpe_ratio": sharpe_ratio(pnl),
+        "sortino_ratio": sortino_ratio(pnl),
+    }
@@ -0,0 +1,227 @@
+"""
+Shared HTTP client for broker and market-data upstreams (Dhan, Kite, Angel)
+One keep-alive connection pool per host, per-endpoint timeouts and bounded
+retries with jittered exponential backoff. Use upstream.get/post instead of
+bare requests.get/post, and pooled(client) to put SDK clients on the same pools.
+
+Non-GET requests are retried (when asked to) only when the upstream cannot
+have acted on them or says so: connect errors and 429/502/503/504. A read
+timeout is never retried for them. A `deadline` bounds every attempt and
+backoff of one call, or of several calls that share it.
+"""
+
+import os
+import time
+import random
+import threading
+from http.cookiejar import DefaultCookiePolicy
+from urllib.parse import urlsplit
+
+import requests
+from requests.adapters import HTTPAdapter
+
+UPSTREAM_POOL_SIZE = int(os.getenv("UPSTREAM_POOL_SIZE", "20"))
+UPSTREAM_MAX_RETRIES = int(os.getenv("UPSTREAM_MAX_RETRIES", "2"))
+UPSTREAM_BACKOFF = float(os.getenv("UPSTREAM_BACKOFF", "0.25"))
+# Bulkhead: at most this many in-flight requests per host per worker process;
+# callers wait up to UPSTREAM_QUEUE_TIMEOUT for a slot, then fail fast
+UPSTREAM_MAX_INFLIGHT = int(os.getenv("UPSTREAM_MAX_INFLIGHT", "6"))
+UPSTREAM_QUEUE_TIMEOUT = float(os.getenv("UPSTREAM_QUEUE_TIMEOUT", "2"))
+
+# (connect, read) timeouts in seconds by logical endpoint
+UPSTREAM_TIMEOUTS = {
+    "dhan.ltp": (3.05, 10),
+    "dhan.charts": (3.05, 15),
+    "dhan.consent": (3.05, 15),
+    "google.userinfo": (3.05, 10),
+    # Requests broker SDKs send on pooled() sessions without a timeout of their own
+    "sdk": (3.05, float(os.getenv("UPSTREAM_SDK_READ_TIMEOUT", "10"))),
+    "default": (3.05, 20),
+}
+
+RETRY_STATUSES = (429, 500, 502, 503, 504)
+# Non-idempotent methods: only statuses where the upstream did not process the request
+POST_RETRY_STATUSES = (429, 502, 503, 504)
+# A Retry-After longer than this is returned to the caller instead of waited out
+UPSTREAM_RETRY_AFTER_MAX = float(os.getenv("UPSTREAM_RETRY_AFTER_MAX", "5"))
+
+# Hosts used by the broker SDKs, so their clients share our pools
+SDK_HOSTS = {
+    "kite": "https://api.kite.trade",
+    "dhan": "https://api.dhan.co",
+    "angel": "https://apiconnect.angelbroking.com",
+}
+
+
+class UpstreamBusy(requests.ConnectionError):
+    """Raised when a host already has UPSTREAM_MAX_INFLIGHT requests in flight"""
+
+
+class _DefaultTimeoutAdapter(HTTPAdapter):
+    """HTTPAdapter that applies a (connect, read) timeout when the caller passes none"""
+
+    def __init__(self, default_timeout, **kwargs):
+        self.default_timeout = default_timeout
+        super().__init__(**kwargs)
+
+    def send(self, request, timeout=None, **kwargs):
+        return super().send(request, timeout=self.default_timeout if timeout is None else timeout, **kwargs)
+
+
+class UpstreamClient:
+    """Per-host pooled sessions with retry/backoff"""
+
+    def __init__(self, pool_size=UPSTREAM_POOL_SIZE, max_retries=UPSTREAM_MAX_RETRIES,
+                 backoff=UPSTREAM_BACKOFF, timeouts=None,
+                 max_inflight=UPSTREAM_MAX_INFLIGHT, queue_timeout=UPSTREAM_QUEUE_TIMEOUT):
+        self.pool_size = pool_size
+        self.max_retries = max_retries
+        self.backoff = backoff
+        self.timeouts = dict(UPSTREAM_TIMEOUTS, **(timeouts or {}))
+        self.max_inflight = max_inflight
+        self.queue_timeout = queue_timeout
+        self._sessions = {}
+        self._slots = {}
+        self._pid = None
+        self._lock = threading.Lock()
+
+    def _new_session(self):
+        session = requests.Session()
+        # SDK clients share these sessions and some never pass a timeout; without
+        # one a hung broker would hold a connection (and a fan-out thread) forever
+        adapter = _DefaultTimeoutAdapter(self.timeouts["sdk"], pool_connections=4,
+                                         pool_maxsize=self.pool_size, max_retries=0)
+        session.mount("https://", adapter)
+        session.mount("http://", adapter)
+        # Sessions are shared between users; never carry cookies across requests
+        session.cookies.set_policy(DefaultCookiePolicy(allowed_domains=[]))
+        return session
+
+    @staticmethod
+    def _host(url):
+        parts = urlsplit(url)
+        return f"{parts.scheme}://{parts.netloc}"
+
+    def _reset_after_fork(self):
+        pid = os.getpid()
+        if self._pid != pid:
+            self._sessions = {}
+            self._slots = {}
+            self._pid = pid
+
+    def session_for(self, url):
+        """Pooled keep-alive session for the host of url (recreated after fork)"""
+        host = self._host(url)
+        with self._lock:
+            self._reset_after_fork()
+            session = self._sessions.get(host)
+            if session is None:
+                session = self._new_session()
+                self._sessions[host] = session
+        return session
+
+    def _slot_for(self, url):
+        host = self._host(url)
+        with self._lock:
+            self._reset_after_fork()
+            slot = self._slots.get(host)
+            if slot is None:
+                slot = threading.BoundedSemaphore(self.max_inflight)
+                self._slots[host] = slot
+        return host, slot
+
+    def _backoff_delay(self, attempt, response=None):
+        """
+        Seconds to wait before the next attempt, or None to stop retrying.
+        Retry-After (seconds) on a 429/503 is honoured up to UPSTREAM_RETRY_AFTER_MAX.
+        """
+        if response is not None and response.status_code in (429, 503):
+            retry_after = response.headers.get("Retry-After")
+            if retry_after is not None:
+                try:
+                    delay = float(retry_after)
+                except ValueError:
+                    return None  # HTTP-date form: too far ahead to wait out in a request
+                return delay if delay <= UPSTREAM_RETRY_AFTER_MAX else None
+        # Full jitter: uniform(0, backoff * 2^attempt)
+        return random.uniform(0, self.backoff * (2 ** attempt))
+
+    @staticmethod
+    def _clip_timeout(timeout, deadline):
+        """(connect, read) timeout that ends by deadline; raises once it has passed"""
+        if deadline is None:
+            return timeout
+        remaining = deadline - time.monotonic()
+        if remaining <= 0:
+            raise requests.Timeout("Upstream deadline exceeded")
+        if isinstance(timeout, tuple):
+            return tuple(min(t, remaining) for t in timeout)
+        return min(timeout, remaining)
+
+    def request(self, method, url, endpoint="default", retries=None, deadline=None, **kwargs):
+        """
+        Send a request through the pooled session for url's host.
+        `retries` defaults to UPSTREAM_MAX_RETRIES for GET and 0 otherwise;
+        pass retries explicitly for read-only POST endpoints. `deadline` is a
+        time.monotonic() value no attempt or backoff may run past.
+        """
+        timeout = kwargs.pop("timeout", self.timeouts.get(endpoint, self.timeouts["default"]))
+        idempotent = method.upper() == "GET"
+        if retries is None:
+            retries = self.max_retries if idempotent else 0
+        retry_errors = (requests.ConnectionError, requests.Timeout) if idempotent else (requests.ConnectionError,)
+        retry_statuses = RETRY_STATUSES if idempotent else POST_RETRY_STATUSES
+
+        session = self.session_for(url)
+        host, slot = self._slot_for(url)
+        attempt = 0
+        while True:
+            attempt_timeout = self._clip_timeout(timeout, deadline)
+            # A stalled upstream can only tie up max_inflight request threads
+            if not slot.acquire(timeout=self.queue_timeout):
+                raise UpstreamBusy(f"Too many in-flight requests to {host}")
+            response = error = None
+            try:
+                response = session.request(method, url, timeout=attempt_timeout, **kwargs)
+            except retry_errors as e:
+                if attempt >= retries:
+                    raise
+                error = e
+            else:
+                if response.status_code not in retry_statuses or attempt >= retries:
+                    return response
+            finally:
+                slot.release()
+
+            delay = self._backoff_delay(attempt, response)
+            if delay is None or (deadline is not None and time.monotonic() + delay >= deadline):
+                if error is not None:
+                    raise error
+                return response
+            time.sleep(delay)
+            attempt += 1
+
+    def get(self, url, endpoint="default", **kwargs):
+        return self.request("GET", url, endpoint=endpoint, **kwargs)
+
+    def post(self, url, endpoint="default", **kwargs):
+        return self.request("POST", url, endpoint=endpoint, **kwargs)
+
+
+upstream = UpstreamClient()
+
+
+def pooled(client, broker=None):
+    """
+    Point a broker SDK client (KiteConnect, SmartConnect, dhanhq) at the shared
+    pool for its host. SDKs keep their session in `reqsession` or `session`.
+    """
+    if client is None:
+        return client
+    root = getattr(client, "root", None) or SDK_HOSTS.get(broker or "", None)
+    if not root:
+        return client
+    for attr in ("reqsession", "session"):
+        if isinstance(getattr(client, attr, None), requests.Session):
+            setattr(client, attr, upstream.session_for(root))
+    return client